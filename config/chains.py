@@ -20,6 +20,9 @@ class Chains:
 
     - name - название сети, в формате snake_case, при инициализации в класс Chains должно совпадать с именем переменной
     - param rpc: адрес провайдера в формате https://1rpc.io/ethereum, можно взять на https://chainlist.org/
+      Можно указать список адресов, тогда запросы идут через самый быстрый исправный rpc с переключением при ошибках.
+      Первый адрес списка используется в метамаске. Сравнить rpc можно командой
+      python -m snippets.benchmarks.rpc_ranking
     - chain_id: id сети, например 1 для Ethereum, можно искать тут https://chainid.network/chains.json
 
     опциональные:
@@ -38,7 +41,7 @@ class Chains:
 
     ETHEREUM = Chain(
         name='ethereum',
-        rpc='https://1rpc.io/eth',
+        rpc=['https://1rpc.io/eth', 'https://ethereum-rpc.publicnode.com', 'https://eth.llamarpc.com'],
         chain_id=1,
         metamask_name='Ethereum Mainnet',
         okx_name='ERC20',
@@ -47,7 +50,7 @@ class Chains:
 
     LINEA = Chain(
         name='linea',
-        rpc='https://1rpc.io/linea',
+        rpc=['https://1rpc.io/linea', 'https://rpc.linea.build'],
         chain_id=59144,
         metamask_name='Linea',
         okx_name='Linea',
@@ -56,7 +59,7 @@ class Chains:
 
     ARBITRUM_ONE = Chain(
         name='arbitrum_one',
-        rpc='https://1rpc.io/arb',
+        rpc=['https://1rpc.io/arb', 'https://arb1.arbitrum.io/rpc', 'https://arbitrum-one-rpc.publicnode.com'],
         chain_id=42161,
         metamask_name='Arbitrum One',
         okx_name='Arbitrum One'
@@ -64,7 +67,7 @@ class Chains:
 
     BSC = Chain(
         name='bsc',
-        rpc='https://1rpc.io/bnb',
+        rpc=['https://1rpc.io/bnb', 'https://bsc-dataseed.bnbchain.org', 'https://bsc-rpc.publicnode.com'],
         chain_id=56,
         metamask_name='Binance Smart Chain',
         native_token='BNB',
@@ -74,7 +77,7 @@ class Chains:
 
     OP = Chain(
         name='op',
-        rpc='https://1rpc.io/op',
+        rpc=['https://1rpc.io/op', 'https://mainnet.optimism.io', 'https://optimism-rpc.publicnode.com'],
         chain_id=10,
         metamask_name='Optimism Mainnet',
         okx_name='Optimism'
@@ -82,7 +85,7 @@ class Chains:
 
     POLYGON = Chain(
         name='polygon',
-        rpc='https://rpc.ankr.com/polygon/',
+        rpc=['https://rpc.ankr.com/polygon/', 'https://polygon-rpc.com', 'https://polygon-bor-rpc.publicnode.com'],
         chain_id=137,
         native_token='POL',
         metamask_name='Polygon',
@@ -91,7 +94,8 @@ class Chains:
 
     AVALANCHE = Chain(
         name='avalanche',
-        rpc='https://1rpc.io/avax/c',
+        rpc=['https://1rpc.io/avax/c', 'https://api.avax.network/ext/bc/C/rpc',
+             'https://avalanche-c-chain-rpc.publicnode.com'],
         chain_id=43114,
         native_token='AVAX',
         metamask_name='Avalanche',
@@ -100,7 +104,7 @@ class Chains:
 
     ZKSYNC = Chain(
         name='zksync',
-        rpc='https://rpc.ankr.com/zksync_era/',
+        rpc=['https://rpc.ankr.com/zksync_era/', 'https://mainnet.era.zksync.io'],
         chain_id=324,
         metamask_name='zkSync',
         okx_name='zkSync Era'
@@ -108,7 +112,7 @@ class Chains:
 
     CORE = Chain(
         name='core',
-        rpc='https://rpc.ankr.com/core/',
+        rpc=['https://rpc.ankr.com/core/', 'https://rpc.coredao.org'],
         chain_id=1116,
         native_token='CORE',
         metamask_name='Core',
@@ -123,7 +127,7 @@ class Chains:
     )
     FTM = Chain(
         name='ftm',
-        rpc='https://rpc.ankr.com/fantom/',
+        rpc=['https://rpc.ankr.com/fantom/', 'https://rpcapi.fantom.network'],
         chain_id=250,
     )
 
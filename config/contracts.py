@@ -36,6 +36,18 @@ class Contracts:
         abi_name='relay',
         chain=Chains.ARBITRUM_ONE)
 
+    # Multicall3 развернут по одному адресу во всех популярных сетях, поэтому сеть не указана
+    MULTICALL3 = ContractRaw(
+        address='0xcA11bde05977b3631167028862bE2a173976CA11',
+        abi_name='multicall3',
+        chain=None)
+
+    # Disperse (disperse.app) развернут по одному адресу во многих сетях, рассылка многим адресам одной транзакцией
+    DISPERSE = ContractRaw(
+        address='0xD152f549545093347A162Dce210e7293f1452150',
+        abi_name='disperse',
+        chain=None)
+
 
     @classmethod
     def get_contract_by_name(cls, name: str, chain: Chain):
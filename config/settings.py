@@ -27,14 +27,132 @@ class Config:
 
     # использовать расписание и фильтрацию аккаунтов
     is_schedule = False  # Если True, то будет использоваться расписание и фильтрация аккаунтов
+    # запускать аккаунты по мере наступления их времени из расписания, а не циклами (нужен is_schedule = True)
+    is_heap_schedule = False
 
     # пауза между запуском профилей в секундах от и до
     pause_between_profile = [1, 2]
 
+    # сколько аккаунтов обрабатывать параллельно, 1 - по одному, как раньше
+    # пауза pause_between_profile делается внутри каждого потока
+    max_workers = 1
+
+    # на сколько процессов разделить аккаунты, 1 - без процессов
+    # у каждого процесса свой драйвер playwright, упавшие и зависшие процессы перезапускаются
+    shards = 1
+    # как часто процесс шарда сообщает координатору, что он жив, в секундах
+    shard_heartbeat_interval = 10
+    # через сколько секунд без сигнала от процесса он считается зависшим
+    shard_timeout = 120
+    # сколько раз повторить с начала аккаунт, который был в работе, когда процесс упал или завис
+    # 0 - не повторять: аккаунт мог успеть сделать вывод или отправить транзакцию, повтор сделает их второй раз
+    shard_account_retries = 0
+    # сколько раз можно перезапустить один процесс за цикл
+    shard_restarts = 3
+
+    # ограничения времени этапов аккаунта в секундах, None - без ограничения
+    # при превышении браузер профиля останавливается, аккаунт завершается по таймауту
+    timeouts = {
+        'browser_start': 180,  # запуск браузера ADS и подключение playwright
+        'activity': 1800,  # функция activity для одного аккаунта
+        'withdraw_wait': 900,  # ожидание вывода с биржи
+    }
+
+    # метрики времени работы (запуск бота, rpc, биржи, ADS, excel) в текстовом формате prometheus
+    # файл для node_exporter textfile collector, например 'config/data/metrics.prom', None - не писать
+    metrics_file = None
+    # как часто перезаписывать файл метрик в секундах
+    metrics_interval = 60
+    # порт http сервера метрик на 127.0.0.1 (http://127.0.0.1:9101/metrics), None - не запускать
+    # у процессов-шардов порт metrics_port + номер шарда + 1
+    metrics_port = None
+
     # укажите сколько раз прокрутить все аккаунты
     cycle = 10000
     # укажите какую паузу делать перед новым циклом запуска профилей в секундах от и до
     pause_between_cycle = [100, 200]
+    # продолжать незавершенный цикл после падения скрипта, пропуская уже обработанные аккаунты
+    is_resume = True
+
+    # режим планирования: прогнать фильтр и activity без транзакций, выводов и браузера,
+    # сохранить план вызовов и оценку времени цикла в config/data/plan.json и завершить работу
+    is_plan = False
+    # сколько аккаунтов планировать параллельно (только чтения из блокчейна)
+    plan_workers = 32
+
+    # путь к файлу общей очереди аккаунтов SQLite на локальном диске, если указан, процессы этой машины
+    # с одинаковыми файлами аккаунтов берут аккаунты из очереди, каждый аккаунт обрабатывается одним процессом за цикл
+    # файл на сетевом диске не поддерживается (SQLite WAL и блокировки не работают по сети)
+    work_queue_path = None  # например 'config/data/work_queue.sqlite'
+    # время аренды аккаунта в секундах, если процесс не продлил аренду, аккаунт забирает другой процесс
+    work_queue_lease = 300
+
+    # сколько подключений к rpc (пар rpc и прокси) держать открытыми для переиспользования между аккаунтами
+    # давно не использованные подключения закрываются
+    web3_pool_size = 256
+
+    # сколько объектов контрактов (токенов и т.д.) держать готовыми на одно подключение к rpc
+    contract_cache_size = 1024
+
+    # для сетей с несколькими rpc: таймаут запроса в секундах, после которого запрос повторяется на другом rpc
+    rpc_timeout = 10
+    # сколько секунд не использовать rpc после таймаута, ошибки соединения или превышения лимита запросов
+    rpc_cooldown = 30
+    # вес последнего запроса в скользящей средней задержки и ошибок rpc, от 0 до 1
+    rpc_ewma_alpha = 0.3
+
+    # сколько секунд данные о комиссии сети (fee_history, gas_price) общие для всех аккаунтов без нового запроса,
+    # примерно время блока сети, 'default' - для остальных сетей
+    fee_cache_ttl = {
+        'default': 3,
+        'ethereum': 12,
+        'bsc': 3,
+        'polygon': 2,
+        'avalanche': 2,
+        'arbitrum_one': 1,
+        'op': 2,
+    }
+
+    # ожидание квитанций транзакций, отправленных через Onchain.send_async: интервал опроса в секундах,
+    # сколько ждать квитанцию и сколько квитанций запрашивать одним batch запросом
+    receipt_poll_interval = 2
+    receipt_timeout = 600
+    receipt_batch_size = 50
+
+    # рассылка с одного кошелька на много адресов (core/distribution.py): сколько транзакций держать
+    # неподтвержденными одновременно и сколько оценок газа делать одним batch запросом
+    distribution_window = 16
+    distribution_batch_size = 100
+
+    # подпись пакетов транзакций (рассылки и т.д.) в нескольких процессах: с какого количества транзакций
+    # включать пул процессов и сколько процессов, None - по количеству ядер
+    # запуск пула занимает около секунды, поэтому меньшие пакеты быстрее подписать в текущем процессе,
+    # порог для своей машины можно подобрать по python -m snippets.benchmarks.signing_benchmark
+    bulk_sign_min = 200
+    sign_processes = None
+    # сколько пулов подписи (по одному на кошелек) держать запущенными между пакетами
+    sign_pools = 1
+
+    # рассылка одной транзакцией через контракт Disperse (Onchain.batch_transfer): максимум получателей в транзакции
+    # и доля лимита газа блока, которую может занять одна транзакция
+    disperse_max_recipients = 500
+    disperse_block_gas_share = 0.3
+
+    # индекс логов Approval для Onchain.remove_approves: начальный и максимальный диапазон блоков одного
+    # запроса eth_getLogs (при ошибке rpc диапазон уменьшается вдвое) и сколько последних блоков не сканировать
+    logs_chunk_blocks = 10_000
+    logs_chunk_blocks_max = 100_000
+    logs_confirmations = 5
+    # с какого блока сканировать логи Approval при первом запуске по сети, 0 - с начала сети
+    # например {'arbitrum': 200_000_000}, если кошельки не работали в сети раньше
+    logs_start_block = {
+        'default': 0,
+    }
+    # сколько последних блоков не брать из etherscan (его индекс отстает от сети), они сканируются через eth_getLogs
+    logs_etherscan_margin = 10_000
+
+    # максимальный размер calldata одного запроса Multicall3 в байтах, на него делятся пакетные чтения балансов
+    multicall_max_calldata = 64_000
 
     # okx прокси, укажите прокси для работы с биржей okx, если вы находитесь в РФ
     okx_proxy = None  # формат 'ip:port:login:password'
@@ -59,6 +177,8 @@ class Config:
 
     # лимит газа для метода ожидания нужного газа gas_price_wait
     gas_price_limit = 60
+    # как часто в секундах проверять ставку газа, пока аккаунты ждут снижения газа, одна проверка на сеть для всех аккаунтов
+    gas_monitor_interval = 5
 
     # id чата в телеграме, куда отправлять сообщения
     chat_id = '2031354862'
@@ -78,11 +198,17 @@ class Config:
     binance_api_key = os.getenv('BINANCE_API_KEY')
     binance_secret_key = os.getenv('BINANCE_SECRET_KEY')
 
+    ETHERSCAN_API_KEY = os.getenv('ETHERSCAN_API_KEY')
+
     PATH_CONFIG = os.path.join(os.getcwd(), 'config')
     PATH_DATA = os.path.join(PATH_CONFIG, 'data')
     PATH_ABI = os.path.join(PATH_DATA, 'ABIs')
     PATH_LOG = os.path.join(os.getcwd(), 'logs')
     PATH_EXCEL = os.path.join(PATH_DATA, 'accounts.xlsx')
+    PATH_JOURNAL = os.path.join(PATH_DATA, 'cycle_journal.jsonl')
+    PATH_PLAN = os.path.join(PATH_DATA, 'plan.json')
+    PATH_TOKEN_CACHE = os.path.join(PATH_DATA, 'token_cache.json')
+    PATH_APPROVALS = os.path.join(PATH_DATA, 'approvals.sqlite')
 
 
 config = Config()
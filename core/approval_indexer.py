@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from typing import Any, Optional, TYPE_CHECKING
+
+from loguru import logger
+from web3 import Web3
+
+from config import config
+from utils.metrics import metrics
+from utils.utils import to_checksum, get_response
+
+if TYPE_CHECKING:
+    from core.onchain import Onchain
+
+# keccak('Approval(address,address,uint256)')
+APPROVAL_TOPIC = '0x8c5be1e5ebec7d5bd14f71427d1e84f3dd0314c0f7b2291e5b200ac8c7c3b925'
+ETHERSCAN_URL = 'https://api.etherscan.io/v2/api'
+ETHERSCAN_PAGE_SIZE = 1000
+# etherscan отдает не больше page * offset = 10000 результатов на один запрос
+ETHERSCAN_MAX_RESULTS = 10_000
+
+
+def _to_hex(value: Any) -> str:
+    """
+    Приводит значение из лога web3 (HexBytes) или etherscan (str) к hex строке с 0x.
+    """
+    if isinstance(value, str):
+        return value if value.startswith('0x') else '0x' + value
+    return '0x' + bytes(value).hex()
+
+
+def _to_int(value: Any) -> int:
+    if isinstance(value, int):
+        return value
+    value = _to_hex(value)
+    return int(value, 16) if value != '0x' else 0
+
+
+def _start_block(chain: str) -> int:
+    """
+    Первый блок сканирования сети из config.logs_start_block.
+    """
+    start_block = config.logs_start_block
+    if isinstance(start_block, dict):
+        return start_block.get(chain, start_block.get('default', 0))
+    return start_block or 0
+
+
+class ApprovalIndexer:
+    """
+    Локальный индекс разрешений (approve) erc20 по логам Approval в файле SQLite config.PATH_APPROVALS.
+
+    Для каждой пары (сеть, владелец) хранится последний просканированный блок, поэтому повторный запуск
+    запрашивает логи только новых блоков. Логи запрашиваются через eth_getLogs частями по config.logs_chunk_blocks
+    блоков: если rpc отвечает ошибкой на большой диапазон, часть уменьшается вдвое, после успешных запросов
+    снова растет. Первое сканирование адреса начинается с блока config.logs_start_block сети. Если указан
+    ETHERSCAN_API_KEY, история до блока за config.logs_etherscan_margin блоков до конца сети берется из etherscan,
+    а остаток, который индекс etherscan мог еще не содержать, сканируется через eth_getLogs.
+
+    Таблица allowances хранит последнее значение разрешения для каждой пары (токен, spender),
+    действующие разрешения - со значением больше 0.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """
+        :param path: путь к файлу базы, если не указан, берется config.PATH_APPROVALS
+        """
+        self.path = path or config.PATH_APPROVALS
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS scans ('
+            'chain_id INTEGER NOT NULL, '
+            'owner TEXT NOT NULL, '
+            'last_block INTEGER NOT NULL, '
+            'PRIMARY KEY (chain_id, owner))'
+        )
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS allowances ('
+            'chain_id INTEGER NOT NULL, '
+            'owner TEXT NOT NULL, '
+            'token TEXT NOT NULL, '
+            'spender TEXT NOT NULL, '
+            'amount TEXT NOT NULL, '  # uint256 не помещается в INTEGER SQLite, храним строкой
+            'block INTEGER NOT NULL, '
+            'PRIMARY KEY (chain_id, owner, token, spender))'
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Соединение с базой, одно на поток. Транзакциями управляем сами (isolation_level=None).
+        :return: соединение
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def last_block(self, chain_id: int, owner: str) -> Optional[int]:
+        """
+        :return: последний просканированный блок или None, если адрес в сети еще не сканировался
+        """
+        row = self._connection().execute(
+            'SELECT last_block FROM scans WHERE chain_id = ? AND owner = ?', (chain_id, to_checksum(owner))
+        ).fetchone()
+        return row[0] if row else None
+
+    def update(self, onchain: Onchain) -> int:
+        """
+        Дописывает в индекс логи Approval аккаунта onchain с последнего просканированного блока.
+        Последние config.logs_confirmations блоков не сканируются, чтобы не записать логи блоков,
+        которые еще могут быть отменены реорганизацией.
+        :param onchain: Onchain аккаунта и сети
+        :return: количество новых логов
+        """
+        chain_id, owner = onchain.chain.chain_id, to_checksum(onchain.account.address)
+        to_block = onchain.w3.eth.block_number - config.logs_confirmations
+        last_block = self.last_block(chain_id, owner)
+        start_block = _start_block(onchain.chain.name)
+
+        found = 0
+        if last_block is None and config.ETHERSCAN_API_KEY:
+            # индекс etherscan отстает от сети, последние блоки берем из rpc
+            etherscan_block = to_block - config.logs_etherscan_margin
+            if etherscan_block >= start_block:
+                try:
+                    logs = self._etherscan_logs(chain_id, owner, start_block, etherscan_block)
+                    found += self._save(chain_id, owner, logs, etherscan_block)
+                    last_block = etherscan_block
+                except Exception as e:
+                    logger.warning(f'Не удалось получить логи Approval из etherscan, сканируем через rpc: {e}')
+        start = start_block if last_block is None else last_block + 1
+
+        owner_topic = '0x' + owner[2:].lower().rjust(64, '0')
+        chunk = config.logs_chunk_blocks
+        while start <= to_block:
+            end = min(start + chunk - 1, to_block)
+            try:
+                with metrics.timed('approval_logs_seconds', chain=onchain.chain.name):
+                    logs = onchain.w3.eth.get_logs({
+                        'fromBlock': start,
+                        'toBlock': end,
+                        'topics': [APPROVAL_TOPIC, owner_topic],
+                    })
+            except Exception as e:
+                if chunk == 1:
+                    raise
+                # rpc ограничивает диапазон блоков или количество логов в ответе, уменьшаем часть
+                chunk = max(1, chunk // 2)
+                logger.debug(f'eth_getLogs {start}-{end} в сети {onchain.chain.name} не выполнен, '
+                             f'часть уменьшена до {chunk} блоков: {e}')
+                continue
+            found += self._save(chain_id, owner, logs, end)
+            start = end + 1
+            chunk = min(chunk * 2, config.logs_chunk_blocks_max)
+        return found
+
+    def _etherscan_logs(self, chain_id: int, owner: str, from_block: int, to_block: int) -> list[dict]:
+        """
+        История логов Approval владельца из etherscan по страницам. Etherscan отдает не больше ETHERSCAN_MAX_RESULTS
+        логов на один диапазон блоков, поэтому после этого запросы продолжаются с блока последнего полученного лога.
+        :param from_block: первый блок
+        :param to_block: последний блок
+        :return: список логов в формате etherscan
+        """
+        logs: dict[tuple[int, int], dict] = {}
+        page = 1
+        while True:
+            params = {
+                'chainid': chain_id,
+                'module': 'logs',
+                'action': 'getLogs',
+                'fromBlock': from_block,
+                'toBlock': to_block,
+                'topic0': APPROVAL_TOPIC,
+                'topic0_1_opr': 'and',
+                'topic1': '0x' + owner[2:].lower().rjust(64, '0'),
+                'page': page,
+                'offset': ETHERSCAN_PAGE_SIZE,
+                'apikey': config.ETHERSCAN_API_KEY,
+            }
+            result = get_response(ETHERSCAN_URL, params).get('result', [])
+            if not isinstance(result, list):
+                raise ValueError(result)
+            # логи последнего блока могут прийти повторно при переходе к следующему диапазону
+            for log in result:
+                logs[(_to_int(log['blockNumber']), _to_int(log.get('logIndex', 0)))] = log
+            if len(result) < ETHERSCAN_PAGE_SIZE:
+                return list(logs.values())
+            if page * ETHERSCAN_PAGE_SIZE < ETHERSCAN_MAX_RESULTS:
+                page += 1
+                continue
+            last_log_block = _to_int(result[-1]['blockNumber'])
+            if last_log_block <= from_block:
+                raise ValueError(f'больше {ETHERSCAN_MAX_RESULTS} логов Approval в блоке {from_block}')
+            from_block, page = last_log_block, 1
+
+    def _save(self, chain_id: int, owner: str, logs: list, last_block: int) -> int:
+        """
+        Записывает разрешения из логов и последний просканированный блок одной транзакцией,
+        чтобы прерванное сканирование продолжилось с сохраненного блока.
+        :param logs: логи Approval (web3 или etherscan)
+        :param last_block: последний блок просканированного диапазона
+        :return: количество записанных логов erc20
+        """
+        rows = []
+        for log in logs:
+            topics = [_to_hex(topic) for topic in log['topics']]
+            # у erc721 тот же Approval, но tokenId в третьем индексированном параметре
+            if len(topics) != 3:
+                continue
+            rows.append((
+                _to_int(log['blockNumber']), _to_int(log.get('logIndex', 0)),
+                Web3.to_checksum_address(_to_hex(log['address'])),
+                Web3.to_checksum_address('0x' + topics[2][-40:]),
+                _to_int(log['data']),
+            ))
+        rows.sort()
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT INTO allowances (chain_id, owner, token, spender, amount, block) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (chain_id, owner, token, spender) DO UPDATE SET amount = excluded.amount, '
+                'block = excluded.block WHERE excluded.block >= allowances.block',
+                [(chain_id, owner, token, spender, str(amount), block) for block, _, token, spender, amount in rows]
+            )
+            connection.execute(
+                'INSERT INTO scans (chain_id, owner, last_block) VALUES (?, ?, ?) '
+                'ON CONFLICT (chain_id, owner) DO UPDATE SET last_block = excluded.last_block',
+                (chain_id, owner, last_block)
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return len(rows)
+
+    def live(self, chain_id: int, owner: str) -> list[tuple[str, str, int]]:
+        """
+        Действующие разрешения владельца по последним логам Approval.
+        :param chain_id: id сети
+        :param owner: адрес владельца токенов
+        :return: список (адрес токена, адрес spender, сумма в wei)
+        """
+        rows = self._connection().execute(
+            "SELECT token, spender, amount FROM allowances WHERE chain_id = ? AND owner = ? AND amount != '0'",
+            (chain_id, to_checksum(owner))
+        ).fetchall()
+        return [(token, spender, int(amount)) for token, spender, amount in rows]
+
+    def mark_revoked(self, chain_id: int, owner: str, token: str, spender: str) -> None:
+        """
+        Отмечает разрешение отозванным, не дожидаясь следующего сканирования.
+        :return: None
+        """
+        self._connection().execute(
+            "UPDATE allowances SET amount = '0' WHERE chain_id = ? AND owner = ? AND token = ? AND spender = ?",
+            (chain_id, to_checksum(owner), to_checksum(token), to_checksum(spender))
+        )
+
+
+# общий индекс разрешений процесса, создается при первом обращении
+_indexer: Optional[ApprovalIndexer] = None
+_indexer_lock = threading.Lock()
+
+
+def get_approval_indexer() -> ApprovalIndexer:
+    """
+    Возвращает общий индекс разрешений процесса.
+    :return: ApprovalIndexer
+    """
+    global _indexer
+    with _indexer_lock:
+        if _indexer is None:
+            _indexer = ApprovalIndexer()
+        return _indexer
+
+
+if __name__ == '__main__':
+    pass
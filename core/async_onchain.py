@@ -0,0 +1,471 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from typing import Optional
+
+from eth_account import Account as EthAccount
+from eth_typing import ChecksumAddress
+from loguru import logger
+from web3 import AsyncWeb3
+from web3.contract import AsyncContract
+
+from config import config, Tokens
+from core.approval_indexer import get_approval_indexer
+from core.onchain import Onchain
+from models.account import Account
+from models.amount import Amount
+from models.chain import Chain
+from models.contract_raw import ContractRaw
+from models.token import Token, TokenTypes
+from utils.utils import to_checksum, get_multiplayer, prepare_proxy_http, get_user_agent
+
+
+class AsyncOnchain:
+    """
+    Асинхронный аналог Onchain на AsyncWeb3. Публичные методы те же, что у Onchain, но их нужно вызывать через await.
+    Позволяет в одном event loop параллельно проверять балансы и отправлять транзакции сотен аккаунтов:
+
+    onchains = [AsyncOnchain(account, Chains.ARBITRUM_ONE) for account in accounts]
+    balances = await asyncio.gather(*(onchain.get_balance() for onchain in onchains))
+    """
+
+    def __init__(self, account: Account, chain: Chain):
+        self.account = account
+        self.chain = chain
+
+        self.w3 = self._prepare_w3(chain)
+        if self.account.private_key:
+            if not self.account.address:
+                self.account.address = EthAccount.from_key(self.account.private_key).address
+
+    def _prepare_w3(self, chain: Chain) -> AsyncWeb3:
+        request_kwargs = {
+            'headers': {
+                'User-Agent': get_user_agent(),
+                "Content-Type": "application/json",
+            },
+        }
+        if config.is_web3_proxy and self.account.proxy:
+            request_kwargs['proxy'] = prepare_proxy_http(self.account.proxy)
+        self.w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(chain.rpc, request_kwargs=request_kwargs))
+        return self.w3
+
+    def change_chain(self, chain: Chain):
+        """
+        Изменение сети для работы
+        :param chain: объект Chain
+        :return: None
+        """
+        self.chain = chain
+        self.w3 = self._prepare_w3(chain)
+
+    async def _get_token_params(self, token_address: str | ChecksumAddress) -> tuple[str, int]:
+        """
+        Получение параметров токена (symbol, decimals) по адресу контракта токена
+        :param token_address:  адрес контракта токена
+        :return: кортеж (symbol, decimals)
+        """
+        token_contract_address = to_checksum(token_address)
+
+        if token_contract_address == Tokens.NATIVE_TOKEN.address:
+            return self.chain.native_token, Tokens.NATIVE_TOKEN.decimals
+
+        token_contract_raw = ContractRaw(token_contract_address, 'erc20', self.chain)
+        token_contract = self._get_contract(token_contract_raw)
+        decimals, symbol = await asyncio.gather(
+            token_contract.functions.decimals().call(),
+            token_contract.functions.symbol().call()
+        )
+        return symbol, decimals
+
+    def _native_token(self) -> Token:
+        """
+        Нативный токен текущей сети. Создается новый объект на каждый вызов, общий Tokens.NATIVE_TOKEN не изменяется,
+        так как методы разных аккаунтов и сетей выполняются параллельно.
+        :return: объект Token
+        """
+        native = Tokens.NATIVE_TOKEN
+        return Token(self.chain.native_token, native.address, self.chain, native.decimals, TokenTypes.NATIVE)
+
+    def _get_contract(self, contract_raw: ContractRaw) -> AsyncContract:
+        """
+        Получение инициализированного объекта контракта
+        :param contract_raw: объект ContractRaw
+        :return: объект контракта
+        """
+        return self.w3.eth.contract(contract_raw.address, abi=contract_raw.abi)
+
+    async def _estimate_gas(self, tx_params: dict) -> dict:
+        """
+        Оценивает стоимость газа для транзакции и добавляет исходный словарь tx параметр gas
+        :param tx_params: параметры транзакции
+        """
+        tx_params['gas'] = int(await self.w3.eth.estimate_gas(tx_params) * get_multiplayer())
+        return tx_params
+
+    async def _get_fee(self, tx_params: dict[str, str | int] | None = None) -> dict[str, str | int]:
+        """
+        Подготовка параметров комиссии с учетом EIP-1559, логика та же, что в Onchain._get_fee.
+        :param tx_params: параметры транзакции без параметров комиссии либо None, если передан None, то создается новый словарь
+        """
+        if tx_params is None:
+            tx_params = {}
+
+        fee_history = None
+
+        if self.chain.is_eip1559 is None:
+            fee_history = await self.w3.eth.fee_history(20, 'latest', [40])
+            self.chain.is_eip1559 = any(fee_history.get('baseFeePerGas', [0]))
+
+        if self.chain.is_eip1559 is False:
+            tx_params['gasPrice'] = self._multiply(await self.w3.eth.gas_price)
+            return tx_params
+
+        fee_history = fee_history or await self.w3.eth.fee_history(20, 'latest', [40])
+        base_fee = fee_history.get('baseFeePerGas', [0])[-1]
+        priority_fees = [fee[0] for fee in fee_history.get('reward', [[0]]) if fee[0] != 0] or [0]
+        median_index = len(priority_fees) // 2
+        priority_fees.sort()
+        median_priority_fee = priority_fees[median_index]
+
+        priority_fee = self._multiply(median_priority_fee)
+        max_fee = self._multiply(base_fee + priority_fee)
+
+        tx_params['type'] = '0x2'
+        tx_params['maxFeePerGas'] = max_fee
+        tx_params['maxPriorityFeePerGas'] = priority_fee
+
+        return tx_params
+
+    def _multiply(self, value: int, min_mult: float = 1.03, max_mult: float = 1.1) -> int:
+        """
+        Умножение значения газа на переданный множитель и множитель сети
+        :param value: значение
+        :return: умноженное значение
+        """
+        return int(value * get_multiplayer(min_mult, max_mult) * self.chain.multiplier)
+
+    async def _get_l1_fee(self, tx_params: dict[str, str | int]) -> Amount:
+        """
+        Получение комиссии для L1 сети Optimism
+        :param tx_params: параметры транзакции
+        :return: комиссия
+        """
+        if self.chain.name != 'op':
+            return Amount(0, wei=True)
+
+        abi = [
+            {
+                "inputs": [{"internalType": "bytes", "name": "_data", "type": "bytes"}],
+                "name": "getL1Fee",
+                "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+                "stateMutability": "view",
+                "type": "function"
+            }
+        ]
+        oracle_address = self.w3.to_checksum_address('0x420000000000000000000000000000000000000F')
+        contract = self.w3.eth.contract(address=oracle_address, abi=abi)
+        tx_params['data'] = tx_params.get('data', '0x')
+        l1_fee = await contract.functions.getL1Fee(tx_params['data']).call()
+        return Amount(l1_fee, wei=True)
+
+    async def _prepare_tx(self, value: Optional[Amount] = None,
+                          to_address: Optional[str | ChecksumAddress] = None) -> dict:
+        """
+        Подготовка параметров транзакции, комиссия и nonce запрашиваются параллельно
+        :param value: сумма перевода ETH, если ETH нужно приложить к транзакции
+        :param to_address: адрес получателя транзакции, для перевода нативного токена
+        :return: параметры транзакции
+        """
+        tx_params, nonce = await asyncio.gather(
+            self._get_fee(),
+            self.w3.eth.get_transaction_count(self.account.address)
+        )
+
+        tx_params['from'] = self.account.address
+        tx_params['nonce'] = nonce
+        tx_params['chainId'] = self.chain.chain_id
+
+        if value:
+            tx_params['value'] = value.wei
+
+        if to_address:
+            tx_params['to'] = to_address
+
+        return tx_params
+
+    async def _sign_and_send(self, tx: dict) -> str:
+        """
+        Подпись и отправка транзакции, ожидание квитанции не блокирует event loop
+        :param tx: параметры транзакции
+        :return: хэш транзакции
+        """
+        signed_tx = self.w3.eth.account.sign_transaction(tx, self.account.private_key)
+        tx_hash = await self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_receipt = await self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        return tx_receipt['transactionHash'].hex()
+
+    async def get_balance(
+            self,
+            *,
+            token: Optional[Token | str | ChecksumAddress] = None,
+            address: Optional[str | ChecksumAddress] = None
+    ) -> Amount:
+        """
+        Получение баланса кошелька в нативных или erc20 токенах, в формате Amount.
+        :param token: объект Token или адрес смарт контракта токена, если не указан, то нативный баланс
+        :param address: адрес кошелька, если не указан, то берется адрес аккаунта
+        :return: объект Amount с балансом
+        """
+        if token is None or isinstance(token, Token) and token.type_token == TokenTypes.NATIVE:
+            token = self._native_token()
+
+        if not address:
+            address = self.account.address
+
+        address = to_checksum(address)
+
+        if isinstance(token, str):
+            symbol, decimals = await self._get_token_params(token)
+            token = Token(symbol, token, self.chain, decimals)
+
+        if token.chain != self.chain:
+            logger.error(f'Токен на другой сети {token.chain.name} проверяется в {self.chain.name}')
+            raise ValueError('Токен на другой сети')
+
+        if token.type_token == TokenTypes.NATIVE:
+            native_balance = await self.w3.eth.get_balance(address)
+            balance = Amount(native_balance, wei=True)
+        else:
+            contract = self._get_contract(token)
+            erc20_balance_wei = await contract.functions.balanceOf(address).call()
+            balance = Amount(erc20_balance_wei, decimals=token.decimals, wei=True)
+        return balance
+
+    async def _validate_native_transfer_value(self, tx_params: dict) -> None:
+        """
+        Проверка возможности отправки нативного токена и корректировка суммы перевода, если недостаточно средств
+        в исходном словаре tx_params
+        :param tx_params: параметры транзакции c указанным value
+        """
+        amount = Amount(tx_params['value'], wei=True)
+        l1_fee, gues_gas, balance = await asyncio.gather(
+            self._get_l1_fee(tx_params),
+            self.w3.eth.estimate_gas({'from': self.account.address, 'to': self.account.address, 'value': 1}),
+            self.get_balance()
+        )
+        gues_gas_price = tx_params.get('maxFeePerGas', tx_params.get('gasPrice'))
+        fee_spend = self._multiply(l1_fee.wei + gues_gas * gues_gas_price, 1.1, 1.2)
+        if balance.wei - fee_spend - amount.wei >= 0:
+            return
+
+        message = f'баланс {self.chain.native_token}: {balance}, сумма: {amount} to {tx_params["to"]}'
+        logger.warning(
+            f'{self.account.profile_number} Недостаточно средств для отправки транзакции, {message}'
+            f'Отправляем все доступные средства')
+        tx_params['value'] = int(balance.wei - self._multiply(fee_spend, 1.1, 1.2))
+        if tx_params['value'] > 0:
+            return
+        logger.error(f'{self.account.profile_number} Недостаточно средств для отправки транзакции')
+        raise ValueError('Недостаточно средств для отправки нативного токена')
+
+    async def send_token(self,
+                         to_address: str | ChecksumAddress,
+                         amount: Amount | int | float | None = None,
+                         token: Optional[Token | str | ChecksumAddress] = None
+                         ) -> str:
+        """
+        Отправка любых типов токенов, поведение как у Onchain.send_token.
+        :param amount: сумма перевода, может быть объектом Amount, int, float или None
+        :param to_address: адрес получателя
+        :param token: объект Token или адрес контракта токена, если оставить пустым будет отправлен нативный токен
+        :return: хэш транзакции
+        """
+        if token is None or isinstance(token, Token) and token.type_token == TokenTypes.NATIVE:
+            token = self._native_token()
+
+        if isinstance(token, str):
+            symbol, decimals = await self._get_token_params(token)
+            token = Token(symbol, token, self.chain, decimals)
+
+        if amount is None:
+            amount = await self.get_balance(token=token)
+
+        to_address = to_checksum(to_address)
+
+        if not isinstance(amount, Amount):
+            amount = Amount(amount, decimals=token.decimals)
+
+        if token.type_token == TokenTypes.NATIVE:
+            tx_params = await self._prepare_tx(amount, to_address)
+            await self._validate_native_transfer_value(tx_params)
+            amount = Amount(tx_params['value'], wei=True)
+        else:
+            balance, tx_params = await asyncio.gather(self.get_balance(token=token), self._prepare_tx())
+            if balance.wei < amount.wei:
+                amount = balance
+            contract = self._get_contract(token)
+            tx_params = await contract.functions.transfer(to_address, amount.wei).build_transaction(tx_params)
+
+        await self._estimate_gas(tx_params)
+        tx_hash = await self._sign_and_send(tx_params)
+        message = f' {amount} {token.symbol} на адрес {to_address} '
+        logger.info(f'{self.account.profile_number} Транзакция отправлена [{message}] хэш: {tx_hash}')
+        return tx_hash
+
+    async def _get_allowance(self, token: Token | str, spender: str | ChecksumAddress | ContractRaw) -> Amount:
+        """
+        Получение разрешенной суммы токенов на снятие
+        :param token: объект Token или адрес контракта токена
+        :param spender: адрес контракта, который получил разрешение на снятие токенов
+        :return: объект Amount с разрешенной суммой
+        """
+        if isinstance(token, str):
+            symbol, decimals = await self._get_token_params(token)
+            token = Token(symbol, token, self.chain, decimals)
+
+        if token is None or token.type_token == TokenTypes.NATIVE:
+            return Amount(0, wei=True)
+
+        if isinstance(spender, ContractRaw):
+            spender = spender.address
+
+        spender = to_checksum(spender)
+
+        contract = self._get_contract(token)
+        allowance = await contract.functions.allowance(self.account.address, spender).call()
+        return Amount(allowance, decimals=token.decimals, wei=True)
+
+    async def approve(self, token: Optional[Token, str], amount: Amount | int | float,
+                      spender: str | ChecksumAddress | ContractRaw) -> None:
+        """
+        Одобрение транзакции на снятие токенов
+        :param token: токен, который одобряем или адрес контракта токена
+        :param amount: сумма одобрения
+        :param spender: адрес контракта, который получит разрешение на снятие токенов
+        :return: None
+        """
+        if isinstance(token, str):
+            symbol, decimals = await self._get_token_params(token)
+            token = Token(symbol, token, self.chain, decimals)
+
+        if token is None or token.type_token == TokenTypes.NATIVE:
+            return
+
+        if isinstance(amount, (int, float)):
+            amount = Amount(amount, decimals=token.decimals)
+
+        allowed, tx_params = await asyncio.gather(self._get_allowance(token, spender), self._prepare_tx())
+
+        if amount.wei == 0 and allowed.wei == 0:
+            return
+
+        if amount.wei != 0 and allowed.wei >= amount.wei:
+            return
+
+        if isinstance(spender, ContractRaw):
+            spender = spender.address
+        spender = to_checksum(spender)
+
+        contract = self._get_contract(token)
+        tx_params = await contract.functions.approve(spender, amount.wei).build_transaction(tx_params)
+        await self._estimate_gas(tx_params)
+        await self._sign_and_send(tx_params)
+        message = f'approve {amount} {token.symbol} to {spender}'
+        logger.info(f'{self.account.profile_number} Транзакция отправлена {message}')
+
+    async def get_gas_price(self, gwei: bool = True) -> int:
+        """
+        Получение текущей ставки газа
+        :return: ставка газа
+        """
+        gas_price = await self.w3.eth.gas_price
+        if gwei:
+            return gas_price / 10 ** 9
+        return gas_price
+
+    async def gas_price_wait(self, gas_limit: int = None) -> None:
+        """
+        Ожидание пока ставка газа не станет меньше лимита, осуществляется запрос каждые 5-10 секунд,
+        ожидание не блокирует event loop
+        :param gas_limit: лимит ставки газа, если не передан, берется из конфига
+        :return:
+        """
+        if not gas_limit:
+            gas_limit = config.gas_price_limit
+
+        while await self.get_gas_price() > gas_limit:
+            await asyncio.sleep(random.uniform(5, 10))
+
+    def get_pk_from_seed(self, seed: str | list) -> str:
+        """
+        Получение приватного ключа из seed
+        :param seed: seed фраза в виде строки или списка слов
+        :return: приватный ключ
+        """
+        EthAccount.enable_unaudited_hdwallet_features()
+        if isinstance(seed, list):
+            seed = ' '.join(seed)
+        return EthAccount.from_mnemonic(seed).key.hex()
+
+    async def is_eip_1559(self) -> bool:
+        """
+        Проверка наличия EIP-1559 на сети. Возвращает True, если EIP-1559 включен.
+        :return: bool
+        """
+        fees_data = await self.w3.eth.fee_history(50, 'latest')
+        return any(fees_data['baseFeePerGas'])
+
+    async def remove_approves(self) -> list[str]:
+        """
+        Отзыв всех разрешений erc20 аккаунта в текущей сети, как Onchain.remove_approves. Разрешения берутся
+        из общего индекса логов Approval (core/approval_indexer.py), индекс дописывается синхронным Onchain
+        в отдельном потоке, чтобы не блокировать event loop. Текущие разрешения и параметры токенов запрашиваются
+        параллельно, отзывы отправляются по одному, так как nonce берется из сети.
+        :return: хэши транзакций отзыва
+        """
+        indexer = get_approval_indexer()
+        await asyncio.to_thread(indexer.update, Onchain(self.account, self.chain))
+        live = indexer.live(self.chain.chain_id, self.account.address)
+        if not live:
+            logger.info(f'{self.account.profile_number} Нет действующих разрешений в сети {self.chain.name}')
+            return []
+
+        token_addresses = list({token_address for token_address, _, _ in live})
+        params = await asyncio.gather(*(self._get_token_params(address) for address in token_addresses))
+        tokens = {address: Token(symbol, address, self.chain, decimals)
+                  for address, (symbol, decimals) in zip(token_addresses, params)}
+        allowances = await asyncio.gather(*(self._get_allowance(tokens[token_address], spender)
+                                            for token_address, spender, _ in live))
+
+        hashes = []
+        for (token_address, spender, _), allowance in zip(live, allowances):
+            token = tokens[token_address]
+            # разрешение уже израсходовано или отозвано без лога Approval
+            if allowance.wei == 0:
+                indexer.mark_revoked(self.chain.chain_id, self.account.address, token_address, spender)
+                continue
+            # после отзыва индекс обновится по логу Approval при следующем запуске
+            try:
+                hashes.append(await self._approve_zero(token, spender))
+            except Exception as e:
+                logger.error(f'{self.account.profile_number} Отзыв разрешения {token.symbol} для {spender} '
+                             f'не выполнен: {e}')
+        return hashes
+
+    async def _approve_zero(self, token: Token, spender: str) -> str:
+        """
+        Отзыв разрешения spender на токен.
+        :return: хэш транзакции
+        """
+        contract = self._get_contract(token)
+        tx_params = await contract.functions.approve(spender, 0).build_transaction(await self._prepare_tx())
+        await self._estimate_gas(tx_params)
+        tx_hash = await self._sign_and_send(tx_params)
+        logger.info(f'{self.account.profile_number} Разрешение {token.symbol} для {spender} отозвано: {tx_hash}')
+        return tx_hash
+
+
+if __name__ == '__main__':
+    pass
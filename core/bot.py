@@ -4,6 +4,8 @@ from core.browser import Ads, Metamask
 from core.excel import Excel
 from core.exchanges import Exchanges
 from core.onchain import Onchain
+from core.watchdog import watchdog
+from utils.metrics import metrics
 from models.chain import Chain
 from models.account import Account
 from config import config
@@ -14,11 +16,19 @@ class Bot:
         logger.info(f'{account.profile_number} Запуск профиля')
         self.chain = chain
         self.account = account
-        self.ads = Ads(account)
-        self.excel = Excel(account)
-        self.metamask = Metamask(self.ads, account, self.excel)
-        self.exchanges = Exchanges(account)
-        self.onchain = Onchain(account, self.chain)
+        # запуск браузера ограничен по времени config.timeouts['browser_start']
+        with watchdog.deadline('browser_start', account=account,
+                               teardown=lambda: Ads.stop_profile(account.profile_number)):
+            with metrics.timed('bot_init_seconds', component='ads'):
+                self.ads = Ads(account)
+        with metrics.timed('bot_init_seconds', component='excel'):
+            self.excel = Excel(account)
+        with metrics.timed('bot_init_seconds', component='metamask'):
+            self.metamask = Metamask(self.ads, account, self.excel)
+        with metrics.timed('bot_init_seconds', component='exchanges'):
+            self.exchanges = Exchanges(account)
+        with metrics.timed('bot_init_seconds', component='onchain'):
+            self.onchain = Onchain(account, self.chain)
 
     def __enter__(self):
         return self
@@ -8,6 +8,7 @@ import requests
 
 from config.settings import config
 from models.account import Account
+from utils.metrics import metrics
 from utils.utils import random_sleep, get_response
 
 from playwright.sync_api import sync_playwright, Browser, Page, Locator, Playwright, Frame
@@ -30,7 +31,8 @@ class Ads:
             return
 
         self.pw: Optional[Playwright] = None
-        self._browser = self._start_browser()
+        with metrics.timed('ads_start_seconds'):
+            self._browser = self._start_browser()
         self.context = self._browser.contexts[0]
         self.page = self.context.new_page()
         self._prepare_browser()
@@ -66,7 +68,8 @@ class Ads:
         url = self._local_api_url + 'browser/start'
         random_sleep(1, 2)
         try:
-            data = get_response(url, params)
+            with metrics.timed('ads_api_seconds', endpoint='browser/start'):
+                data = get_response(url, params)
             return data.get('data', {}).get('ws', {}).get('puppeteer', '')
         except Exception as e:
             logger.error(f'{self.profile_number} Ошибка при открытии браузера: {e}')
@@ -81,7 +84,8 @@ class Ads:
         url = self._local_api_url + 'browser/active'
         random_sleep(1, 2)
         try:
-            data = get_response(url, params)
+            with metrics.timed('ads_api_seconds', endpoint='browser/active'):
+                data = get_response(url, params)
             if data.get('data', {}).get('status', '') == 'Active':
                 logger.info(f'{self.profile_number} Браузер уже активен')
                 return data.get('data', {}).get('ws', {}).get('puppeteer', '')
@@ -148,13 +152,27 @@ class Ads:
             self._browser.close()
 
         self.pw.stop() if self.pw else None
-        params = dict(serial_number=self.profile_number)
-        url = self._local_api_url + 'browser/stop'
         random_sleep(1, 2)
+        self.stop_profile(self.profile_number)
+
+    @classmethod
+    def stop_profile(cls, profile_number: int | str) -> None:
+        """
+        Останавливает браузер профиля через API ADS без обращения к playwright, поэтому
+        может вызываться из другого потока, например watchdog при превышении времени этапа.
+        :param profile_number: номер профиля в ADS
+        :return: None
+        """
+        if not config.is_browser_run:
+            return
+
+        params = dict(serial_number=profile_number)
+        url = cls._local_api_url + 'browser/stop'
         try:
-            get_response(url, params)
+            with metrics.timed('ads_api_seconds', endpoint='browser/stop'):
+                get_response(url, params)
         except Exception as e:
-            logger.error(f'{self.profile_number} Ошибка при остановке браузера: {e}')
+            logger.error(f'{profile_number} Ошибка при остановке браузера: {e}')
             raise e
 
     def catch_page(self, url_contains: str | list[str] = None, timeout: int = 10) -> \
@@ -231,7 +249,8 @@ class Ads:
 
         random_sleep(1, 2)
         try:
-            data = get_response(url, params)
+            with metrics.timed('ads_api_seconds', endpoint='user/list'):
+                data = get_response(url, params)
             return data.get('data', {}).get('list', [{}])[0].get('user_id', '')
         except Exception as e:
             logger.error(f'{self.profile_number} Ошибка при получении id профиля: {e}')
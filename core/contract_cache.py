@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from web3 import Web3
+from web3.contract import Contract
+
+from config.settings import config
+from models.contract_raw import ContractRaw
+from utils.metrics import metrics
+
+
+class _Web3Contracts:
+    def __init__(self) -> None:
+        # фабрики контрактов по имени abi: разбор abi и создание объектов функций делается один раз
+        self.factories: dict[str, type[Contract]] = {}
+        # привязанные к адресу контракты (имя abi, адрес) в порядке последнего использования
+        self.instances: OrderedDict[tuple[str, str], Contract] = OrderedDict()
+
+
+class ContractCache:
+    """
+    Общий для процесса кеш объектов контрактов web3.
+
+    w3.eth.contract(address, abi=...) на каждый вызов заново разбирает abi и создает объекты всех функций контракта.
+    Кеш хранит для каждого Web3 фабрику контракта по имени abi и готовые контракты по (имя abi, адрес),
+    давно не использованные контракты удаляются при превышении config.contract_cache_size.
+    Объекты Web3 общие для аккаунтов (core/providers.py), поэтому контракт токена создается один раз на rpc,
+    а не на каждый вызов get_balance, approve и т.д.
+    Фабрики и контракты ссылаются на свой Web3, поэтому слабые ссылки на Web3 здесь не освобождали бы память:
+    контракты Web3 удаляются явно через discard, когда реестр core/providers.py удаляет этот Web3.
+    """
+
+    def __init__(self, size: Optional[int] = None) -> None:
+        """
+        :param size: максимальное количество контрактов на один Web3, если не указано, берется config.contract_cache_size
+        """
+        self.size = size
+        self._by_w3: dict[Web3, _Web3Contracts] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, w3: Web3, contract_raw: ContractRaw) -> Contract:
+        """
+        Возвращает контракт, привязанный к адресу, создает при первом обращении.
+        :param w3: объект Web3
+        :param contract_raw: объект ContractRaw или Token
+        :return: объект контракта
+        """
+        key = (contract_raw.abi_name, contract_raw.address)
+        with self._lock:
+            contracts = self._by_w3.get(w3)
+            if contracts is None:
+                contracts = self._by_w3[w3] = _Web3Contracts()
+            contract = contracts.instances.get(key)
+            if contract is not None:
+                contracts.instances.move_to_end(key)
+                self.hits += 1
+                metrics.inc('contract_cache_total', result='hit')
+                return contract
+
+            factory = contracts.factories.get(contract_raw.abi_name)
+            if factory is None:
+                factory = contracts.factories[contract_raw.abi_name] = w3.eth.contract(abi=contract_raw.abi)
+            contract = contracts.instances[key] = factory(address=contract_raw.address)
+            while len(contracts.instances) > (self.size or config.contract_cache_size):
+                contracts.instances.popitem(last=False)
+            self.misses += 1
+            metrics.inc('contract_cache_total', result='miss')
+            return contract
+
+    def discard(self, w3: Web3) -> None:
+        """
+        Удаляет все контракты Web3, вызывается при удалении Web3 из реестра подключений.
+        :param w3: объект Web3
+        :return: None
+        """
+        with self._lock:
+            self._by_w3.pop(w3, None)
+
+
+# общий кеш контрактов процесса
+contract_cache = ContractCache()
+
+
+if __name__ == '__main__':
+    pass
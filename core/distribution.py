@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional, TYPE_CHECKING
+
+from eth_typing import ChecksumAddress
+from loguru import logger
+
+from config import config, Tokens
+from core.excel import Excel
+from core.signer import SigningPipeline
+from models.amount import Amount
+from models.token import Token, TokenTypes
+from models.tx_result import TxResult
+from utils.utils import to_checksum, get_multiplayer
+
+if TYPE_CHECKING:
+    from core.onchain import Onchain
+
+# сколько секунд сверх config.receipt_timeout ждать результат receipt_tracker, прежде чем считать перевод timeout
+RESULT_MARGIN = 60
+
+
+class Transfer:
+    """
+    Один перевод рассылки и его результат.
+
+    to_address - адрес получателя
+
+    amount - сумма перевода
+
+    token - объект Token, None - нативный токен
+
+    status - planned, skipped, failed, sent, success, reverted, timeout
+
+    tx_hash, fee, error - результат отправки
+    """
+
+    def __init__(
+            self,
+            to_address: str | ChecksumAddress,
+            amount: Amount | int | float,
+            token: Optional[Token] = None
+    ) -> None:
+        self.to_address = to_checksum(to_address)
+        self.token = token if token is not None and token.type_token != TokenTypes.NATIVE else None
+        decimals = self.token.decimals if self.token else 18
+        self.amount = amount if isinstance(amount, Amount) else Amount(amount, decimals=decimals)
+        self.tx: Optional[dict] = None
+        self.status = 'planned'
+        self.tx_hash: Optional[str] = None
+        self.fee: Optional[Amount] = None
+        self.error: Optional[str] = None
+
+    def symbol(self, onchain: Onchain) -> str:
+        return self.token.symbol if self.token else onchain.chain.native_token
+
+    def to_row(self, onchain: Onchain) -> list:
+        return [self.to_address, self.symbol(onchain), self.amount.ether, self.status, self.tx_hash,
+                self.fee.ether if self.fee else None, self.error]
+
+
+class Distribution:
+    """
+    Рассылка токенов с одного кошелька на много адресов.
+
+    Вместо send_token в цикле, где каждый перевод заново запрашивает комиссию, nonce и баланс и ждет включения
+    в блок, рассылка:
+    - один раз запрашивает комиссию и балансы всех токенов (Multicall3);
+    - оценивает газ всех переводов batch запросами по config.distribution_batch_size;
+    - подписывает переводы в пуле процессов (core/signer.py) и отправляет подряд с nonce от nonce_manager,
+      не дожидаясь включения в блок, держа не больше config.distribution_window неподтвержденных транзакций
+      (лимит мемпула на адрес); если отправка не прошла или самая старая транзакция окна не подтвердилась
+      (timeout, reverted), следующие переводы не отправляются;
+    - ждет квитанции всех транзакций через receipt_tracker и пишет результат по каждому получателю в файл.
+    """
+
+    RESULT_HEADER = ['Address', 'Token', 'Amount', 'Status', 'Tx Hash', 'Fee', 'Error']
+
+    def __init__(self, onchain: Onchain) -> None:
+        """
+        :param onchain: Onchain кошелька, с которого идет рассылка, в нужной сети
+        """
+        self.onchain = onchain
+
+    def run(self, transfers: list[Transfer], result_file: Optional[str] = 'distribution.xlsx') -> list[Transfer]:
+        """
+        Выполняет рассылку.
+        :param transfers: список переводов
+        :param result_file: имя файла результата в config/data, None - не записывать
+        :return: те же переводы с заполненным результатом
+        """
+        onchain = self.onchain
+        base_tx = onchain._prepare_tx()
+        self._estimate(transfers, base_tx)
+        self._check_balances(transfers, base_tx)
+
+        planned = [transfer for transfer in transfers if transfer.status == 'planned']
+        window: deque[tuple[Transfer, Future[TxResult], float]] = deque()
+        sent = []
+        # перевод, после неудачи которого отправка остановлена
+        stopped_by: Optional[Transfer] = None
+        # подпись идет в пуле процессов, пока отправляются уже подписанные
+        pipeline = SigningPipeline(onchain).run([transfer.tx for transfer in planned])
+        for index, tx_hash, error in pipeline:
+            transfer = planned[index]
+            if tx_hash is None:
+                transfer.status, transfer.error = 'failed', str(error) if error else 'не отправлен после ошибки'
+                continue
+            transfer.tx_hash, transfer.status = tx_hash, 'sent'
+            future = onchain.track(tx_hash)
+            deadline = time.monotonic() + config.receipt_timeout + RESULT_MARGIN
+            window.append((transfer, future, deadline))
+            sent.append((transfer, future, deadline))
+            # ждем подтверждения самой старой транзакции, если неподтвержденных слишком много
+            while len(window) >= config.distribution_window and stopped_by is None:
+                head, head_future, head_deadline = window.popleft()
+                result = self._wait(head, head_future, head_deadline)
+                # транзакция не подтверждена или откатилась: следующие, скорее всего, тоже застрянут или не пройдут
+                if result is None or not result.status:
+                    stopped_by = head
+            if stopped_by is not None:
+                break
+        # закрытие итератора возвращает nonce неотправленных транзакций
+        pipeline.close()
+        if stopped_by is not None:
+            not_sent = [transfer for transfer in planned if transfer.status == 'planned']
+            logger.error(f'{onchain.account.profile_number} Транзакция {stopped_by.tx_hash} не подтверждена, '
+                         f'рассылка остановлена, не отправлено {len(not_sent)} переводов')
+            for transfer in not_sent:
+                transfer.status = 'failed'
+                transfer.error = f'не отправлен: транзакция {stopped_by.tx_hash} не подтверждена'
+
+        logger.info(f'{onchain.account.profile_number} Отправлено {len(sent)} из {len(transfers)} переводов '
+                    f'в сети {onchain.chain.name}, ожидание подтверждений')
+        for transfer, future, deadline in sent:
+            result = self._wait(transfer, future, deadline)
+            if result is None:
+                continue
+            transfer.status = {True: 'success', False: 'reverted', None: 'timeout'}[result.status]
+            transfer.fee = result.fee if result.status is not None else None
+            transfer.error = result.error
+
+        success = sum(transfer.status == 'success' for transfer in transfers)
+        logger.success(f'{onchain.account.profile_number} Рассылка в сети {onchain.chain.name}: '
+                       f'успешно {success} из {len(transfers)}')
+        if result_file:
+            Excel(file=result_file).write_table(self.RESULT_HEADER, [t.to_row(onchain) for t in transfers])
+        return transfers
+
+    @staticmethod
+    def _wait(transfer: Transfer, future: Future[TxResult], deadline: float) -> Optional[TxResult]:
+        """
+        Ожидание результата перевода не дольше deadline. Если результата нет или receipt_tracker завершил
+        ожидание ошибкой, перевод помечается timeout: транзакция отправлена, но ее результат неизвестен.
+        :return: TxResult или None
+        """
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:
+            transfer.status = 'timeout'
+            transfer.error = f'результат транзакции не получен: {e!r}'
+            return None
+
+    def _build_tx(self, transfer: Transfer, base_tx: dict) -> dict:
+        """
+        Параметры транзакции перевода без газа и nonce.
+        """
+        tx = dict(base_tx)
+        if transfer.token is None:
+            tx['to'] = transfer.to_address
+            tx['value'] = transfer.amount.wei
+        else:
+            contract = self.onchain._get_contract(transfer.token)
+            tx['to'] = transfer.token.address
+            tx['data'] = contract.functions.transfer(transfer.to_address, transfer.amount.wei)._encode_transaction_data()
+        return tx
+
+    def _estimate(self, transfers: list[Transfer], base_tx: dict) -> None:
+        """
+        Оценка газа всех переводов batch запросами. Переводы, для которых оценка не прошла, помечаются failed.
+        """
+        w3 = self.onchain.w3
+        for transfer in transfers:
+            transfer.tx = self._build_tx(transfer, base_tx)
+
+        size = config.distribution_batch_size
+        for start in range(0, len(transfers), size):
+            chunk = transfers[start:start + size]
+            try:
+                gases = self.onchain._read_many(*[lambda batch_w3, tx=t.tx: batch_w3.eth.estimate_gas(tx) for t in chunk])
+            except Exception:
+                # одна из оценок не прошла, оцениваем по одному, чтобы найти ошибочные переводы
+                gases = []
+                for transfer in chunk:
+                    try:
+                        gases.append(w3.eth.estimate_gas(transfer.tx))
+                    except Exception as e:
+                        gases.append(None)
+                        transfer.status, transfer.error = 'failed', f'ошибка оценки газа: {e}'
+            for transfer, gas in zip(chunk, gases):
+                if gas is not None:
+                    transfer.tx['gas'] = int(gas * get_multiplayer())
+
+    def _check_balances(self, transfers: list[Transfer], base_tx: dict) -> None:
+        """
+        Проверяет баланс для всех переводов одним запросом Multicall3. Переводы по порядку, на которые
+        не хватает токенов или нативного токена на комиссию, помечаются skipped.
+        """
+        onchain = self.onchain
+        tokens = {transfer.token.address: transfer.token for transfer in transfers if transfer.token}
+        balances = onchain.get_balances([None] + list(tokens.values()))
+        address = onchain.account.address
+        left = {token_address: balances.get((address, token_address), Amount(0, wei=True)).wei
+                for token_address in [Tokens.NATIVE_TOKEN.address, *tokens]}
+        max_gas_price = base_tx.get('maxFeePerGas', base_tx.get('gasPrice', 0))
+
+        for transfer in transfers:
+            if transfer.status != 'planned':
+                continue
+            fee = transfer.tx['gas'] * max_gas_price
+            native_needed = fee + (transfer.amount.wei if transfer.token is None else 0)
+            token_address = transfer.token.address if transfer.token else None
+            if left[Tokens.NATIVE_TOKEN.address] < native_needed or (
+                    token_address and left[token_address] < transfer.amount.wei):
+                transfer.status, transfer.error = 'skipped', 'недостаточно средств'
+                continue
+            left[Tokens.NATIVE_TOKEN.address] -= native_needed
+            if token_address:
+                left[token_address] -= transfer.amount.wei
+
+        skipped = sum(transfer.status == 'skipped' for transfer in transfers)
+        if skipped:
+            logger.warning(f'{onchain.account.profile_number} Не хватает средств на {skipped} переводов, '
+                           f'они пропущены')
+
+
+def distribute(
+        onchain: Onchain,
+        transfers: list[tuple[str, Amount | int | float, Optional[Token]]],
+        result_file: Optional[str] = 'distribution.xlsx'
+) -> list[Transfer]:
+    """
+    Рассылка с кошелька onchain по списку (адрес, сумма, токен или None для нативного).
+
+        distribute(onchain, [(address, 0.001, None) for address in new_wallets])
+
+    :param onchain: Onchain кошелька, с которого идет рассылка
+    :param transfers: список (адрес получателя, сумма, Token или None)
+    :param result_file: имя файла результата в config/data, None - не записывать
+    :return: список Transfer с результатами
+    """
+    return Distribution(onchain).run([Transfer(*transfer) for transfer in transfers], result_file)
+
+
+if __name__ == '__main__':
+    pass
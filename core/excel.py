@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import threading
 from typing import Optional
 from datetime import datetime
 
@@ -10,6 +11,8 @@ import os
 from openpyxl.worksheet.worksheet import Worksheet
 from config import config
 from models.account import Account
+from utils.file_lock import FileLock
+from utils.metrics import metrics
 
 
 class Excel:
@@ -18,8 +21,18 @@ class Excel:
     По стандарту создает подключение к таблице 'config/data/accounts.xlsx'.
 
     Можно создать объект отдельно от бота, передав туда аккаунт и название таблицы.
+
+    Объекты Excel одного файла внутри процесса используют общую книгу, а запись идет под блокировкой файла,
+    чтобы несколько потоков (config.max_workers > 1) и процессов (config.shards > 1) не затирали записи друг друга.
+    Чтение тоже идет под этой блокировкой, перед каждым чтением и записью книга перечитывается,
+    если файл изменил другой процесс.
     """
 
+    # общие книги и блокировки по пути файла
+    _tables: dict[str, tuple[Workbook, tuple[int, int]]] = {}
+    _locks: dict[str, FileLock] = {}
+    _registry_lock = threading.Lock()
+
     def __init__(self, account: Optional[Account] = None, file: Optional[str] = None) -> None:
         """
         Инициализация класса
@@ -28,6 +41,7 @@ class Excel:
         """
         self.account = account
         self._file = self._get_file(file)
+        self._lock = self._get_lock(self._file)
         self._table = self._get_table()
         self._sheet: Worksheet = self._table.active
         if account:
@@ -41,7 +55,9 @@ class Excel:
         :return: None
         """
         self._file = os.path.join(config.PATH_DATA, table_name)
+        self._lock = self._get_lock(self._file)
         self._table = self._get_table()
+        self._sheet = self._table.active
 
     def connect_account(self, account: Account) -> None:
         """
@@ -64,17 +80,70 @@ class Excel:
         file = os.path.join(config.PATH_DATA, file)
         return file
 
+    @classmethod
+    def _get_lock(cls, file: str) -> FileLock:
+        """
+        Возвращает блокировку для файла, одну на процесс, lock-файл лежит рядом с таблицей.
+        :param file: путь к файлу
+        :return: блокировка
+        """
+        with cls._registry_lock:
+            if file not in cls._locks:
+                directory, name = os.path.split(file)
+                cls._locks[file] = FileLock(os.path.join(directory, f'.{name}.lock'))
+            return cls._locks[file]
+
     def _get_table(self) -> Workbook:
         """
         Получает таблицу из файла, если файла нет, создает его.
+        Если книга уже загружена в процессе и файл не менялся извне, возвращает загруженную книгу.
         :return: объект таблицы
         """
-        if not os.path.exists(self._file):  # Если файл не существует, создаем его
-            table = self._create_excel()
-        else:
-            table = load_workbook(self._file)
+        with self._lock:
+            if not os.path.exists(self._file):  # Если файл не существует, создаем его
+                table = self._create_excel()
+            else:
+                cached = self._tables.get(self._file)
+                if cached and cached[1] == self._file_stamp():
+                    return cached[0]
+                with metrics.timed('excel_load_seconds'):
+                    table = load_workbook(self._file)
+            self._tables[self._file] = (table, self._file_stamp())
         return table
 
+    def _file_stamp(self) -> tuple[int, int]:
+        """
+        Отпечаток файла (время изменения в наносекундах, размер), по нему определяется, менялся ли файл.
+        :return: кортеж (mtime_ns, size)
+        """
+        stat = os.stat(self._file)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> None:
+        """
+        Перечитывает книгу, если файл изменили после загрузки (другой процесс) или
+        другой объект Excel этого файла уже загрузил более свежую книгу.
+        Вызывать под блокировкой self._lock перед чтением или изменением таблицы, блокировку держать до конца
+        чтения, иначе другой поток или процесс может изменить книгу посреди него.
+        :return: None
+        """
+        cached = self._tables.get(self._file)
+        if not cached or not os.path.exists(self._file) or cached[1] != self._file_stamp():
+            self._table = self._get_table()
+        elif cached[0] is not self._table:
+            self._table = cached[0]
+        self._sheet = self._table.active
+
+    def _save(self) -> None:
+        """
+        Сохраняет таблицу в файл и запоминает отпечаток файла.
+        Вызывать под блокировкой self._lock.
+        :return: None
+        """
+        with metrics.timed('excel_save_seconds'):
+            self._table.save(self._file)
+        self._tables[self._file] = (self._table, self._file_stamp())
+
     def _create_excel(self) -> Workbook:
         """
         Создает excel файл и заполняет его стандартными заголовками.
@@ -97,13 +166,15 @@ class Excel:
         :param profile_number: номер профиля
         :return: номер строки
         """
-        for row in self._sheet.iter_rows(min_row=2, max_col=1):
-            if str(row[0].value) == profile_number:
-                return row[0].row
-        add_row = self._sheet.max_row + 1
-        self._sheet.cell(row=add_row, column=1, value=profile_number)
-        self._table.save(self._file)
-        return add_row
+        with self._lock:
+            self._refresh()
+            for row in self._sheet.iter_rows(min_row=2, max_col=1):
+                if str(row[0].value) == profile_number:
+                    return row[0].row
+            add_row = self._sheet.max_row + 1
+            self._sheet.cell(row=add_row, column=1, value=profile_number)
+            self._save()
+            return add_row
 
     def add_row(self, values: list) -> None:
         """
@@ -111,8 +182,26 @@ class Excel:
         :param values: список значений
         :return: None
         """
-        self._sheet.append(values)
-        self._table.save(self._file)
+        with self._lock:
+            self._refresh()
+            self._sheet.append(values)
+            self._save()
+
+    def write_table(self, header: list[str], rows: list[list]) -> None:
+        """
+        Перезаписывает лист таблицы заголовком и строками и сохраняет файл один раз.
+        Для отчетов, где значений много и сохранять книгу после каждой ячейки слишком долго.
+        :param header: названия столбцов
+        :param rows: список строк, каждая строка - список значений
+        :return: None
+        """
+        with self._lock:
+            self._refresh()
+            self._sheet.delete_rows(1, self._sheet.max_row)
+            self._sheet.append(header)
+            for row in rows:
+                self._sheet.append(row)
+            self._save()
 
     def set_cell(self, column_name: str, value: str | int | float, row: Optional[int] = None) -> None:
         """
@@ -125,9 +214,11 @@ class Excel:
         """
         row = self.acc_row if not row else row
 
-        col_num = self.find_column(column_name)
-        self._sheet.cell(row=row, column=col_num, value=value)
-        self._table.save(self._file)
+        with self._lock:
+            self._refresh()
+            col_num = self.find_column(column_name)
+            self._sheet.cell(row=row, column=col_num, value=value)
+            self._save()
 
     def add_column(self, column_name: str) -> int:
         """
@@ -135,10 +226,12 @@ class Excel:
         :param column_name: имя столбца
         :return: номер столбца
         """
-        col_num = self._sheet.max_column + 1
-        self._sheet.cell(row=1, column=col_num, value=column_name)
-        self._table.save(self._file)
-        return col_num
+        with self._lock:
+            self._refresh()
+            col_num = self._sheet.max_column + 1
+            self._sheet.cell(row=1, column=col_num, value=column_name)
+            self._save()
+            return col_num
 
     def find_column(self, column_name: str) -> int:
         """
@@ -146,12 +239,15 @@ class Excel:
         :param column_name: имя столбца
         :return: номер столбца
         """
-        for row in self._sheet.iter_rows(max_row=1):
-            for cell in row:
-                if cell.value == column_name:
-                    return cell.column
-        logger.warning(f'{self.account.profile_number} Столбец {column_name} не найден, создаем новый.')
-        return self.add_column(column_name)
+        with self._lock:
+            self._refresh()
+            for row in self._sheet.iter_rows(max_row=1):
+                for cell in row:
+                    if cell.value == column_name:
+                        return cell.column
+            profile_number = self.account.profile_number if self.account else ''
+            logger.warning(f'{profile_number} Столбец {column_name} не найден, создаем новый.')
+            return self.add_column(column_name)
 
     def get_cell(self, column_name: str, row: Optional[int] = None) -> str | int | None:
         """
@@ -162,9 +258,10 @@ class Excel:
         """
         row = self.acc_row if not row else row
 
-        col_num = self.find_column(column_name)
-
-        return self._sheet.cell(row=row, column=col_num).value
+        with self._lock:
+            self._refresh()
+            col_num = self.find_column(column_name)
+            return self._sheet.cell(row=row, column=col_num).value
 
     def get_column(self, column_name: str, is_empty_pass: bool = False) -> list[str | int | None]:
         """
@@ -173,14 +270,16 @@ class Excel:
         :param is_empty_pass: пропускать ли пустые ячейки
         :return: список значений столбца
         """
-        col_num = self.find_column(column_name)
         column_values = []
-        for raw in self._sheet.iter_cols(min_col=col_num, max_col=col_num, min_row=2):
-            for cell in raw:
-                if is_empty_pass and cell.value:
-                    column_values.append(cell.value)
-                elif not is_empty_pass:
-                    column_values.append(cell.value)
+        with self._lock:
+            self._refresh()
+            col_num = self.find_column(column_name)
+            for raw in self._sheet.iter_cols(min_col=col_num, max_col=col_num, min_row=2):
+                for cell in raw:
+                    if is_empty_pass and cell.value:
+                        column_values.append(cell.value)
+                    elif not is_empty_pass:
+                        column_values.append(cell.value)
 
         return column_values
 
@@ -192,9 +291,11 @@ class Excel:
         """
         row = self.acc_row if not row else row
         row_values = []
-        for raw in self._sheet.iter_rows(min_row=row, max_row=row):
-            for cell in raw:
-                row_values.append(cell.value)
+        with self._lock:
+            self._refresh()
+            for raw in self._sheet.iter_rows(min_row=row, max_row=row):
+                for cell in raw:
+                    row_values.append(cell.value)
 
         return row_values
 
@@ -207,23 +308,25 @@ class Excel:
         """
         row = self.acc_row if not row else row
 
-        col_num = self.find_column(column_name)
-        cell = self._sheet.cell(row=row, column=col_num)
-
-        if cell.value is None:
-            cell.value = 0
-            self._table.save(self._file)
-        elif isinstance(cell.value, str):
-            if cell.value.isdigit():
-                cell.value = int(cell.value)
-                self._table.save(self._file)
-            elif cell.value.replace('.', '', 1).isdigit():
-                cell.value = float(cell.value)
-                self._table.save(self._file)
-            else:
-                raise TypeError(f'Значение в столбце {column_name} не является числом')
-
-        return cell.value
+        with self._lock:
+            self._refresh()
+            col_num = self.find_column(column_name)
+            cell = self._sheet.cell(row=row, column=col_num)
+
+            if cell.value is None:
+                cell.value = 0
+                self._save()
+            elif isinstance(cell.value, str):
+                if cell.value.isdigit():
+                    cell.value = int(cell.value)
+                    self._save()
+                elif cell.value.replace('.', '', 1).isdigit():
+                    cell.value = float(cell.value)
+                    self._save()
+                else:
+                    raise TypeError(f'Значение в столбце {column_name} не является числом')
+
+            return cell.value
 
     def increase_counter(self, column_name: str, number: int = 1, row: Optional[int] = None) -> int:
         """
@@ -235,20 +338,22 @@ class Excel:
         """
         row = self.acc_row if not row else row
 
-        col_num = self.find_column(column_name)
-        cell = self._sheet.cell(row=row, column=col_num)
+        with self._lock:
+            self._refresh()
+            col_num = self.find_column(column_name)
+            cell = self._sheet.cell(row=row, column=col_num)
 
-        if cell.value is None:
-            cell.value = 0
-        elif isinstance(cell.value, str):
-            if cell.value.isdigit():
-                cell.value = int(cell.value)
-            else:
-                raise TypeError(f'Значение в столбце {column_name} не является числом')
+            if cell.value is None:
+                cell.value = 0
+            elif isinstance(cell.value, str):
+                if cell.value.isdigit():
+                    cell.value = int(cell.value)
+                else:
+                    raise TypeError(f'Значение в столбце {column_name} не является числом')
 
-        cell.value += number
-        self._table.save(self._file)
-        return cell.value
+            cell.value += number
+            self._save()
+            return cell.value
 
     def set_date(self, column_name: str, row: Optional[int] = None) -> None:
         """
@@ -260,10 +365,11 @@ class Excel:
         """
         row = self.acc_row if not row else row
 
-        col_num = self.find_column(column_name)
-
-        self._sheet.cell(row=row, column=col_num, value=datetime.now().strftime(config.date_format))
-        self._table.save(self._file)
+        with self._lock:
+            self._refresh()
+            col_num = self.find_column(column_name)
+            self._sheet.cell(row=row, column=col_num, value=datetime.now().strftime(config.date_format))
+            self._save()
 
     def get_date(self, column_name: str, row: Optional[int] = None) -> datetime:
         """
@@ -276,9 +382,11 @@ class Excel:
         """
         row = self.acc_row if not row else row
 
-        col_num = self.find_column(column_name)
+        with self._lock:
+            self._refresh()
+            col_num = self.find_column(column_name)
+            date_str = self._sheet.cell(row=row, column=col_num).value
 
-        date_str = self._sheet.cell(row=row, column=col_num).value
         if date_str:
             date_object = datetime.strptime(date_str, config.date_format)
             return date_object
@@ -289,23 +397,67 @@ class Excel:
     def get_counters(self, column_name: str) -> list[int | float]:
         """
         Возвращает список значений счетчиков из столбца.
-        Преобразует значения в числа, если это возможно.
+        Преобразует значения в числа, если это возможно, таблица при этом не изменяется и не сохраняется.
         Если ячейка пустая, возвращает 0.
         :param column_name: имя столбца
         :return: список значений счетчиков
         """
-        col_num = self.find_column(column_name)
-        column_values = []
-        for raw in self._sheet.iter_cols(min_col=col_num, max_col=col_num, min_row=2):
-            for cell in raw:
-                if cell.value is None:
-                    cell.value = 0
-                elif isinstance(cell.value, str):
-                    if cell.value.isdigit():
-                        cell.value = int(cell.value)
-                    if cell.value.replace('.', '', 1).isdigit():
-                        cell.value = float(cell.value)
-
-                column_values.append(cell.value)
-        self._table.save(self._file)
-        return column_values
+        return [self.to_number(value) for value in self.get_columns([column_name])[column_name]]
+
+    def get_columns(self, column_names: list[str]) -> dict[str, list[str | int | float | None]]:
+        """
+        Загружает несколько столбцов за один проход по таблице, без поиска строки аккаунта.
+        Если столбца нет в таблице, его значения будут None, столбец не создается.
+        Значения идут в порядке строк таблицы, начиная со второй строки.
+        :param column_names: имена столбцов
+        :return: словарь {имя столбца: список значений}
+        """
+        with self._lock:
+            self._refresh()
+            header = next(self._sheet.iter_rows(max_row=1, values_only=True), ())
+            indexes = {name: header.index(name) if name in header else None for name in column_names}
+            columns = {name: [] for name in column_names}
+            for row in self._sheet.iter_rows(min_row=2, values_only=True):
+                for name, index in indexes.items():
+                    columns[name].append(row[index] if index is not None and index < len(row) else None)
+            return columns
+
+    @staticmethod
+    def to_number(value: str | int | float | None) -> int | float:
+        """
+        Преобразует значение ячейки счетчика в число, пустая ячейка - 0.
+        :param value: значение ячейки
+        :return: число
+        """
+        if value is None or value == '':
+            return 0
+        if isinstance(value, str):
+            if value.isdigit():
+                return int(value)
+            if value.replace('.', '', 1).isdigit():
+                return float(value)
+            raise TypeError(f'Значение {value} не является числом')
+        return value
+
+    @staticmethod
+    def parse_dates(values: list[str | datetime | None]) -> list[datetime]:
+        """
+        Преобразует значения столбца с датами в datetime за один проход, одинаковые строки парсятся один раз.
+        Пустые ячейки становятся старой датой (2000 год), как в get_date.
+        Формат даты настраивается в файле config/settings.py
+        :param values: значения ячеек
+        :return: список дат
+        """
+        empty_date = datetime.now().replace(year=2000)
+        parsed: dict[str, datetime] = {}
+        dates = []
+        for value in values:
+            if not value:
+                dates.append(empty_date)
+            elif isinstance(value, datetime):
+                dates.append(value)
+            else:
+                if value not in parsed:
+                    parsed[value] = datetime.strptime(value, config.date_format)
+                dates.append(parsed[value])
+        return dates
@@ -14,10 +14,12 @@ from config import config
 from loguru import logger
 
 from core.exchanges.abs_exchange import AbsExchange
+from core.watchdog import watchdog
 from models.account import Account
 from models.amount import Amount
 from models.chain import Chain
 from models.token import Token
+from utils.metrics import metrics
 from utils.utils import random_sleep, prepare_proxy_requests
 
 
@@ -61,7 +63,8 @@ class Binance(AbsExchange):
             params = dict()
         self._sign_params(params)
         url = self._endpoint + path
-        response = requests.get(url, headers=self._headers, params=params, proxies=self._proxies)
+        with metrics.timed('exchange_request_seconds', exchange='binance', path=path):
+            response = requests.get(url, headers=self._headers, params=params, proxies=self._proxies)
         try:
             response.raise_for_status()
             response_json = response.json()
@@ -83,7 +86,8 @@ class Binance(AbsExchange):
 
         self._sign_params(params)
         url = self._endpoint + path
-        response = requests.post(url, params=params, headers=self._headers, proxies=self._proxies)
+        with metrics.timed('exchange_request_seconds', exchange='binance', path=path):
+            response = requests.post(url, params=params, headers=self._headers, proxies=self._proxies)
         try:
             response.raise_for_status()
             response_json = response.json()
@@ -188,13 +192,15 @@ class Binance(AbsExchange):
         """
         path = '/sapi/v1/capital/withdraw/history'
 
-        for _ in range(timeout):
-            withdraws = self._get_request(path)
-            for withdraw_info in withdraws:
-                if withdraw_info.get('id') == withdraw_id:
-                    status = withdraw_info.get('status')
-                    if status == 6:
-                        return
-            random_sleep(10)
-        else:
-            raise Exception(f'Таймаут вывода средств на Binance, id: {withdraw_id}')
+        # общее время ожидания ограничено config.timeouts['withdraw_wait']
+        with watchdog.deadline('withdraw_wait', account=self.account):
+            for _ in range(timeout):
+                withdraws = self._get_request(path)
+                for withdraw_info in withdraws:
+                    if withdraw_info.get('id') == withdraw_id:
+                        status = withdraw_info.get('status')
+                        if status == 6:
+                            return
+                random_sleep(10)
+            else:
+                raise Exception(f'Таймаут вывода средств на Binance, id: {withdraw_id}')
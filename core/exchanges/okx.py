@@ -14,10 +14,12 @@ from config import config
 from loguru import logger
 
 from core.exchanges.abs_exchange import AbsExchange
+from core.watchdog import watchdog
 from models.account import Account
 from models.amount import Amount
 from models.chain import Chain
 from models.token import Token
+from utils.metrics import metrics
 from utils.utils import random_sleep, prepare_proxy_requests
 
 
@@ -73,7 +75,8 @@ class Okx(AbsExchange):
         """
         url = self._endpoint + path
         headers = self._get_headers('GET', path)
-        response = requests.get(url, headers=headers, proxies=self._proxies)
+        with metrics.timed('exchange_request_seconds', exchange='okx', path=path.split('?')[0]):
+            response = requests.get(url, headers=headers, proxies=self._proxies)
         response.raise_for_status()
         response_json = response.json()
         if response_json.get('code') != '0':
@@ -90,7 +93,8 @@ class Okx(AbsExchange):
         """
         url = self._endpoint + path
         headers = self._get_headers('POST', path, body)
-        response = requests.post(url, headers=headers, json=body, proxies=self._proxies)
+        with metrics.timed('exchange_request_seconds', exchange='okx', path=path):
+            response = requests.post(url, headers=headers, json=body, proxies=self._proxies)
         response.raise_for_status()
         response_json = response.json()
         if response_json.get('code') != '0':
@@ -213,19 +217,21 @@ class Okx(AbsExchange):
         """
         path = f'/api/v5/asset/withdrawal-history?wdId={withdraw_id}'
 
-        for _ in range(timeout):
-            response_json = self._get_request(path)
-            status = str(response_json.get('data', [{}])[0].get('state', -4))
-            match status:
-                case '2': # успешно
-                    return
-                case '-1': # неудача
-                    raise Exception(f'Статус вывода средств id: {withdraw_id} на OKX -1 - неудача')
-                case '-2':
-                    raise Exception(f'Статус вывода средств id: {withdraw_id} на OKX -2 - отклонено')
-            random_sleep(10)
-        else:
-            raise Exception(f'Таймаут вывода средств на OKX, id: {withdraw_id}')
+        # общее время ожидания ограничено config.timeouts['withdraw_wait']
+        with watchdog.deadline('withdraw_wait', account=self.account):
+            for _ in range(timeout):
+                response_json = self._get_request(path)
+                status = str(response_json.get('data', [{}])[0].get('state', -4))
+                match status:
+                    case '2': # успешно
+                        return
+                    case '-1': # неудача
+                        raise Exception(f'Статус вывода средств id: {withdraw_id} на OKX -1 - неудача')
+                    case '-2':
+                        raise Exception(f'Статус вывода средств id: {withdraw_id} на OKX -2 - отклонено')
+                random_sleep(10)
+            else:
+                raise Exception(f'Таймаут вывода средств на OKX, id: {withdraw_id}')
 
 
     def _get_sub_accs(self) -> list[dict]:
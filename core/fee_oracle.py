@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from config.settings import config
+from utils.metrics import metrics
+
+# виды данных о комиссии: fee_history для сетей с EIP-1559, gas_price для остальных и для get_gas_price
+FEE_HISTORY = 'fee_history'
+GAS_PRICE = 'gas_price'
+
+
+class _FeeEntry:
+    def __init__(self) -> None:
+        self.value: Any = None
+        self.fetched = 0.0
+        # один поток запрашивает данные, остальные ждут его результат, а не делают такой же запрос
+        self.lock = threading.Lock()
+
+
+class FeeOracle:
+    """
+    Общий для процесса кеш данных о комиссии по сетям.
+
+    Все аккаунты одной сети получают fee_history и gas_price из памяти, запрос к rpc делается не чаще одного раза
+    в config.fee_cache_ttl секунд (примерно раз в блок) на сеть. Если данных нет или они устарели, запрос делает
+    один поток, остальные потоки этой сети ждут его ответ.
+
+    Множители комиссии применяются в Onchain после получения данных, поэтому у каждого аккаунта они по-прежнему свои.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple[str, str], _FeeEntry] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, chain: str, kind: str) -> _FeeEntry:
+        key = (chain, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _FeeEntry()
+            return entry
+
+    @staticmethod
+    def _ttl(chain: str) -> float:
+        ttl = config.fee_cache_ttl
+        return ttl.get(chain, ttl.get('default', 0)) if isinstance(ttl, dict) else ttl
+
+    def _count(self, chain: str, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.inc('fee_oracle_total', chain=chain, result='hit' if hit else 'miss')
+
+    def cached(self, chain: str, kind: str) -> Optional[Any]:
+        """
+        Возвращает актуальные данные из кеша без запроса к rpc.
+        Используется, когда запрос комиссии нужно добавить в общий batch запрос, только если данных нет.
+        :param chain: название сети
+        :param kind: FEE_HISTORY или GAS_PRICE
+        :return: данные или None, если их нет или они устарели
+        """
+        entry = self._entry(chain, kind)
+        if entry.value is not None and time.monotonic() - entry.fetched < self._ttl(chain):
+            self._count(chain, hit=True)
+            return entry.value
+        return None
+
+    def put(self, chain: str, kind: str, value: Any) -> None:
+        """
+        Сохраняет данные, полученные вызывающим кодом.
+        :param chain: название сети
+        :param kind: FEE_HISTORY или GAS_PRICE
+        :param value: результат fee_history или gas_price
+        :return: None
+        """
+        entry = self._entry(chain, kind)
+        entry.value, entry.fetched = value, time.monotonic()
+        self._count(chain, hit=False)
+
+    def get(self, chain: str, kind: str, fetch: Callable[[], Any]) -> Any:
+        """
+        Возвращает данные из кеша или запрашивает их через fetch.
+        :param chain: название сети
+        :param kind: FEE_HISTORY или GAS_PRICE
+        :param fetch: функция запроса к rpc
+        :return: результат fee_history или gas_price
+        """
+        value = self.cached(chain, kind)
+        if value is not None:
+            return value
+        entry = self._entry(chain, kind)
+        with entry.lock:
+            # пока ждали блокировку, данные мог обновить другой поток
+            value = self.cached(chain, kind)
+            if value is not None:
+                return value
+            value = fetch()
+            self.put(chain, kind, value)
+            return value
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        Доля ответов из кеша от 0 до 1.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict[str, int | float]:
+        """
+        :return: словарь hits, misses, hit_ratio
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': round(self.hit_ratio, 3)}
+
+
+# общий кеш комиссий процесса
+fee_oracle = FeeOracle()
+
+
+if __name__ == '__main__':
+    pass
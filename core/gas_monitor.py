@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Optional
+
+from loguru import logger
+
+from config.settings import config
+from core.fee_oracle import fee_oracle, GAS_PRICE
+from core.watchdog import watchdog
+from utils.metrics import metrics
+
+
+class _Waiter:
+    def __init__(self, limit: float) -> None:
+        self.limit = limit
+        self.event = threading.Event()
+        self.price: Optional[float] = None
+
+
+class _ChainGas:
+    """
+    Ожидающие снижения газа в одной сети и поток, который опрашивает ставку газа, пока есть ожидающие.
+    """
+
+    def __init__(self, chain: str) -> None:
+        self.chain = chain
+        self.fetch: Optional[Callable[[], int]] = None
+        self.price: Optional[float] = None  # последняя ставка газа в gwei
+        self.updated = 0.0
+        # куча по убыванию лимита: при снижении газа первыми отпускаются ожидающие с самым высоким лимитом
+        self.waiters: list[tuple[float, int, _Waiter]] = []
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+
+class GasMonitor:
+    """
+    Общее для процесса ожидание снижения ставки газа.
+
+    Вместо того чтобы каждый аккаунт опрашивал eth_gasPrice каждые 5-10 секунд, ожидающие регистрируются со своим
+    лимитом, а один поток на сеть опрашивает ставку раз в config.gas_monitor_interval секунд и будит всех, чей лимит
+    не меньше текущей ставки, в порядке убывания лимита. Когда ожидающих в сети нет, поток завершается.
+    """
+
+    def __init__(self) -> None:
+        self._chains: dict[str, _ChainGas] = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def _chain(self, chain: str) -> _ChainGas:
+        with self._lock:
+            state = self._chains.get(chain)
+            if state is None:
+                state = self._chains[chain] = _ChainGas(chain)
+            return state
+
+    def wait(self, chain: str, fetch: Callable[[], int], limit: float, timeout: Optional[float] = None) -> float:
+        """
+        Ожидает, пока ставка газа в сети не станет не больше лимита.
+        :param chain: название сети
+        :param fetch: функция, возвращающая ставку газа в wei, например lambda: w3.eth.gas_price
+        :param limit: лимит ставки газа в gwei
+        :param timeout: максимальное время ожидания в секундах, None - без ограничения
+        :return: ставка газа в gwei, при которой закончилось ожидание
+        """
+        state = self._chain(chain)
+        waiter = _Waiter(limit)
+        with state.lock:
+            state.fetch = fetch
+            # свежая ставка уже известна и подходит - не ждем и не запускаем опрос
+            if (state.price is not None and state.price <= limit
+                    and time.monotonic() - state.updated < config.gas_monitor_interval):
+                return state.price
+            heapq.heappush(state.waiters, (-limit, next(self._counter), waiter))
+            metrics.inc('gas_monitor_waiters_total', chain=chain)
+            if state.thread is None:
+                state.thread = threading.Thread(target=self._poll, args=(state,), name=f'gas-monitor-{chain}',
+                                                daemon=True)
+                state.thread.start()
+
+        # ожидание шагами, чтобы ограничение времени этапа (core/watchdog.py) прерывало его
+        try:
+            done = watchdog.wait(waiter.event, timeout)
+        except BaseException:
+            self._remove(state, waiter)
+            raise
+        if not done:
+            self._remove(state, waiter)
+            raise TimeoutError(f'Газ в сети {chain} не опустился до {limit} gwei за {timeout} секунд')
+        return waiter.price
+
+    @staticmethod
+    def _remove(state: _ChainGas, waiter: _Waiter) -> None:
+        """
+        Убирает ожидающего, который перестал ждать (таймаут или исключение).
+        :param state: состояние сети
+        :param waiter: ожидающий
+        :return: None
+        """
+        with state.lock:
+            state.waiters = [item for item in state.waiters if item[2] is not waiter]
+            heapq.heapify(state.waiters)
+
+    def _poll(self, state: _ChainGas) -> None:
+        """
+        Поток опроса ставки газа одной сети, работает, пока есть ожидающие.
+        :param state: состояние сети
+        :return: None
+        """
+        while True:
+            try:
+                price = fee_oracle.get(state.chain, GAS_PRICE, state.fetch) / 10 ** 9
+            except Exception as e:
+                logger.warning(f'Ошибка получения ставки газа в сети {state.chain}: {e}')
+                price = None
+
+            with state.lock:
+                if price is not None:
+                    state.price, state.updated = price, time.monotonic()
+                    # отпускаем ожидающих от самого высокого лимита, пока лимит не меньше ставки
+                    while state.waiters and -state.waiters[0][0] >= price:
+                        _, _, waiter = heapq.heappop(state.waiters)
+                        waiter.price = price
+                        waiter.event.set()
+                if not state.waiters:
+                    state.thread = None
+                    return
+                waiting = len(state.waiters)
+            logger.debug(f'Газ в сети {state.chain} {price} gwei, ожидают {waiting}')
+            time.sleep(config.gas_monitor_interval)
+
+
+# общий монитор газа процесса
+gas_monitor = GasMonitor()
+
+
+if __name__ == '__main__':
+    pass
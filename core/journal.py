@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Optional
+
+from loguru import logger
+
+from config import config
+from models.account import Account
+
+
+class CycleJournal:
+    """
+    Журнал цикла для продолжения работы после падения скрипта.
+
+    Файл в формате JSON Lines, только дописывается, каждая запись сбрасывается на диск (fsync):
+    - {"event": "cycle", "cycle": 3, "order": ["1", "5", "2"]} - начало цикла и порядок аккаунтов после перемешивания
+    - {"event": "done", "profile": "5"} - аккаунт обработан
+    - {"event": "end"} - цикл завершен
+
+    При старте main() читает журнал, если последний цикл не завершен, продолжает его с тем же порядком аккаунтов,
+    пропуская уже обработанные.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """
+        :param path: путь к файлу журнала, если не указан, берется config.PATH_JOURNAL
+        """
+        self.path = path or config.PATH_JOURNAL
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _read(self) -> list[dict]:
+        """
+        Читает записи журнала, недописанную последнюю строку (падение во время записи) пропускает.
+        :return: список записей
+        """
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f'Журнал цикла: пропущена поврежденная запись {line.strip()[:100]}')
+        return records
+
+    def resume(self, accounts: list[Account]) -> tuple[int, list[Account]] | None:
+        """
+        Проверяет, есть ли незавершенный цикл в журнале.
+        :param accounts: все аккаунты
+        :return: номер незавершенного цикла и оставшиеся аккаунты в сохраненном порядке, либо None
+        """
+        records = self._read()
+        if not records or records[0].get('event') != 'cycle' or records[-1].get('event') == 'end':
+            return None
+
+        cycle = records[0]['cycle']
+        done = {record['profile'] for record in records if record.get('event') == 'done'}
+        by_profile = {str(account.profile_number): account for account in accounts}
+        remaining = [by_profile[profile] for profile in records[0]['order']
+                     if profile not in done and profile in by_profile]
+        logger.info(f'Продолжаем цикл {cycle + 1} из журнала: обработано {len(done)}, осталось {len(remaining)}')
+        return cycle, remaining
+
+    def begin_cycle(self, cycle: int, accounts: list[Account]) -> None:
+        """
+        Начинает новый цикл: атомарно перезаписывает журнал заголовком с порядком аккаунтов.
+        :param cycle: номер цикла, с 0
+        :param accounts: аккаунты цикла в порядке обработки
+        :return: None
+        """
+        header = {'event': 'cycle', 'cycle': cycle, 'order': [str(account.profile_number) for account in accounts]}
+        tmp_path = self.path + '.tmp'
+        with self._lock:
+            self._close()
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(json.dumps(header) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def continue_cycle(self) -> None:
+        """
+        Открывает журнал незавершенного цикла для дозаписи.
+        :return: None
+        """
+        with self._lock:
+            self._close()
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def mark_done(self, account: Account) -> None:
+        """
+        Записывает в журнал, что аккаунт обработан в текущем цикле. Потокобезопасно.
+        :param account: аккаунт
+        :return: None
+        """
+        self._append({'event': 'done', 'profile': str(account.profile_number)})
+
+    def end_cycle(self) -> None:
+        """
+        Записывает завершение цикла и закрывает файл.
+        :return: None
+        """
+        self._append({'event': 'end'})
+        with self._lock:
+            self._close()
+
+    def _append(self, record: dict) -> None:
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+if __name__ == '__main__':
+    pass
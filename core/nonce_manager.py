@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable, Optional
+
+from loguru import logger
+
+# тексты ошибок rpc о неверном nonce у разных нод
+NONCE_ERRORS = ('nonce too low', 'nonce too high', 'invalid nonce', 'nonce has already been used',
+                'replacement transaction underpriced')
+# тексты ошибок rpc о том, что эта же транзакция уже есть в мемпуле
+KNOWN_TX_ERRORS = ('already known', 'known transaction', 'already imported')
+
+
+def is_nonce_error(error: Exception) -> bool:
+    """
+    Проверяет, что ошибка отправки транзакции связана с nonce.
+    :param error: исключение
+    :return: True, если ошибка nonce
+    """
+    message = str(error).lower()
+    return any(text in message for text in NONCE_ERRORS)
+
+
+def is_already_known(error: Exception) -> bool:
+    """
+    Проверяет, что rpc отклонил транзакцию, потому что она уже есть в мемпуле, то есть отправка уже прошла.
+    :param error: исключение
+    :return: True, если транзакция уже известна rpc
+    """
+    message = str(error).lower()
+    return any(text in message for text in KNOWN_TX_ERRORS)
+
+
+def is_send_uncertain(error: Exception) -> bool:
+    """
+    Проверяет, что ошибка отправки сетевая (таймаут, обрыв соединения), а не ответ rpc: транзакция могла
+    дойти до мемпула, поэтому ее nonce нельзя выдавать другой транзакции.
+    :param error: исключение
+    :return: True, если неизвестно, отправлена ли транзакция
+    """
+    # исключения requests и socket - наследники OSError
+    return isinstance(error, OSError)
+
+
+class _NonceState:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.synced = False
+        self.next_nonce = 0
+        # выданные, но не использованные nonce ниже next_nonce, выдаются повторно в первую очередь
+        self.gaps: set[int] = set()
+
+
+class NonceManager:
+    """
+    Локальная выдача nonce по (chain_id, адрес), общая для процесса.
+
+    При первой выдаче и после ошибок nonce синхронизируется с количеством транзакций в статусе pending,
+    дальше nonce выдаются подряд без запросов к rpc, поэтому несколько транзакций одного аккаунта
+    можно отправить друг за другом, не дожидаясь включения в блок.
+
+    Если транзакция не была отправлена, nonce возвращается через release: последний выданный nonce
+    откатывается, а более ранний запоминается как пропуск и выдается следующей транзакции,
+    чтобы в очереди аккаунта не было дыр, из-за которых все следующие транзакции зависнут.
+    """
+
+    def __init__(self) -> None:
+        self._states: dict[tuple[int, str], _NonceState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, chain_id: int, address: str) -> _NonceState:
+        key = (chain_id, address.lower())
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _NonceState()
+            return state
+
+    def is_synced(self, chain_id: int, address: str) -> bool:
+        return self._state(chain_id, address).synced
+
+    def sync(self, chain_id: int, address: str, pending_count: int) -> None:
+        """
+        Синхронизирует nonce с количеством транзакций адреса в статусе pending.
+        Если локальный nonce больше, значит часть отправленных транзакций выпала из мемпула или не была отправлена,
+        nonce откатывается, чтобы закрыть дыру.
+        :param chain_id: id сети
+        :param address: адрес кошелька
+        :param pending_count: результат get_transaction_count(address, 'pending')
+        :return: None
+        """
+        state = self._state(chain_id, address)
+        with state.lock:
+            self._sync_locked(state, chain_id, address, pending_count)
+
+    @staticmethod
+    def _sync_locked(state: _NonceState, chain_id: int, address: str, pending_count: int) -> None:
+        if state.synced and pending_count < state.next_nonce:
+            logger.warning(f'{address} сеть {chain_id}: пропуск nonce {pending_count}..{state.next_nonce - 1}, '
+                           f'транзакции не дошли до мемпула, nonce откатывается до {pending_count}')
+        state.next_nonce = pending_count
+        state.gaps.clear()
+        state.synced = True
+
+    def allocate(
+            self,
+            chain_id: int,
+            address: str,
+            fetch_pending: Callable[[], int],
+    ) -> int:
+        """
+        Выдает следующий nonce. Если nonce еще не синхронизирован, запрашивает pending через fetch_pending.
+        :param chain_id: id сети
+        :param address: адрес кошелька
+        :param fetch_pending: функция, возвращающая get_transaction_count(address, 'pending')
+        :return: nonce
+        """
+        state = self._state(chain_id, address)
+        with state.lock:
+            if not state.synced:
+                self._sync_locked(state, chain_id, address, fetch_pending())
+            if state.gaps:
+                nonce = min(state.gaps)
+                state.gaps.discard(nonce)
+                return nonce
+            nonce = state.next_nonce
+            state.next_nonce += 1
+            return nonce
+
+    def release(self, chain_id: int, address: str, nonce: int) -> None:
+        """
+        Возвращает nonce транзакции, которая не была отправлена.
+        :param chain_id: id сети
+        :param address: адрес кошелька
+        :param nonce: выданный nonce
+        :return: None
+        """
+        state = self._state(chain_id, address)
+        with state.lock:
+            if nonce >= state.next_nonce:
+                return
+            if nonce == state.next_nonce - 1:
+                state.next_nonce -= 1
+                # после отката последние пропуски тоже становятся концом очереди
+                while state.next_nonce - 1 in state.gaps:
+                    state.gaps.discard(state.next_nonce - 1)
+                    state.next_nonce -= 1
+            else:
+                state.gaps.add(nonce)
+
+    def reset(self, chain_id: int, address: str, fetch_pending: Optional[Callable[[], int]] = None) -> None:
+        """
+        Сбрасывает nonce после ошибки nonce от rpc, при следующей выдаче или сразу (если передан fetch_pending)
+        nonce будет синхронизирован с pending.
+        :param chain_id: id сети
+        :param address: адрес кошелька
+        :param fetch_pending: функция, возвращающая get_transaction_count(address, 'pending')
+        :return: None
+        """
+        state = self._state(chain_id, address)
+        with state.lock:
+            if fetch_pending is not None:
+                self._sync_locked(state, chain_id, address, fetch_pending())
+            else:
+                state.synced = False
+                state.gaps.clear()
+
+
+# общий менеджер nonce процесса
+nonce_manager = NonceManager()
+
+
+if __name__ == '__main__':
+    pass
@@ -1,24 +1,95 @@
 from __future__ import annotations
 
-from typing import Optional
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
 
+from eth_abi import decode
 from eth_account import Account as EthAccount
 from eth_typing import ChecksumAddress
 from loguru import logger
 from web3 import Web3
 from web3.contract import Contract
-
-from config import config, Tokens, Chains
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+from config import config, Tokens, Chains, Contracts
+from core.approval_indexer import get_approval_indexer
+from core.contract_cache import contract_cache
+from core.fee_oracle import fee_oracle, FEE_HISTORY, GAS_PRICE
+from core.gas_monitor import gas_monitor
+from core.nonce_manager import nonce_manager, is_nonce_error, is_already_known, is_send_uncertain
+from core.providers import providers, batch_web3
+from core.receipt_tracker import receipt_tracker
+from core.signer import SigningPipeline
+from core.token_cache import token_cache
 from models.account import Account
 from models.amount import Amount
 from models.chain import Chain
 from models.contract_raw import ContractRaw
 from models.token import Token, TokenTypes
-from utils.utils import to_checksum, random_sleep, get_multiplayer, prepare_proxy_requests, get_user_agent, \
-    get_response
+from models.tx_result import TxResult
+from utils.metrics import metrics
+from utils.utils import to_checksum, get_multiplayer
+
+
+# селекторы функций для ручного кодирования вызовов в multicall
+BALANCE_OF_SELECTOR = '70a08231'  # balanceOf(address)
+GET_ETH_BALANCE_SELECTOR = '4d2301cc'  # getEthBalance(address) у Multicall3
+SYMBOL_SELECTOR = '95d89b41'  # symbol()
+DECIMALS_SELECTOR = '313ce567'  # decimals()
+ALLOWANCE_SELECTOR = 'dd62ed3e'  # allowance(address,address)
+# размер одного вызова в calldata aggregate3: 4 слова структуры + длина bytes + 36 байт данных (2 слова)
+MULTICALL_CALL_SIZE = 7 * 32
+# тексты ошибок оценки газа, при которых транзакция рассылки не помещается в лимит газа блока или rpc
+GAS_LIMIT_ERRORS = ('exceeds block gas limit', 'gas limit reached', 'gas required exceeds', 'out of gas',
+                    'gas limit too high')
+# тексты ошибок, которыми rpc отклоняет сам batch запрос (а не отдельные запросы в нем)
+BATCH_ERRORS = ('batch', 'invalid request', '-32600', 'must be a list', 'not supported')
+# через сколько секунд снова пробовать batch на rpc, который его отклонил
+NO_BATCH_TTL = 3600
+
+
+def is_gas_limit_error(error: Exception) -> bool:
+    """
+    Проверяет, что оценка газа не прошла из-за лимита газа, а не из-за других причин.
+    :param error: исключение
+    :return: True, если ошибка лимита газа
+    """
+    message = str(error).lower()
+    return any(text in message for text in GAS_LIMIT_ERRORS)
+
+
+def is_batch_error(error: Exception) -> bool:
+    """
+    Проверяет, что rpc отклонил JSON-RPC batch запрос целиком, а не вернул временную ошибку.
+    :param error: исключение
+    :return: True, если rpc не принимает batch
+    """
+    message = str(error).lower()
+    return any(text in message for text in BATCH_ERRORS)
+
+
+def _decode_symbol(data: bytes) -> Optional[str]:
+    """
+    Декодирует результат symbol(): string по ABI или bytes32, как у старых токенов (например MKR).
+    :param data: результат вызова
+    :return: символ токена или None, если данные не похожи на символ
+    """
+    try:
+        return decode(['string'], data)[0]
+    except Exception:
+        pass
+    if len(data) == 32:
+        return data.rstrip(b'\0').decode('utf-8', errors='ignore') or None
+    return None
 
 
 class Onchain:
+    # сети, где нет Multicall3 или rpc не выполняет aggregate3, в них get_balances делает запросы по одному
+    _no_multicall: set[str] = set()
+    # rpc, которые не принимают JSON-RPC batch запросы, и до какого времени (time.monotonic) не пробовать batch на них
+    _no_batch: dict[str, float] = {}
+
     def __init__(self, account: Account, chain: Chain):
         self.account = account
         self.chain = chain
@@ -30,16 +101,13 @@ class Onchain:
                 self.account.address = self.w3.eth.account.from_key(self.account.private_key).address
 
     def _prepare_w3(self, chain: Chain) -> Web3:
-        request_kwargs = {
-            'headers': {
-                'User-Agent': get_user_agent(),
-                "Content-Type": "application/json",
-            },
-            'proxies': None
-        }
-        if config.is_web3_proxy:
-            request_kwargs['proxies'] = prepare_proxy_requests(self.account.proxy)
-        self.w3 = Web3(Web3.HTTPProvider(chain.rpc, request_kwargs=request_kwargs))
+        """
+        Берет Web3 для сети из общего реестра провайдеров, соединения с rpc переиспользуются между аккаунтами.
+        :param chain: объект Chain
+        :return: объект Web3
+        """
+        proxy = self.account.proxy if config.is_web3_proxy else None
+        self.w3 = providers.get_for_chain(chain, proxy)
         return self.w3
 
     def change_chain(self, chain: Chain):
@@ -52,6 +120,7 @@ class Onchain:
         self.w3 = self._prepare_w3(chain)
 
 
+    @metrics.timed('onchain_seconds')
     def _get_token_params(self, token_address: str | ChecksumAddress) -> tuple[str, int]:
         """
         Получение параметров токена (symbol, decimals) по адресу контракта токена
@@ -63,20 +132,141 @@ class Onchain:
         if token_contract_address == Tokens.NATIVE_TOKEN.address:
             return self.chain.native_token, Tokens.NATIVE_TOKEN.decimals
 
-        token_contract_raw = ContractRaw(token_contract_address, 'erc20', self.chain)
-        token_contract = self._get_contract(token_contract_raw)
-        decimals = token_contract.functions.decimals().call()
-        symbol = token_contract.functions.symbol().call()
-        return symbol, decimals
+        params = token_cache.get(self.chain.chain_id, token_contract_address)
+        if params is not None:
+            return params
+        return self.get_tokens_params([token_contract_address])[token_contract_address]
+
+    @metrics.timed('onchain_seconds')
+    def get_tokens_params(
+            self,
+            token_addresses: list[str | ChecksumAddress]
+    ) -> dict[ChecksumAddress, tuple[str, int]]:
+        """
+        Получение параметров нескольких токенов (symbol, decimals). Токены из token_cache берутся без запросов,
+        остальные запрашиваются одним вызовом Multicall3 aggregate3 и сохраняются в token_cache.
+        Если в сети нет Multicall3, параметры запрашиваются по одному.
+        :param token_addresses: адреса контрактов токенов текущей сети
+        :return: словарь {адрес токена: (symbol, decimals)}
+        """
+        params = {}
+        missing = []
+        for address in dict.fromkeys(to_checksum(address) for address in token_addresses):
+            if address == Tokens.NATIVE_TOKEN.address:
+                params[address] = (self.chain.native_token, Tokens.NATIVE_TOKEN.decimals)
+                continue
+            cached = token_cache.get(self.chain.chain_id, address)
+            if cached is None:
+                missing.append(address)
+            else:
+                params[address] = cached
+        if not missing:
+            return params
+
+        fetched = {}
+        failed = missing
+        if self.chain.name not in self._no_multicall:
+            multicall = self._get_contract(Contracts.MULTICALL3)
+            calls = []
+            for address in missing:
+                calls.append((address, True, bytes.fromhex(SYMBOL_SELECTOR)))
+                calls.append((address, True, bytes.fromhex(DECIMALS_SELECTOR)))
+            try:
+                results = multicall.functions.aggregate3(calls).call()
+                failed = []
+                for i, address in enumerate(missing):
+                    (symbol_ok, symbol_data), (decimals_ok, decimals_data) = results[2 * i], results[2 * i + 1]
+                    symbol = _decode_symbol(symbol_data) if symbol_ok else None
+                    if symbol is None or not decimals_ok or len(decimals_data) != 32:
+                        failed.append(address)
+                        continue
+                    fetched[address] = (symbol, int.from_bytes(decimals_data, 'big'))
+            except Exception as e:
+                logger.warning(f'Ошибка Multicall3 в сети {self.chain.name}, параметры токенов запрашиваются '
+                               f'по одному: {e}')
+
+        for address in failed:
+            token_contract = self._get_contract(ContractRaw(address, 'erc20', self.chain))
+            fetched[address] = (token_contract.functions.symbol().call(), token_contract.functions.decimals().call())
+
+        token_cache.put_many(self.chain.chain_id, fetched)
+        params.update(fetched)
+        return params
+
+    def _native_token(self) -> Token:
+        """
+        Нативный токен текущей сети. Создается новый объект на каждый вызов, общий Tokens.NATIVE_TOKEN не изменяется,
+        так как методы разных аккаунтов и сетей выполняются параллельно.
+        :return: объект Token
+        """
+        native = Tokens.NATIVE_TOKEN
+        return Token(self.chain.native_token, native.address, self.chain, native.decimals, TokenTypes.NATIVE)
 
     def _get_contract(self, contract_raw: ContractRaw) -> Contract:
         """
-        Получение инициализированного объекта контракта
+        Получение инициализированного объекта контракта из общего кеша contract_cache
         :param contract_raw: объект ContractRaw
         :return: объект контракта
         """
-        return self.w3.eth.contract(contract_raw.address, abi=contract_raw.abi)
+        return contract_cache.get(self.w3, contract_raw)
 
+    def _read_many(self, *reads: Callable[[Web3], Any]) -> list[Any]:
+        """
+        Выполняет независимые чтения одним JSON-RPC batch запросом вместо нескольких последовательных.
+        Каждое чтение - функция от Web3, например lambda w3: w3.eth.gas_price. Batch выполняется на отдельном
+        Web3 из batch_web3, потому что self.w3 общий для потоков и режим batch нельзя включать на нем.
+        Если batch не прошел, чтения выполняются по одному. Если rpc отклонил именно batch запрос (см. BATCH_ERRORS),
+        rpc запоминается, и batch на нем не пробуется NO_BATCH_TTL секунд. Таймауты, лимиты запросов и другие
+        временные ошибки batch не отключают.
+        :param reads: функции чтения
+        :return: результаты в том же порядке
+        """
+        rpc = self.w3.provider.endpoint_uri
+        if len(reads) > 1 and self._no_batch.get(rpc, 0) <= time.monotonic():
+            try:
+                w3 = batch_web3(self.w3)
+                with w3.batch_requests() as batch:
+                    for read in reads:
+                        batch.add(read(w3))
+                    return list(batch.execute())
+            except Exception as e:
+                results = [read(self.w3) for read in reads]
+                # по одному получилось, но временная ошибка rpc (таймаут, 429) не значит, что batch не поддерживается
+                if is_batch_error(e):
+                    logger.debug(f'rpc {self.chain.name} не принимает batch запросы, '
+                                 f'запросы будут по одному {NO_BATCH_TTL} секунд: {e}')
+                    self._no_batch[rpc] = time.monotonic() + NO_BATCH_TTL
+                return results
+        return [read(self.w3) for read in reads]
+
+    def _fee_kind(self) -> str:
+        """
+        Вид данных для расчета комиссии: gas_price для сетей без EIP-1559, иначе fee_history.
+        :return: FEE_HISTORY или GAS_PRICE
+        """
+        return GAS_PRICE if self.chain.is_eip1559 is False else FEE_HISTORY
+
+    def _fee_read(self, kind: Optional[str] = None) -> Callable[[Web3], Any]:
+        """
+        Чтение, нужное для расчета комиссии.
+        :param kind: FEE_HISTORY или GAS_PRICE, если не указан, берется _fee_kind()
+        :return: функция чтения от Web3 для _read_many
+        """
+        if (kind or self._fee_kind()) == GAS_PRICE:
+            return lambda w3: w3.eth.gas_price
+        return lambda w3: w3.eth.fee_history(20, 'latest', [40])
+
+    def _fee_data(self, kind: Optional[str] = None) -> Any:
+        """
+        Данные для расчета комиссии из общего кеша сети fee_oracle, запрос к rpc только если данные устарели.
+        :param kind: FEE_HISTORY или GAS_PRICE, если не указан, берется _fee_kind()
+        :return: результат fee_history или gas_price
+        """
+        kind = kind or self._fee_kind()
+        read = self._fee_read(kind)
+        return fee_oracle.get(self.chain.name, kind, lambda: read(self.w3))
+
+    @metrics.timed('onchain_seconds')
     def _estimate_gas(self, tx_params: dict) -> dict:
         """
         Оценивает стоимость газа для транзакции и добавляет исходный словарь tx параметр gas
@@ -85,28 +275,37 @@ class Onchain:
         tx_params['gas'] = int(self.w3.eth.estimate_gas(tx_params) * get_multiplayer())
         return tx_params
 
-    def _get_fee(self, tx_params: dict[str, str | int] | None = None) -> dict[str, str | int]:
+    @metrics.timed('onchain_seconds')
+    def _get_fee(
+            self,
+            tx_params: dict[str, str | int] | None = None,
+            fee_data: Any = None
+    ) -> dict[str, str | int]:
         """
         Подготовка параметров транзакции с учетом EIP-1559. Берет значение EIP-1559 из self.chain.is_eip1559,
         если не определено, то запрашивает и сохраняет значение на время сессии.
         Если сеть не поддерживает EIP-1559, то устанавливает параметр gasPrice,
         если поддерживает, то устанавливает параметры maxFeePerGas и maxPriorityFeePerGas.
         :param tx_params: параметры транзакции без параметров комиссии либо None, если передан None, то создается новый словарь
+        :param fee_data: уже полученный результат self._fee_read(), если None, берется из fee_oracle
         """
         if tx_params is None:
             tx_params = {}
 
-        fee_history = None
+        if fee_data is None:
+            fee_data = self._fee_data()
+        # fee_history - словарь, gas_price - число
+        fee_history = fee_data if not isinstance(fee_data, int) else None
 
         if self.chain.is_eip1559 is None:
-            fee_history = self.w3.eth.fee_history(20, 'latest', [40])
             self.chain.is_eip1559 = any(fee_history.get('baseFeePerGas', [0]))
 
         if self.chain.is_eip1559 is False:
-            tx_params['gasPrice'] = self._multiply(self.w3.eth.gas_price)
+            gas_price = fee_data if fee_history is None else self._fee_data(GAS_PRICE)
+            tx_params['gasPrice'] = self._multiply(gas_price)
             return tx_params
 
-        fee_history = fee_history or self.w3.eth.fee_history(20, 'latest', [40])
+        fee_history = fee_history or self._fee_data(FEE_HISTORY)
         base_fee = fee_history.get('baseFeePerGas', [0])[-1]
         priority_fees = [fee[0] for fee in fee_history.get('reward', [[0]]) if fee[0] != 0] or [0]
         median_index = len(priority_fees) // 2
@@ -130,6 +329,7 @@ class Onchain:
         """
         return int(value * get_multiplayer(min_mult, max_mult) * self.chain.multiplier)
 
+    @metrics.timed('onchain_seconds')
     def _get_l1_fee(self, tx_params: dict[str, str | int]) -> Amount:
         """
         Получение комиссии для L1 сети Optimism
@@ -154,21 +354,45 @@ class Onchain:
         l1_fee = contract.functions.getL1Fee(tx_params['data']).call()
         return Amount(l1_fee, wei=True)
 
+    @metrics.timed('onchain_seconds')
     def _prepare_tx(self, value: Optional[Amount] = None,
-                    to_address: Optional[str | ChecksumAddress] = None) -> dict:
+                    to_address: Optional[str | ChecksumAddress] = None,
+                    validate_value: bool = False) -> dict:
         """
-        Подготовка параметров транзакции
+        Подготовка параметров транзакции. Независимые чтения (комиссия, если ее нет в fee_oracle, при первой транзакции
+        аккаунта в сети pending nonce, а при validate_value еще оценка газа перевода и баланс) выполняются
+        одним batch запросом.
+        Сам nonce выдается nonce_manager в _sign_and_send, чтобы транзакции аккаунта можно было отправлять подряд.
         :param value: сумма перевода ETH, если ETH нужно приложить к транзакции
         :param to_address: адрес получателя транзакции, для перевода нативного токена
         или если НЕ используете build_transaction (он автоматически укажет адрес получателя)
+        :param validate_value: проверить, хватает ли баланса на value и комиссию, и уменьшить value, если не хватает
         :return: параметры транзакции
         """
+        fee_kind = self._fee_kind()
+        fee_data = fee_oracle.cached(self.chain.name, fee_kind)
+        reads = [] if fee_data is not None else [self._fee_read(fee_kind)]
+        if validate_value:
+            reads += [
+                lambda w3: w3.eth.estimate_gas({'from': self.account.address, 'to': self.account.address, 'value': 1}),
+                lambda w3: w3.eth.get_balance(self.account.address),
+            ]
+        sync_nonce = not nonce_manager.is_synced(self.chain.chain_id, self.account.address)
+        if sync_nonce:
+            reads.append(lambda w3: w3.eth.get_transaction_count(self.account.address, 'pending'))
+        results = self._read_many(*reads)
+
+        if fee_data is None:
+            fee_data = results.pop(0)
+            fee_oracle.put(self.chain.name, fee_kind, fee_data)
+        if sync_nonce:
+            nonce_manager.sync(self.chain.chain_id, self.account.address, results.pop())
+
         # получаем параметры комиссии
-        tx_params = self._get_fee()
+        tx_params = self._get_fee(fee_data=fee_data)
 
         # добавляем параметры транзакции
         tx_params['from'] = self.account.address
-        tx_params['nonce'] = self.w3.eth.get_transaction_count(self.account.address)
         tx_params['chainId'] = self.chain.chain_id
 
         # если передана сумма перевода, то добавляем ее в транзакцию
@@ -180,19 +404,171 @@ class Onchain:
         if to_address:
             tx_params['to'] = to_address
 
+        if validate_value:
+            self._validate_native_transfer_value(tx_params, gas=results[0], balance=Amount(results[1], wei=True))
+
         return tx_params
 
+    def _pending_nonce(self) -> int:
+        """
+        Количество транзакций аккаунта с учетом еще не включенных в блок.
+        :return: nonce
+        """
+        return self.w3.eth.get_transaction_count(self.account.address, 'pending')
+
+    def _tx_exists(self, tx_hash: str) -> bool:
+        """
+        Проверяет, есть ли транзакция в мемпуле или в блоке. Ошибки rpc кроме отсутствия транзакции не перехватываются,
+        чтобы не считать отправку не прошедшей, когда это неизвестно.
+        :param tx_hash: хэш транзакции
+        :return: True, если транзакция найдена
+        """
+        try:
+            self.w3.eth.get_transaction(tx_hash)
+            return True
+        except TransactionNotFound:
+            return False
+
+    def _resync_nonce(self, tx_hash: str) -> None:
+        """
+        Синхронизирует nonce_manager с pending после транзакции, которая не попала в блок за время ожидания.
+        Если транзакция выпала из мемпула, все nonce, выданные после нее, зависнут за пропуском, поэтому
+        локальный nonce сверяется с сетью и при расхождении откатывается до pending.
+        :param tx_hash: хэш транзакции, которую не дождались
+        :return: None
+        """
+        chain_id, address = self.chain.chain_id, self.account.address
+        try:
+            if not self._tx_exists(tx_hash):
+                logger.warning(f'{self.account.profile_number} Транзакция {tx_hash} выпала из мемпула '
+                               f'в сети {self.chain.name}, nonce синхронизируется с сетью')
+            nonce_manager.reset(chain_id, address, self._pending_nonce)
+        except Exception as e:
+            logger.warning(f'{self.account.profile_number} Не удалось синхронизировать nonce в сети '
+                           f'{self.chain.name}, синхронизация при следующей транзакции: {e}')
+            nonce_manager.reset(chain_id, address)
+
+    def _send_raw(self, raw_tx: bytes, tx_hash: str) -> str:
+        """
+        Отправка подписанной транзакции. Если эта же транзакция уже отправлена (первая отправка дошла, но ответ rpc
+        потерялся), это не ошибка: на already known сразу возвращается хэш, а на ошибку nonce или сети хэш
+        ищется в сети через eth_getTransactionByHash.
+        :param raw_tx: подписанная транзакция
+        :param tx_hash: хэш подписанной транзакции
+        :return: хэш транзакции
+        """
+        try:
+            return self.w3.eth.send_raw_transaction(raw_tx).to_0x_hex()
+        except Exception as e:
+            if is_already_known(e):
+                return tx_hash
+            if (is_nonce_error(e) or is_send_uncertain(e)) and self._tx_exists(tx_hash):
+                logger.info(f'{self.account.profile_number} транзакция {tx_hash} уже отправлена в сети '
+                            f'{self.chain.name}: {e}')
+                return tx_hash
+            raise
+
+    def _broadcast(self, tx: dict) -> str:
+        """
+        Подпись и отправка транзакции без ожидания включения в блок.
+        Если nonce не указан, он выдается nonce_manager. При ошибке nonce от rpc (если транзакция с этим хэшем
+        не найдена в сети) nonce синхронизируется с pending и отправка повторяется один раз. При сетевой ошибке
+        транзакция могла дойти до мемпула, поэтому она не повторяется, а nonce синхронизируется при следующей
+        выдаче. При любой другой ошибке nonce возвращается менеджеру.
+        :param tx: параметры транзакции
+        :return: хэш транзакции
+        """
+        if 'nonce' in tx:
+            signed_tx = self.w3.eth.account.sign_transaction(tx, self.account.private_key)
+            return self._send_raw(signed_tx.raw_transaction, signed_tx.hash.to_0x_hex())
+
+        chain_id, address = self.chain.chain_id, self.account.address
+        for attempt in range(2):
+            nonce = nonce_manager.allocate(chain_id, address, self._pending_nonce)
+            signed_tx = self.w3.eth.account.sign_transaction({**tx, 'nonce': nonce}, self.account.private_key)
+            try:
+                return self._send_raw(signed_tx.raw_transaction, signed_tx.hash.to_0x_hex())
+            except Exception as e:
+                if is_nonce_error(e) and not attempt:
+                    logger.warning(f'{self.account.profile_number} ошибка nonce {nonce} в сети {self.chain.name}, '
+                                   f'nonce синхронизируется с сетью: {e}')
+                    nonce_manager.reset(chain_id, address, self._pending_nonce)
+                    continue
+                if is_nonce_error(e) or is_send_uncertain(e):
+                    nonce_manager.reset(chain_id, address)
+                else:
+                    nonce_manager.release(chain_id, address, nonce)
+                raise
+
+    @metrics.timed('onchain_seconds')
+    def submit(self, tx: dict) -> str:
+        """
+        Подпись и отправка транзакции, возвращает хэш сразу после отправки, не дожидаясь включения в блок.
+        Nonce выдается локально, поэтому несколько транзакций аккаунта можно отправить подряд.
+        :param tx: параметры транзакции, например из _prepare_tx и build_transaction
+        :return: хэш транзакции
+        """
+        return self._broadcast(tx)
+
+    def track(
+            self,
+            tx_hash: str,
+            callback: Optional[Callable[[TxResult], None]] = None,
+            timeout: Optional[float] = None
+    ) -> Future[TxResult]:
+        """
+        Ожидание квитанции транзакции в фоновом потоке receipt_tracker.
+        :param tx_hash: хэш транзакции
+        :param callback: функция, которая будет вызвана с TxResult после включения в блок
+        :param timeout: сколько секунд ждать, если не указано, берется config.receipt_timeout
+        :return: Future с TxResult (статус, газ, фактическая комиссия)
+        """
+        future = receipt_tracker.track(self.w3, tx_hash, self.chain.name, callback, timeout)
+
+        def on_done(done: Future[TxResult]) -> None:
+            # квитанция не получена за время ожидания, транзакция могла выпасть из мемпула
+            if done.exception() is None and done.result().status is None:
+                self._resync_nonce(tx_hash)
+
+        future.add_done_callback(on_done)
+        return future
+
+    def send_async(
+            self,
+            tx: dict,
+            callback: Optional[Callable[[TxResult], None]] = None
+    ) -> tuple[str, Future[TxResult]]:
+        """
+        Отправка транзакции без ожидания включения в блок. Поток аккаунта может продолжать работу,
+        а результат получить позже через future.result() или в callback.
+
+            tx_hash, future = onchain.send_async(tx)
+            ...
+            result = future.result()  # TxResult
+
+        :param tx: параметры транзакции
+        :param callback: функция, которая будет вызвана с TxResult после включения в блок
+        :return: хэш транзакции и Future с TxResult
+        """
+        tx_hash = self.submit(tx)
+        return tx_hash, self.track(tx_hash, callback)
+
+    @metrics.timed('onchain_seconds')
     def _sign_and_send(self, tx: dict) -> str:
         """
-        Подпись и отправка транзакции
+        Подпись и отправка транзакции с ожиданием включения в блок
         :param tx: параметры транзакции
         :return: хэш транзакции
         """
-        signed_tx = self.w3.eth.account.sign_transaction(tx, self.account.private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-        tx_receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        tx_hash = self._broadcast(tx)
+        try:
+            tx_receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        except TimeExhausted:
+            self._resync_nonce(tx_hash)
+            raise
         return tx_receipt['transactionHash'].hex()
 
+    @metrics.timed('onchain_seconds')
     def get_balance(
             self,
             *,
@@ -206,9 +582,8 @@ class Onchain:
         :return: объект Amount с балансом
         """
 
-        if token is None:
-            token = Tokens.NATIVE_TOKEN
-            token.chain = self.chain
+        if token is None or isinstance(token, Token) and token.type_token == TokenTypes.NATIVE:
+            token = self._native_token()
 
         # если не указан адрес, то берем адрес аккаунта
         if not address:
@@ -238,19 +613,115 @@ class Onchain:
             balance = Amount(erc20_balance_wei, decimals=token.decimals, wei=True)
         return balance
 
-    def _validate_native_transfer_value(self, tx_params: dict) -> None:
+    @metrics.timed('onchain_seconds')
+    def get_balances(
+            self,
+            tokens: Optional[list[Token | None]] = None,
+            addresses: Optional[list[str | ChecksumAddress]] = None
+    ) -> dict[tuple[ChecksumAddress, ChecksumAddress], Amount]:
+        """
+        Получение балансов нескольких токенов на нескольких адресах через Multicall3 aggregate3.
+        Нативные балансы запрашиваются через getEthBalance, erc20 через balanceOf, вызовы делятся на части
+        по config.multicall_max_calldata байт, так что аккаунт и 20 токенов - это один eth_call вместо 21.
+        Если в сети нет Multicall3, балансы запрашиваются по одному через get_balance.
+        :param tokens: список Token текущей сети, None в списке или нативный Token - нативный баланс.
+            Если не указан, берется нативный токен и все токены сети из Tokens
+        :param addresses: адреса кошельков, если не указаны, берется адрес аккаунта
+        :return: словарь {(адрес кошелька, адрес токена): Amount}, для нативного токена адрес Tokens.NATIVE_TOKEN.address
+        """
+        if tokens is None:
+            tokens = [None] + Tokens.get_tokens_by_chain(self.chain)
+        addresses = [to_checksum(address) for address in addresses or [self.account.address]]
+
+        for token in tokens:
+            if token is not None and token.type_token != TokenTypes.NATIVE and token.chain != self.chain:
+                logger.error(f'Токен на другой сети {token.chain.name} проверяется в {self.chain.name}')
+                raise ValueError('Токен на другой сети')
+
+        # (адрес кошелька, токен или None для нативного)
+        queries = [(address, token if token is not None and token.type_token != TokenTypes.NATIVE else None)
+                   for address in addresses for token in tokens]
+
+        if self.chain.name in self._no_multicall:
+            return self._get_balances_one_by_one(queries)
+
+        multicall = self._get_contract(Contracts.MULTICALL3)
+        balances = {}
+        failed = []
+        chunk_size = max(1, config.multicall_max_calldata // MULTICALL_CALL_SIZE)
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start:start + chunk_size]
+            calls = []
+            for address, token in chunk:
+                argument = address[2:].rjust(64, '0')
+                if token is None:
+                    calls.append((multicall.address, True, bytes.fromhex(GET_ETH_BALANCE_SELECTOR + argument)))
+                else:
+                    calls.append((token.address, True, bytes.fromhex(BALANCE_OF_SELECTOR + argument)))
+            try:
+                results = multicall.functions.aggregate3(calls).call()
+            except Exception as e:
+                logger.warning(f'Ошибка Multicall3 в сети {self.chain.name}, балансы запрашиваются по одному: {e}')
+                # если контракта нет в сети, больше не пробуем multicall, иначе ошибка могла быть временной
+                if not self.w3.eth.get_code(multicall.address):
+                    self._no_multicall.add(self.chain.name)
+                failed.extend(queries[start:])
+                break
+
+            for (address, token), (success, data) in zip(chunk, results):
+                if not success or len(data) != 32:
+                    failed.append((address, token))
+                    continue
+                token_address = token.address if token else Tokens.NATIVE_TOKEN.address
+                decimals = token.decimals if token else 18
+                balances[(address, token_address)] = Amount(int.from_bytes(data, 'big'), decimals=decimals, wei=True)
+
+        balances.update(self._get_balances_one_by_one(failed))
+        return balances
+
+    def _get_balances_one_by_one(
+            self,
+            queries: list[tuple[ChecksumAddress, Optional[Token]]]
+    ) -> dict[tuple[ChecksumAddress, ChecksumAddress], Amount]:
+        """
+        Запасной вариант get_balances: балансы по одному запросу. Ошибочные балансы логируются и пропускаются.
+        :param queries: список (адрес кошелька, токен или None для нативного)
+        :return: словарь {(адрес кошелька, адрес токена): Amount}
+        """
+        balances = {}
+        for address, token in queries:
+            token_address = token.address if token else Tokens.NATIVE_TOKEN.address
+            try:
+                balances[(address, token_address)] = self.get_balance(token=token, address=address)
+            except Exception as e:
+                symbol = token.symbol if token else self.chain.native_token
+                logger.error(f'{self.account.profile_number} Не удалось получить баланс {symbol} '
+                             f'адреса {address} в сети {self.chain.name}: {e}')
+        return balances
+
+    def _validate_native_transfer_value(
+            self,
+            tx_params: dict,
+            gas: Optional[int] = None,
+            balance: Optional[Amount] = None
+    ) -> None:
         """
         Проверка возможности отправки нативного токена и корректировка суммы перевода, если недостаточно средств
         в исходном словаре tx_params
         :param tx_params: параметры транзакции c указанным value
+        :param gas: уже полученная оценка газа простого перевода, если None, запрашивается
+        :param balance: уже полученный нативный баланс, если None, запрашивается
         """
         amount = Amount(tx_params['value'], wei=True)
         l1_fee = self._get_l1_fee(tx_params)
-        gues_gas = self.w3.eth.estimate_gas(
-            {'from': self.account.address, 'to': self.account.address, 'value': 1})
+        if gas is None or balance is None:
+            gas, balance_wei = self._read_many(
+                lambda w3: w3.eth.estimate_gas({'from': self.account.address, 'to': self.account.address, 'value': 1}),
+                lambda w3: w3.eth.get_balance(self.account.address),
+            )
+            balance = Amount(balance_wei, wei=True)
         gues_gas_price = tx_params.get('maxFeePerGas', tx_params.get('gasPrice'))
-        fee_spend = self._multiply(l1_fee.wei + gues_gas * gues_gas_price, 1.1, 1.2)
-        balance = self.get_balance()
+        fee_spend = self._multiply(l1_fee.wei + gas * gues_gas_price, 1.1, 1.2)
         if balance.wei - fee_spend - amount.wei >= 0:
             return
 
@@ -264,6 +735,7 @@ class Onchain:
         logger.error(f'{self.account.profile_number} Недостаточно средств для отправки транзакции')
         raise ValueError('Недостаточно средств для отправки нативного токена')
 
+    @metrics.timed('onchain_seconds')
     def send_token(self,
                    to_address: str | ChecksumAddress,
                    amount: Amount | int | float | None = None,
@@ -279,10 +751,8 @@ class Onchain:
         :return: хэш транзакции
         """
         # если не передан токен, то отправляем нативный токен
-        if token is None:
-            token = Tokens.NATIVE_TOKEN
-            token.chain = self.chain
-            token.symbol = self.chain.native_token
+        if token is None or isinstance(token, Token) and token.type_token == TokenTypes.NATIVE:
+            token = self._native_token()
 
         if amount is None:
             amount = Amount(self.get_balance(token=token).wei, decimals=token.decimals, wei=True)
@@ -301,8 +771,7 @@ class Onchain:
 
         # если передан нативный токен
         if token.type_token == TokenTypes.NATIVE:
-            tx_params = self._prepare_tx(amount, to_address)
-            self._validate_native_transfer_value(tx_params)
+            tx_params = self._prepare_tx(amount, to_address, validate_value=True)
             amount = Amount(tx_params['value'], wei=True)
         else:
             # получаем баланс кошелька
@@ -324,6 +793,100 @@ class Onchain:
         logger.info(f'{self.account.profile_number} Транзакция отправлена [{message}] хэш: {tx_hash}')
         return tx_hash
 
+    @metrics.timed('onchain_seconds')
+    def batch_transfer(
+            self,
+            recipients: list[tuple[str | ChecksumAddress, Amount | int | float]],
+            token: Optional[Token | str | ChecksumAddress] = None,
+            disperse: Optional[ContractRaw] = None
+    ) -> list[str]:
+        """
+        Отправка нативного или erc20 токена многим адресам одной транзакцией через контракт Disperse.
+        Для erc20 один раз делается approve на общую сумму. Получатели делятся на транзакции так, чтобы газ одной
+        транзакции не превышал config.disperse_block_gas_share от лимита газа блока и config.disperse_max_recipients
+        получателей, транзакции отправляются подряд и ожидаются вместе. Если отправка прервалась ошибкой,
+        хэши уже отправленных транзакций пишутся в лог перед исключением.
+        :param recipients: список (адрес получателя, сумма)
+        :param token: объект Token или адрес контракта токена, если не указан, отправляется нативный токен
+        :param disperse: контракт Disperse, если не указан, берется Contracts.DISPERSE
+        :return: хэши транзакций
+        """
+        disperse = disperse or Contracts.DISPERSE
+        if isinstance(token, str):
+            symbol, decimals = self._get_token_params(token)
+            token = Token(symbol, token, self.chain, decimals)
+        if token is not None and token.type_token == TokenTypes.NATIVE:
+            token = None
+        decimals = token.decimals if token else 18
+        symbol = token.symbol if token else self.chain.native_token
+
+        addresses = [to_checksum(address) for address, _ in recipients]
+        values = [(amount if isinstance(amount, Amount) else Amount(amount, decimals=decimals)).wei
+                  for _, amount in recipients]
+        if not addresses:
+            return []
+
+        contract = self._get_contract(disperse)
+        if not self.w3.eth.get_code(contract.address):
+            raise ValueError(f'Контракт Disperse {contract.address} не найден в сети {self.chain.name}')
+
+        if token:
+            self.approve(token, Amount(sum(values), decimals=decimals, wei=True), disperse)
+
+        max_gas = int(self.w3.eth.get_block('latest')['gasLimit'] * config.disperse_block_gas_share)
+        size = min(config.disperse_max_recipients, len(addresses))
+        futures = []
+        submitted = []
+        start = 0
+        try:
+            while start < len(addresses):
+                chunk_addresses, chunk_values = addresses[start:start + size], values[start:start + size]
+                if token:
+                    call = contract.functions.disperseToken(token.address, chunk_addresses, chunk_values)
+                    tx_params = self._prepare_tx()
+                else:
+                    call = contract.functions.disperseEther(chunk_addresses, chunk_values)
+                    tx_params = self._prepare_tx(Amount(sum(chunk_values), wei=True))
+                tx_params['to'] = contract.address
+                tx_params['data'] = call._encode_transaction_data()
+                try:
+                    self._estimate_gas(tx_params)
+                except Exception as e:
+                    # оценка не проходит и при превышении лимита газа блока, пробуем часть вдвое меньше,
+                    # остальные ошибки (баланс, rpc и т.д.) не зависят от размера части
+                    if len(chunk_addresses) == 1 or not is_gas_limit_error(e):
+                        raise
+                    size = len(chunk_addresses) // 2
+                    continue
+
+                # газ растет линейно от количества получателей, подбираем размер части под лимит
+                per_recipient = tx_params['gas'] / len(chunk_addresses)
+                if tx_params['gas'] > max_gas and len(chunk_addresses) > 1:
+                    size = max(1, int(max_gas / per_recipient))
+                    continue
+
+                tx_hash = self.submit(tx_params)
+                logger.info(f'{self.account.profile_number} Транзакция отправлена [{len(chunk_addresses)} переводов '
+                            f'{Amount(sum(chunk_values), decimals=decimals, wei=True)} {symbol}] хэш: {tx_hash}')
+                submitted.append(tx_hash)
+                futures.append(self.track(tx_hash))
+                start += len(chunk_addresses)
+                size = max(1, min(config.disperse_max_recipients, int(max_gas / per_recipient)))
+        except Exception:
+            if submitted:
+                logger.error(f'{self.account.profile_number} Рассылка прервана, уже отправлены транзакции '
+                             f'{submitted}, повторный запуск отправит этим получателям еще раз')
+            raise
+
+        hashes = []
+        for future in futures:
+            result = future.result()
+            if not result.status:
+                logger.error(f'{self.account.profile_number} Транзакция рассылки не выполнена: {result}')
+            hashes.append(result.tx_hash)
+        return hashes
+
+    @metrics.timed('onchain_seconds')
     def _get_allowance(self, token: Token | str, spender: str | ChecksumAddress | ContractRaw) -> Amount:
         """
         Получение разрешенной суммы токенов на снятие
@@ -348,6 +911,7 @@ class Onchain:
         allowance = contract.functions.allowance(self.account.address, spender).call()
         return Amount(allowance, decimals=token.decimals, wei=True)
 
+    @metrics.timed('onchain_seconds')
     def approve(self, token: Optional[Token, str], amount: Amount | int | float,
                 spender: str | ChecksumAddress | ContractRaw) -> None:
         """
@@ -388,27 +952,30 @@ class Onchain:
         message = f'approve {amount} {token.symbol} to {spender}'
         logger.info(f'{self.account.profile_number} Транзакция отправлена {message}')
 
+    @metrics.timed('onchain_seconds')
     def get_gas_price(self, gwei: bool = True) -> int:
         """
-        Получение текущей ставки газа
+        Получение текущей ставки газа из общего кеша сети fee_oracle
         :return: ставка газа
         """
-        gas_price = self.w3.eth.gas_price
+        gas_price = self._fee_data(GAS_PRICE)
         if gwei:
             return gas_price / 10 ** 9
         return gas_price
 
+    @metrics.timed('onchain_seconds')
     def gas_price_wait(self, gas_limit: int = None) -> None:
         """
-        Ожидание пока ставка газа не станет меньше лимита, осуществляется запрос каждые 5-10 секунд
+        Ожидание пока ставка газа не станет не больше лимита. Ставку опрашивает общий для всех аккаунтов сети
+        gas_monitor раз в config.gas_monitor_interval секунд, а не каждый аккаунт отдельно.
         :param gas_limit: лимит ставки газа, если не передан, берется из конфига
         :return:
         """
         if not gas_limit:
             gas_limit = config.gas_price_limit
 
-        while self.get_gas_price() > gas_limit:
-            random_sleep(5, 10)
+        read = self._fee_read(GAS_PRICE)
+        gas_monitor.wait(self.chain.name, lambda: read(self.w3), gas_limit)
 
     def get_pk_from_seed(self, seed: str | list) -> str:
         """
@@ -432,60 +999,81 @@ class Onchain:
             return True
         return False
 
-    def remove_approves(self):
-
-
-        if not config.ETHERSCAN_API_KEY:
-            logger.error('[onchain.remove_approves] Не указан ключ для etherscan')
-            return
-
-        logs = self._get_approval_logs()
-        if not logs:
-            logger.info('[onchain.remove_approves] Нет логов Approval')
-            return
-
-        approved = set()
-
-        tokens_cache = {}
-
-        for log in logs:
-            token_address = log.get('address')
-            spender_address = '0x' + log.get('topics')[2][26:]  # адрес spender
-            approved.add((token_address, spender_address))
-
-        for token_address, spender_address in approved:
-            # получаем параметры токена
-            token = tokens_cache.get(token_address)
-            # кешируем токен для дальнейшего использования
-            if not token:
-                symbol, decimals = self._get_token_params(token_address)
-                token = Token(symbol, token_address, self.chain, decimals)
-                tokens_cache[token_address] = token
-
-            self.approve(token, 0, spender_address)
-
-
-
-    def _get_approval_logs(self):
+    @metrics.timed('onchain_seconds')
+    def remove_approves(self) -> list[str]:
         """
-        Получение логов Approval(address,address,uint256) по адресу отправителя
-        :return: список логов Approval из etherscan по блокчейну Chain
+        Отзыв всех разрешений erc20 аккаунта в текущей сети. Разрешения берутся из локального индекса логов Approval
+        (core/approval_indexer.py), который при каждом запуске дописывает только новые блоки. Текущие значения
+        разрешений проверяются одним запросом Multicall3, отзывы подписываются и отправляются подряд
+        через SigningPipeline и ожидаются вместе.
+        :return: хэши успешных транзакций отзыва
         """
-        url = f'https://api.etherscan.io/v2/api'
-        params = {
-            'chainid': self.chain.chain_id,
-            'module': 'logs',
-            'action': 'getLogs',
-            'fromBlock': 0,
-            'toBlock': 'latest',
-            'topic0': '0x' + self.w3.keccak(text='Approval(address,address,uint256)').hex(),
-            'topic0_1': 'and',
-            'topic1': '0x' + self.account.address[2:].rjust(64, '0'),
-            'apikey': config.ETHERSCAN_API_KEY,
-        }
-        response = get_response(url, params)
-        return response.get('result', [])
-
+        indexer = get_approval_indexer()
+        indexer.update(self)
+        live = indexer.live(self.chain.chain_id, self.account.address)
+        if not live:
+            logger.info(f'{self.account.profile_number} Нет действующих разрешений в сети {self.chain.name}')
+            return []
+
+        # параметры всех токенов одним запросом, известные токены берутся из token_cache
+        tokens_params = self.get_tokens_params(list({token_address for token_address, _, _ in live}))
+        allowances = self._get_allowances([(token_address, spender) for token_address, spender, _ in live])
+
+        base_tx = self._prepare_tx()
+        pairs, txs = [], []
+        for token_address, spender, _ in live:
+            # разрешение уже израсходовано или отозвано без лога Approval
+            if allowances.get((token_address, spender)) == 0:
+                indexer.mark_revoked(self.chain.chain_id, self.account.address, token_address, spender)
+                continue
+            symbol, decimals = tokens_params[token_address]
+            contract = self._get_contract(Token(symbol, token_address, self.chain, decimals))
+            tx_params = {**base_tx, 'to': token_address,
+                         'data': contract.functions.approve(spender, 0)._encode_transaction_data()}
+            try:
+                self._estimate_gas(tx_params)
+            except Exception as e:
+                logger.error(f'{self.account.profile_number} Не удалось оценить газ отзыва {symbol} для {spender}: {e}')
+                continue
+            pairs.append((token_address, spender, symbol))
+            txs.append(tx_params)
+
+        futures = []
+        for index, tx_hash, _ in SigningPipeline(self).run(txs):
+            if tx_hash:
+                futures.append((pairs[index], self.track(tx_hash)))
+
+        hashes = []
+        for (token_address, spender, symbol), future in futures:
+            result = future.result()
+            if result.status:
+                indexer.mark_revoked(self.chain.chain_id, self.account.address, token_address, spender)
+                hashes.append(result.tx_hash)
+                logger.info(f'{self.account.profile_number} Разрешение {symbol} для {spender} отозвано: {result.tx_hash}')
+            else:
+                logger.error(f'{self.account.profile_number} Отзыв разрешения {symbol} для {spender} не выполнен: '
+                             f'{result}')
+        return hashes
+
+    def _get_allowances(self, pairs: list[tuple[str, str]]) -> dict[tuple[str, str], int]:
+        """
+        Текущие разрешения аккаунта одним вызовом Multicall3 aggregate3.
+        :param pairs: список (адрес токена, адрес spender)
+        :return: словарь {(адрес токена, адрес spender): сумма в wei}, без пар, которые не удалось получить
+        """
+        if not pairs or self.chain.name in self._no_multicall:
+            return {}
+        multicall = self._get_contract(Contracts.MULTICALL3)
+        owner = self.account.address[2:].lower().rjust(64, '0')
+        calls = [(token_address, True, bytes.fromhex(ALLOWANCE_SELECTOR + owner + spender[2:].lower().rjust(64, '0')))
+                 for token_address, spender in pairs]
+        try:
+            results = multicall.functions.aggregate3(calls).call()
+        except Exception as e:
+            logger.warning(f'Ошибка Multicall3 в сети {self.chain.name}, разрешения не проверены: {e}')
+            return {}
+        return {pair: int.from_bytes(data, 'big') for pair, (success, data) in zip(pairs, results)
+                if success and len(data) == 32}
 
 
 if __name__ == '__main__':
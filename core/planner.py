@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from eth_typing import ChecksumAddress
+from loguru import logger
+
+from config import config, Tokens
+from core.excel import Excel
+from core.onchain import Onchain
+from models.account import Account
+from models.amount import Amount
+from models.chain import Chain
+from models.token import Token
+from utils.utils import to_checksum
+
+# примерная длительность действий в секундах для оценки времени цикла
+ACTION_SECONDS = {
+    'send_token': 30,
+    'approve': 30,
+    'withdraw': 300,
+    'gas_price_wait': 60,
+    'browser': 90,
+    'excel': 0.2,
+}
+DEFAULT_ACTION_SECONDS = 5
+# методы Onchain, которые только читают из блокчейна и при планировании выполняются как есть,
+# все остальные методы, которых нет в PlanOnchain (submit, send_async, batch_transfer и т.д.), только записываются
+ONCHAIN_READ_METHODS = {'get_balances', 'get_tokens_params', 'is_eip_1559'}
+
+
+class PlanRecorder:
+    """
+    Собирает действия аккаунтов, которые были бы выполнены в цикле.
+    """
+
+    def __init__(self) -> None:
+        self.actions: dict[str, list[dict]] = {}
+        self.errors: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, account: Account, kind: str, call: str, **params: Any) -> None:
+        """
+        Записывает действие аккаунта.
+        :param account: аккаунт
+        :param kind: тип действия: onchain, exchange, browser, excel
+        :param call: имя метода
+        :param params: параметры вызова
+        :return: None
+        """
+        action = {'kind': kind, 'call': call, 'params': {key: _to_json(value) for key, value in params.items()}}
+        with self._lock:
+            self.actions.setdefault(str(account.profile_number), []).append(action)
+
+    def error(self, account: Account, error: Exception) -> None:
+        with self._lock:
+            self.errors[str(account.profile_number)] = str(error)
+
+
+class ReadCache:
+    """
+    Общий для всех аккаунтов кеш чтений из блокчейна на время планирования.
+    Одинаковые запросы выполняются один раз, объекты Onchain переиспользуются по (сеть, аккаунт).
+    """
+
+    def __init__(self) -> None:
+        self._values: dict[tuple, Any] = {}
+        self._onchains: dict[tuple[str, str], Onchain] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def onchain(self, account: Account, chain: Chain) -> Onchain:
+        key = (chain.name, str(account.profile_number))
+        with self._lock:
+            onchain = self._onchains.get(key)
+        if onchain is None:
+            onchain = Onchain(account, chain)
+            with self._lock:
+                self._onchains[key] = onchain
+        return onchain
+
+    def get(self, key: tuple, loader: Callable[[], Any]) -> Any:
+        """
+        Возвращает значение из кеша или загружает его.
+        :param key: ключ запроса
+        :param loader: функция загрузки значения
+        :return: значение
+        """
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+                return self._values[key]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._values[key] = value
+        return value
+
+
+class PlanOnchain:
+    """
+    Заменяет Onchain при планировании: чтения идут через общий кеш, транзакции только записываются.
+    Из методов настоящего Onchain вызываются только чтения из ONCHAIN_READ_METHODS.
+    """
+
+    def __init__(self, account: Account, chain: Chain, cache: ReadCache, recorder: PlanRecorder) -> None:
+        self.account = account
+        self.chain = chain
+        self._cache = cache
+        self._recorder = recorder
+
+    @property
+    def _onchain(self) -> Onchain:
+        return self._cache.onchain(self.account, self.chain)
+
+    def change_chain(self, chain: Chain) -> None:
+        self.chain = chain
+
+    def get_balance(
+            self,
+            *,
+            token: Optional[Token | str | ChecksumAddress] = None,
+            address: Optional[str | ChecksumAddress] = None
+    ) -> Amount:
+        address = to_checksum(address or self.account.address)
+        token_address = token.address if isinstance(token, Token) else to_checksum(token or Tokens.NATIVE_TOKEN.address)
+        key = ('balance', self.chain.name, address, token_address)
+        return self._cache.get(key, lambda: self._onchain.get_balance(token=token, address=address))
+
+    def get_gas_price(self, gwei: bool = True) -> int:
+        gas_price = self._cache.get(('gas_price', self.chain.name), lambda: self._onchain.get_gas_price(gwei=False))
+        if gwei:
+            return gas_price / 10 ** 9
+        return gas_price
+
+    def gas_price_wait(self, gas_limit: int = None) -> None:
+        self._recorder.record(self.account, 'onchain', 'gas_price_wait', chain=self.chain, gas_limit=gas_limit)
+
+    def send_token(self, to_address, amount=None, token=None) -> str:
+        self._recorder.record(self.account, 'onchain', 'send_token', chain=self.chain,
+                              to_address=to_address, amount=amount, token=token)
+        return '0x'
+
+    def approve(self, token, amount, spender) -> None:
+        self._recorder.record(self.account, 'onchain', 'approve', chain=self.chain,
+                              token=token, amount=amount, spender=spender)
+
+    def remove_approves(self) -> None:
+        self._recorder.record(self.account, 'onchain', 'remove_approves', chain=self.chain)
+
+    def get_pk_from_seed(self, seed: str | list) -> str:
+        return self._onchain.get_pk_from_seed(seed)
+
+    def __getattr__(self, name: str) -> Any:
+        if name in ONCHAIN_READ_METHODS:
+            return getattr(self._onchain, name)
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        # Onchain хранит приватный ключ, поэтому неизвестные методы не выполняются, а записываются в план
+        def record(*args, **kwargs) -> None:
+            self._recorder.record(self.account, 'onchain', name, chain=self.chain, args=args, kwargs=kwargs)
+
+        return record
+
+
+class PlanExcel:
+    """
+    Заменяет Excel при планировании: таблица читается один раз на все аккаунты, записи только записываются в план.
+    """
+
+    _tables: dict[str, dict[str, dict[str, Any]]] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, account: Account, recorder: PlanRecorder, file: Optional[str] = None) -> None:
+        self.account = account
+        self._recorder = recorder
+        self._file = file
+        self._rows = self._load(file)
+
+    @classmethod
+    def _load(cls, file: Optional[str]) -> dict[str, dict[str, Any]]:
+        key = file or ''
+        with cls._lock:
+            if key not in cls._tables:
+                excel = Excel(file=file)
+                header = [name for name in excel.get_row(row=1) if name]
+                columns = excel.get_columns(header)
+                cls._tables[key] = {
+                    str(profile_number): {name: columns[name][index] for name in header}
+                    for index, profile_number in enumerate(columns.get('Profile Number', []))
+                }
+            return cls._tables[key]
+
+    def change_table(self, table_name: str) -> None:
+        self._file = table_name
+        self._rows = self._load(table_name)
+
+    def get_cell(self, column_name: str, row: Optional[int] = None) -> str | int | None:
+        return self._rows.get(str(self.account.profile_number), {}).get(column_name)
+
+    def get_counter(self, column_name: str, row: Optional[int] = None) -> int | float:
+        return Excel.to_number(self.get_cell(column_name))
+
+    def get_date(self, column_name: str, row: Optional[int] = None) -> datetime:
+        return Excel.parse_dates([self.get_cell(column_name)])[0]
+
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        # set_cell, increase_counter, set_date и другие записи
+        def record(*args, **kwargs) -> None:
+            self._recorder.record(self.account, 'excel', name, file=self._file, args=args, kwargs=kwargs)
+
+        return record
+
+
+class _RecordingProxy:
+    """
+    Записывает любые вызовы методов объекта, например bot.exchanges.okx.withdraw или bot.ads.open_url.
+    """
+
+    def __init__(self, account: Account, recorder: PlanRecorder, kind: str, prefix: str) -> None:
+        self._account = account
+        self._recorder = recorder
+        self._kind = kind
+        self._prefix = prefix
+
+    def __getattr__(self, name: str) -> _RecordingProxy:
+        return _RecordingProxy(self._account, self._recorder, self._kind, f'{self._prefix}.{name}')
+
+    def __call__(self, *args, **kwargs) -> _RecordingProxy:
+        self._recorder.record(self._account, self._kind, self._prefix, args=args, kwargs=kwargs)
+        # возвращаем прокси, чтобы цепочки вида bot.ads.page.locator(...).click() тоже записывались
+        return self
+
+
+class PlanExchanges:
+    def __init__(self, account: Account, recorder: PlanRecorder) -> None:
+        self.okx = _RecordingProxy(account, recorder, 'exchange', 'okx')
+        self.binance = _RecordingProxy(account, recorder, 'exchange', 'binance')
+
+
+class PlanBot:
+    """
+    Заменяет Bot при планировании. Передается в функцию activity вместо настоящего бота:
+    ничего не подписывается, не отправляется и браузер не запускается.
+    """
+
+    def __init__(self, account: Account, cache: ReadCache, recorder: PlanRecorder,
+                 chain: Chain = config.start_chain) -> None:
+        self.account = account
+        self.chain = chain
+        self.onchain = PlanOnchain(account, chain, cache, recorder)
+        self.excel = PlanExcel(account, recorder)
+        self.exchanges = PlanExchanges(account, recorder)
+        self.ads = _RecordingProxy(account, recorder, 'browser', 'ads')
+        self.metamask = _RecordingProxy(account, recorder, 'browser', 'metamask')
+
+
+def make_plan(
+        accounts: list[Account],
+        activity: Callable[[Any], None],
+        path: Optional[str] = None
+) -> dict:
+    """
+    Теневой прогон цикла: вызывает activity для каждого аккаунта с PlanBot и сохраняет план в json.
+    Чтения из блокчейна кешируются и выполняются параллельно в config.plan_workers потоков.
+    :param accounts: аккаунты для работы, уже отфильтрованные
+    :param activity: функция активности из run.py
+    :param path: путь к файлу плана, если не указан, берется config.PATH_PLAN
+    :return: план в виде словаря
+    """
+    path = path or config.PATH_PLAN
+    started = time.monotonic()
+    recorder = PlanRecorder()
+    cache = ReadCache()
+
+    def plan_account(account: Account) -> None:
+        try:
+            activity(PlanBot(account, cache, recorder))
+        except Exception as e:
+            logger.error(f'{account.profile_number} Ошибка при планировании: {e}')
+            recorder.error(account, e)
+
+    with ThreadPoolExecutor(max_workers=max(1, config.plan_workers)) as executor:
+        list(executor.map(plan_account, accounts))
+
+    calls = Counter()
+    account_seconds = []
+    browser_sessions = 0
+    for actions in recorder.actions.values():
+        seconds = 0
+        needs_browser = False
+        for action in actions:
+            call_name = action['call'].split('.')[-1]
+            calls[f"{action['kind']}.{action['call']}"] += 1
+            if action['kind'] == 'browser':
+                needs_browser = True
+            else:
+                seconds += ACTION_SECONDS.get(call_name, ACTION_SECONDS.get(action['kind'], DEFAULT_ACTION_SECONDS))
+        if needs_browser:
+            browser_sessions += 1
+            seconds += ACTION_SECONDS['browser']
+        account_seconds.append(seconds)
+
+    pause = sum(config.pause_between_profile) / 2
+    parallel = max(1, config.max_workers) * max(1, config.shards)
+    estimated_seconds = (sum(account_seconds) + pause * len(accounts)) / parallel
+
+    plan = {
+        'created': datetime.now().strftime(config.date_format),
+        'accounts': len(accounts),
+        'accounts_with_actions': len(recorder.actions),
+        'browser_sessions': browser_sessions,
+        'calls': dict(calls),
+        'estimated_cycle_minutes': round(estimated_seconds / 60, 1),
+        'read_cache': {'hits': cache.hits, 'misses': cache.misses},
+        'errors': recorder.errors,
+        'actions': recorder.actions,
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(plan, file, ensure_ascii=False, indent=2)
+
+    logger.success(f'План сохранен в {path} за {time.monotonic() - started:.1f} с: аккаунтов {len(accounts)}, '
+                   f'браузерных сессий {browser_sessions}, вызовов {dict(calls)}, '
+                   f'оценка цикла ~{plan["estimated_cycle_minutes"]} мин')
+    return plan
+
+
+def _to_json(value: Any) -> Any:
+    """
+    Приводит параметры вызова к виду для записи в json.
+    """
+    if isinstance(value, Amount):
+        return value.ether
+    if isinstance(value, Token):
+        return {'symbol': value.symbol, 'address': value.address}
+    if isinstance(value, Chain):
+        return value.name
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+if __name__ == '__main__':
+    pass
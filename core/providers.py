@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import copy
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3, HTTPProvider
+from web3.middleware import Web3Middleware
+
+from config import config
+from core.contract_cache import contract_cache
+from core.rpc_pool import FailoverProvider, get_pool
+from models.chain import Chain
+from utils.metrics import metrics
+from utils.utils import get_user_agent, prepare_proxy_requests
+
+
+class RpcMetricsMiddleware(Web3Middleware):
+    """
+    Замеряет время каждого JSON-RPC запроса (eth_call, eth_getBalance и т.д.) в гистограмме rpc_request_seconds.
+    """
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            with metrics.timed('rpc_request_seconds', method=method):
+                return make_request(method, params)
+
+        return middleware
+
+
+class ProviderRegistry:
+    """
+    Общий для процесса реестр объектов Web3 по ключу (rpc, прокси).
+
+    Onchain берет Web3 из реестра через get_for_chain вместо создания нового на каждый аккаунт и каждую смену сети,
+    поэтому keep-alive соединения HTTPProvider переиспользуются и TLS рукопожатие делается один раз
+    на rpc и прокси, а не на каждый аккаунт. При превышении config.web3_pool_size удаляется давно не
+    использованный Web3, закрываются его соединения и удаляются его контракты из contract_cache.
+
+    Счетчики hits (Web3 взят из реестра), misses (создан новый) и evictions (удален по LRU)
+    также пишутся в метрику web3_provider_total.
+    """
+
+    def __init__(self, size: Optional[int] = None) -> None:
+        """
+        :param size: максимальное количество Web3 в реестре, если не указано, берется config.web3_pool_size
+        """
+        self.size = size
+        self._providers: OrderedDict[tuple[str, Optional[str]], tuple[Web3, list[requests.Session]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_for_chain(self, chain: Chain, proxy: Optional[str] = None) -> Web3:
+        """
+        Возвращает Web3 для сети: если у сети несколько rpc, запросы идут через пул с переключением
+        на самый быстрый исправный rpc, иначе напрямую в единственный rpc.
+        :param chain: объект Chain
+        :param proxy: прокси в формате 'ip:port:login:password' или None
+        :return: объект Web3
+        """
+        if len(chain.rpcs) == 1:
+            return self.get(chain.rpc, proxy)
+        return self.get(f'pool:{chain.name}', proxy, chain)
+
+    def get(self, rpc: str, proxy: Optional[str] = None, chain: Optional[Chain] = None) -> Web3:
+        """
+        Возвращает Web3 для rpc и прокси, создает при первом обращении.
+        :param rpc: адрес rpc
+        :param proxy: прокси в формате 'ip:port:login:password' или None
+        :param chain: сеть, если передана, создается Web3 через пул всех rpc сети
+        :return: объект Web3
+        """
+        key = (rpc, proxy)
+        with self._lock:
+            cached = self._providers.get(key)
+            if cached is not None:
+                self._providers.move_to_end(key)
+                self.hits += 1
+                metrics.inc('web3_provider_total', result='hit')
+                return cached[0]
+
+            self.misses += 1
+            metrics.inc('web3_provider_total', result='miss')
+            w3, sessions = self._create_pool(chain, proxy) if chain else self._create(rpc, proxy)
+            self._providers[key] = (w3, sessions)
+            size = self.size or config.web3_pool_size
+            while len(self._providers) > size:
+                # соединения закрываются, если Web3 еще используется, сессия откроет их заново
+                _, (evicted_w3, evicted_sessions) = self._providers.popitem(last=False)
+                for session in evicted_sessions:
+                    session.close()
+                # контракты держат ссылку на Web3, без этого он и его контракты остались бы в памяти
+                contract_cache.discard(evicted_w3)
+                self.evictions += 1
+                metrics.inc('web3_provider_total', result='evict')
+            return w3
+
+    @staticmethod
+    def _http_provider(rpc: str, proxy: Optional[str], **kwargs) -> tuple[HTTPProvider, requests.Session]:
+        """
+        Создает HTTPProvider с keep-alive сессией requests, user-agent выбирается один раз на провайдер.
+        :param rpc: адрес rpc
+        :param proxy: прокси или None
+        :param kwargs: дополнительные параметры HTTPProvider
+        :return: провайдер и его сессия
+        """
+        request_kwargs = kwargs.pop('request_kwargs', {})
+        request_kwargs.update({
+            'headers': {
+                'User-Agent': get_user_agent(),
+                "Content-Type": "application/json",
+            },
+            'proxies': prepare_proxy_requests(proxy) if proxy else None
+        })
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, config.max_workers))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return HTTPProvider(rpc, request_kwargs=request_kwargs, session=session, **kwargs), session
+
+    def _create(self, rpc: str, proxy: Optional[str]) -> tuple[Web3, list[requests.Session]]:
+        """
+        Создает Web3 для одного rpc.
+        :param rpc: адрес rpc
+        :param proxy: прокси или None
+        :return: объект Web3 и сессии его соединений
+        """
+        provider, session = self._http_provider(rpc, proxy)
+        w3 = Web3(provider)
+        w3.middleware_onion.add(RpcMetricsMiddleware, 'rpc_metrics')
+        return w3, [session]
+
+    def _create_pool(self, chain: Chain, proxy: Optional[str]) -> tuple[Web3, list[requests.Session]]:
+        """
+        Создает Web3 через пул rpc сети. Провайдеры rpc без встроенных повторов и с таймаутом config.rpc_timeout,
+        чтобы при сбое сразу переключаться на следующий rpc.
+        :param chain: объект Chain
+        :param proxy: прокси или None
+        :return: объект Web3 и сессии его соединений
+        """
+        providers = {}
+        sessions = []
+        for url in chain.rpcs:
+            providers[url], session = self._http_provider(
+                url, proxy, request_kwargs={'timeout': config.rpc_timeout}, exception_retry_configuration=None
+            )
+            sessions.append(session)
+        w3 = Web3(FailoverProvider(get_pool(chain), providers))
+        w3.middleware_onion.add(RpcMetricsMiddleware, 'rpc_metrics')
+        return w3, sessions
+
+    def stats(self) -> dict[str, int]:
+        """
+        Счетчики переиспользования.
+        :return: словарь hits, misses, evictions, size
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._providers)}
+
+
+# общий реестр процесса
+providers = ProviderRegistry()
+
+
+def batch_web3(w3: Web3) -> Web3:
+    """
+    Отдельный Web3 для одного batch запроса. batch_requests включает режим batch на провайдере, и пока он включен,
+    вызовы w3.eth других потоков через тот же провайдер тоже попадают в batch и возвращают заготовки запросов
+    вместо результатов. Поэтому batch выполняется на копии провайдера: сессии и соединения у копии общие
+    с исходным, а режим batch свой.
+    :param w3: Web3 из реестра
+    :return: новый Web3 с копией провайдера и теми же middleware
+    """
+    return Web3(copy.copy(w3.provider), middleware=w3.middleware_onion.middleware)
+
+
+if __name__ == '__main__':
+    pass
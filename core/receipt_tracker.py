@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from loguru import logger
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from config.settings import config
+from models.tx_result import TxResult
+from utils.metrics import metrics
+
+
+class _Pending:
+    def __init__(self, w3: Web3, tx_hash: str, chain: str, timeout: float) -> None:
+        self.w3 = w3
+        self.tx_hash = tx_hash
+        self.chain = chain
+        self.timeout = timeout
+        self.sent = time.monotonic()
+        self.expires = self.sent + timeout
+        self.future: Future[TxResult] = Future()
+
+
+class ReceiptTracker:
+    """
+    Ожидание квитанций отправленных транзакций в одном фоновом потоке.
+
+    Вместо wait_for_transaction_receipt в каждом потоке аккаунта, который ждет включения в блок и ничего не делает,
+    транзакции регистрируются через track, а поток раз в config.receipt_poll_interval секунд запрашивает
+    квитанции всех ожидающих транзакций одним JSON-RPC batch запросом на каждый Web3.
+    Когда квитанция получена или истекло config.receipt_timeout секунд, Future разрешается объектом TxResult.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[str, _Pending] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(
+            self,
+            w3: Web3,
+            tx_hash: str,
+            chain: str,
+            callback: Optional[Callable[[TxResult], None]] = None,
+            timeout: Optional[float] = None
+    ) -> Future[TxResult]:
+        """
+        Добавляет транзакцию в ожидание.
+        :param w3: Web3 сети транзакции
+        :param tx_hash: хэш транзакции
+        :param chain: название сети, для логов и метрик
+        :param callback: функция, которая будет вызвана с TxResult в фоновом потоке
+        :param timeout: сколько секунд ждать квитанцию, если не указано, берется config.receipt_timeout
+        :return: Future с TxResult
+        """
+        pending = _Pending(w3, tx_hash, chain, timeout or config.receipt_timeout)
+        if callback:
+            pending.future.add_done_callback(lambda future: self._run_callback(callback, future))
+        with self._condition:
+            self._pending[tx_hash] = pending
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='receipt-tracker', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return pending.future
+
+    @staticmethod
+    def _run_callback(callback: Callable[[TxResult], None], future: Future[TxResult]) -> None:
+        if future.exception() is not None:
+            return
+        result = future.result()
+        try:
+            callback(result)
+        except Exception as e:
+            logger.error(f'Ошибка в обработчике результата транзакции {result.tx_hash}: {e}')
+
+    def outstanding(self) -> int:
+        """
+        :return: количество транзакций, ожидающих квитанцию
+        """
+        with self._condition:
+            return len(self._pending)
+
+    def _loop(self) -> None:
+        try:
+            while True:
+                self._tick()
+        except BaseException as e:
+            # без потока трекера Future никогда не разрешатся, поэтому все ожидающие завершаются ошибкой,
+            # а следующий track запустит поток заново
+            logger.exception(f'Поток ожидания квитанций остановлен из-за ошибки: {e}')
+            with self._condition:
+                failed = list(self._pending.values())
+                self._pending.clear()
+                self._thread = None
+            for pending in failed:
+                self._set_exception(pending, e)
+
+    def _tick(self) -> None:
+        """
+        Одна проверка квитанций всех ожидающих транзакций.
+        :return: None
+        """
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            by_w3: dict[int, list[_Pending]] = {}
+            for pending in self._pending.values():
+                by_w3.setdefault(id(pending.w3), []).append(pending)
+
+        for group in by_w3.values():
+            for start in range(0, len(group), config.receipt_batch_size):
+                try:
+                    self._poll(group[start:start + config.receipt_batch_size])
+                except Exception as e:
+                    logger.error(f'Ошибка проверки квитанций транзакций: {e}')
+
+        now = time.monotonic()
+        with self._condition:
+            expired = [pending for pending in self._pending.values() if pending.expires <= now]
+        for pending in expired:
+            error = f'квитанция не получена за {pending.timeout} секунд'
+            logger.warning(f'Транзакция {pending.tx_hash} в сети {pending.chain}: {error}')
+            self._resolve(pending, TxResult(pending.tx_hash, pending.chain, error=error))
+        time.sleep(config.receipt_poll_interval)
+
+    def _poll(self, group: list[_Pending]) -> None:
+        """
+        Запрашивает квитанции группы транзакций одного Web3. Если rpc не принимает batch, запросы идут по одному.
+        :param group: транзакции
+        :return: None
+        """
+        w3 = group[0].w3
+        try:
+            responses = w3.provider.make_batch_request(
+                [('eth_getTransactionReceipt', [pending.tx_hash]) for pending in group]
+            )
+            if not isinstance(responses, list):
+                raise ValueError(responses)
+            # ответы batch могут прийти в любом порядке
+            receipts = [response.get('result') for response in sorted(responses, key=lambda r: r.get('id'))]
+        except Exception as e:
+            logger.debug(f'batch запрос квитанций не выполнен, запросы по одному: {e}')
+            receipts = []
+            for pending in group:
+                try:
+                    receipts.append(w3.eth.get_transaction_receipt(pending.tx_hash))
+                except TransactionNotFound:
+                    receipts.append(None)
+                except Exception as e:
+                    logger.debug(f'Ошибка запроса квитанции {pending.tx_hash}: {e}')
+                    receipts.append(None)
+
+        for pending, receipt in zip(group, receipts):
+            if not receipt:
+                continue
+            try:
+                result = TxResult.from_receipt(receipt, pending.chain)
+                if not result.status:
+                    logger.error(f'Транзакция {pending.tx_hash} в сети {pending.chain} отменена (revert)')
+                self._resolve(pending, result)
+                metrics.observe('tx_confirmation_seconds', time.monotonic() - pending.sent, chain=pending.chain)
+            except Exception as e:
+                # ошибка одной квитанции не должна оставлять ее Future без результата
+                logger.error(f'Ошибка обработки квитанции {pending.tx_hash}: {e}')
+                with self._condition:
+                    self._pending.pop(pending.tx_hash, None)
+                self._set_exception(pending, e)
+
+    def _resolve(self, pending: _Pending, result: TxResult) -> None:
+        with self._condition:
+            if self._pending.pop(pending.tx_hash, None) is None:
+                return
+        pending.future.set_result(result)
+        metrics.inc('tx_receipts_total', chain=pending.chain, status={True: 'success', False: 'reverted',
+                                                                       None: 'timeout'}[result.status])
+
+    @staticmethod
+    def _set_exception(pending: _Pending, error: BaseException) -> None:
+        if not pending.future.done():
+            pending.future.set_exception(error)
+
+
+# общий трекер квитанций процесса
+receipt_tracker = ReceiptTracker()
+
+
+if __name__ == '__main__':
+    pass
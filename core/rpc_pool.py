@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any
+
+import requests
+from loguru import logger
+from web3 import HTTPProvider, Web3
+from web3.providers import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from config import config
+from core.nonce_manager import KNOWN_TX_ERRORS
+from models.chain import Chain
+from utils.metrics import metrics
+
+# коды и тексты ошибок JSON-RPC, которыми публичные rpc сообщают о превышении лимита запросов
+RATE_LIMIT_CODES = {-32005, -32029, -32090, 429}
+RATE_LIMIT_WORDS = ('rate limit', 'too many requests', 'exceeded')
+# методы, которые после сетевой ошибки нельзя повторять на другом rpc: запрос мог быть выполнен, повтор
+# подпишет и отправит новую транзакцию
+NO_FAILOVER_METHODS = {'eth_sendTransaction', 'personal_sendTransaction'}
+# отправка подписанной транзакции повторяется на другом rpc без изменений: повтор той же транзакции
+# не создает новую, а если первая отправка дошла, rpc ответит already known
+SEND_RAW_METHOD = 'eth_sendRawTransaction'
+
+
+class RpcEndpoint:
+    """
+    Статистика одного rpc: экспоненциальное скользящее среднее задержки и доли ошибок.
+    """
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.latency = 0.0  # EWMA задержки в секундах, 0 - еще не было запросов
+        self.error_rate = 0.0  # EWMA доли ошибок от 0 до 1
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def score(self) -> float:
+        """
+        Оценка rpc, чем меньше, тем лучше. Ошибки увеличивают оценку, неопробованные rpc идут первыми.
+        """
+        return self.latency * (1 + 10 * self.error_rate)
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+
+class RpcPool:
+    """
+    Набор rpc одной сети с выбором самого быстрого исправного.
+
+    После каждого запроса обновляются EWMA задержки и доли ошибок с коэффициентом config.rpc_ewma_alpha.
+    При таймауте, ошибке соединения, 429/5xx или ошибке лимита запросов rpc уходит на паузу
+    config.rpc_cooldown секунд, а запрос повторяется на следующем rpc.
+    """
+
+    def __init__(self, chain: Chain) -> None:
+        self.chain = chain
+        self.endpoints = [RpcEndpoint(url) for url in chain.rpcs]
+        self._lock = threading.Lock()
+
+    def ordered(self) -> list[RpcEndpoint]:
+        """
+        Rpc в порядке предпочтения: сначала исправные по возрастанию оценки, затем на паузе.
+        :return: список rpc
+        """
+        now = time.monotonic()
+        with self._lock:
+            return sorted(self.endpoints, key=lambda endpoint: (not endpoint.is_healthy(now), endpoint.score))
+
+    def record(self, endpoint: RpcEndpoint, latency: float, error: bool = False) -> None:
+        """
+        Обновляет статистику rpc после запроса.
+        :param endpoint: rpc
+        :param latency: время запроса в секундах
+        :param error: была ли ошибка, при ошибке rpc уходит на паузу
+        :return: None
+        """
+        alpha = config.rpc_ewma_alpha
+        with self._lock:
+            endpoint.requests += 1
+            endpoint.latency = latency if not endpoint.latency else alpha * latency + (1 - alpha) * endpoint.latency
+            endpoint.error_rate = alpha * error + (1 - alpha) * endpoint.error_rate
+            if error:
+                endpoint.errors += 1
+                endpoint.cooldown_until = time.monotonic() + config.rpc_cooldown
+
+    def ranking(self) -> list[dict[str, Any]]:
+        """
+        Текущая статистика rpc, лучшие первыми.
+        :return: список словарей url, latency, error_rate, requests, errors, healthy
+        """
+        now = time.monotonic()
+        return [
+            {'url': endpoint.url, 'latency': endpoint.latency, 'error_rate': endpoint.error_rate,
+             'requests': endpoint.requests, 'errors': endpoint.errors, 'healthy': endpoint.is_healthy(now)}
+            for endpoint in self.ordered()
+        ]
+
+
+# пулы rpc по имени сети, общие для процесса
+_pools: dict[str, RpcPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(chain: Chain) -> RpcPool:
+    """
+    Возвращает общий пул rpc сети.
+    :param chain: объект Chain
+    :return: пул rpc
+    """
+    with _pools_lock:
+        pool = _pools.get(chain.name)
+        if pool is None:
+            pool = _pools[chain.name] = RpcPool(chain)
+        return pool
+
+
+def _is_rate_limited(response: Any) -> bool:
+    """
+    Проверяет, что ответ rpc - ошибка лимита запросов.
+    """
+    responses = response if isinstance(response, list) else [response]
+    for item in responses:
+        error = item.get('error') if isinstance(item, dict) else None
+        if not isinstance(error, dict):
+            continue
+        message = str(error.get('message', '')).lower()
+        if error.get('code') in RATE_LIMIT_CODES or any(word in message for word in RATE_LIMIT_WORDS):
+            return True
+    return False
+
+
+def _is_already_known(response: Any) -> bool:
+    """
+    Проверяет, что ответ rpc на отправку транзакции - ошибка о том, что эта транзакция уже есть в мемпуле.
+    """
+    error = response.get('error') if isinstance(response, dict) else None
+    message = str(error.get('message', '')).lower() if isinstance(error, dict) else ''
+    return any(text in message for text in KNOWN_TX_ERRORS)
+
+
+class FailoverProvider(JSONBaseProvider):
+    """
+    Провайдер web3, который отправляет запрос в лучший rpc пула и при сбое повторяет его на следующем.
+    Отправка транзакций на другом rpc повторяется только для подписанной транзакции (eth_sendRawTransaction)
+    и не больше одного раза, теми же байтами. Ответ already known считается успешной отправкой.
+    Для каждого rpc используется HTTPProvider со своей keep-alive сессией и без встроенных повторов,
+    чтобы переключение происходило сразу.
+    """
+
+    def __init__(self, pool: RpcPool, providers: dict[str, HTTPProvider]) -> None:
+        """
+        :param pool: пул rpc сети
+        :param providers: HTTPProvider для каждого url пула
+        """
+        super().__init__()
+        self.pool = pool
+        self.providers = providers
+        # используется как ключ, например в Onchain._no_batch
+        self.endpoint_uri = f'pool:{pool.chain.name}'
+
+    def _send(self, call: str, methods: set[str], *args: Any) -> Any:
+        """
+        Отправляет запрос в лучший rpc, при сбое - в следующий.
+        :param call: make_request или make_batch_request
+        :param methods: методы JSON-RPC запроса
+        :param args: аргументы call
+        :return: ответ rpc
+        """
+        last_error = None
+        response = None
+        sends = 0
+        for endpoint in self.pool.ordered():
+            provider = self.providers[endpoint.url]
+            started = time.perf_counter()
+            try:
+                if SEND_RAW_METHOD in methods:
+                    sends += 1
+                response = getattr(provider, call)(*args)
+            except (requests.Timeout, requests.ConnectionError, requests.HTTPError) as e:
+                self.pool.record(endpoint, time.perf_counter() - started, error=True)
+                # подписанную транзакцию отправляем повторно не больше одного раза и только одиночным запросом
+                if methods & NO_FAILOVER_METHODS or (SEND_RAW_METHOD in methods and (
+                        call != 'make_request' or sends > 1)):
+                    raise
+                metrics.inc('rpc_failover_total', chain=self.pool.chain.name)
+                logger.debug(f'rpc {endpoint.url} недоступен, пробуем следующий: {e}')
+                last_error = e
+                continue
+            if _is_rate_limited(response):
+                self.pool.record(endpoint, time.perf_counter() - started, error=True)
+                metrics.inc('rpc_failover_total', chain=self.pool.chain.name)
+                logger.debug(f'rpc {endpoint.url} превышен лимит запросов, пробуем следующий')
+                continue
+            self.pool.record(endpoint, time.perf_counter() - started)
+            return response
+        if response is not None:
+            return response
+        raise last_error
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        response = self._send('make_request', {method}, method, params)
+        if method == SEND_RAW_METHOD and _is_already_known(response):
+            # транзакция уже в мемпуле, например первая отправка дошла до rpc, который не успел ответить
+            tx_hash = Web3.keccak(hexstr=params[0]).to_0x_hex()
+            return RPCResponse(jsonrpc='2.0', id=response.get('id'), result=tx_hash)
+        return response
+
+    def make_batch_request(self, requests_list: list[tuple[RPCEndpoint, Any]]) -> list[RPCResponse]:
+        return self._send('make_batch_request', {method for method, _ in requests_list}, requests_list)
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return any(provider.is_connected() for provider in self.providers.values())
+
+
+if __name__ == '__main__':
+    pass
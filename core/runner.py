@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection, wait
+from typing import Callable, Iterable
+
+from loguru import logger
+
+from config import config
+from core.work_queue import AbsWorkQueue
+from models.account import Account
+from utils.logging import init_logger
+from utils.metrics import metrics
+from utils.utils import random_sleep
+
+
+class CycleStats:
+    """
+    Статистика одного цикла: количество обработанных аккаунтов и время работы.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.processed = 0
+        self._lock = threading.Lock()
+
+    def add(self, number: int = 1) -> None:
+        """
+        Увеличивает счетчик обработанных аккаунтов, потокобезопасно.
+        :param number: на сколько увеличить
+        :return: None
+        """
+        with self._lock:
+            self.processed += number
+
+    @property
+    def elapsed(self) -> float:
+        """
+        Время работы цикла в секундах
+        """
+        return time.monotonic() - self.started
+
+    @property
+    def per_minute(self) -> float:
+        """
+        Пропускная способность, аккаунтов в минуту
+        """
+        if not self.elapsed:
+            return 0.0
+        return self.processed / self.elapsed * 60
+
+
+def run_accounts(
+        accounts: Iterable[Account],
+        worker: Callable[[Account], None],
+        max_workers: int | None = None,
+        on_done: Callable[[Account], None] | None = None
+) -> CycleStats:
+    """
+    Запускает worker для каждого аккаунта в max_workers параллельных слотах.
+    Каждый слот берет следующий аккаунт из общей очереди, после аккаунта делает паузу
+    config.pause_between_profile, так что паузы между профилями сохраняются внутри слота.
+    При max_workers = 1 поведение совпадает с последовательным перебором.
+    :param accounts: аккаунты для работы
+    :param worker: функция воркера, принимает аккаунт
+    :param max_workers: количество параллельных слотов, если не указано, берется из config.max_workers
+    :param on_done: функция, которая вызывается после обработки каждого аккаунта
+    :return: статистика цикла
+    """
+    max_workers = max(1, max_workers or config.max_workers)
+    stats = CycleStats()
+    accounts_iter = iter(accounts)
+    iter_lock = threading.Lock()
+
+    def next_account() -> Account | None:
+        with iter_lock:
+            return next(accounts_iter, None)
+
+    def slot() -> None:
+        while (account := next_account()) is not None:
+            try:
+                worker(account)
+            except Exception as e:
+                logger.critical(f'{account.profile_number} Необработанная ошибка воркера: {e}')
+            stats.add()
+            if on_done:
+                on_done(account)
+            # Пауза между профилями
+            random_sleep(*config.pause_between_profile)
+
+    if max_workers == 1:
+        slot()
+        return stats
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='worker') as executor:
+        futures = [executor.submit(slot) for _ in range(max_workers)]
+        for future in futures:
+            future.result()
+    return stats
+
+
+def _shard_main(
+        shard_id: int,
+        accounts: list[Account],
+        worker: Callable[[Account], None],
+        events: Connection,
+        max_workers: int
+) -> None:
+    """
+    Точка входа процесса шарда: обрабатывает свои аккаунты и сообщает координатору о старте
+    и завершении каждого аккаунта через свой канал events, а также раз в config.shard_heartbeat_interval
+    секунд отправляет heartbeat, по которому координатор понимает, что процесс не завис.
+    """
+    init_logger()
+    metrics.start(instance=shard_id)
+    stopped = threading.Event()
+    # в канал пишут поток heartbeat и потоки аккаунтов, Connection не потокобезопасен
+    send_lock = threading.Lock()
+
+    def send(kind: str, profile_number: str) -> None:
+        with send_lock:
+            events.send((kind, shard_id, profile_number))
+
+    def heartbeat() -> None:
+        while not stopped.wait(config.shard_heartbeat_interval):
+            send('heartbeat', '')
+
+    threading.Thread(target=heartbeat, name='shard-heartbeat', daemon=True).start()
+
+    def tracked_worker(account: Account) -> None:
+        send('start', account.profile_number)
+        worker(account)
+
+    def on_done(account: Account) -> None:
+        send('done', account.profile_number)
+
+    run_accounts(accounts, tracked_worker, max_workers, on_done)
+    stopped.set()
+    metrics.flush()
+    events.close()
+
+
+class _Shard:
+    """
+    Состояние шарда на стороне координатора.
+    """
+
+    def __init__(self, shard_id: int, accounts: list[Account]) -> None:
+        self.shard_id = shard_id
+        self.remaining: dict[str, Account] = {str(account.profile_number): account for account in accounts}
+        self.in_progress: set[str] = set()
+        # сколько раз аккаунт прерывался падением или зависанием процесса
+        self.interrupted: dict[str, int] = {}
+        self.restarts = 0
+        self.last_seen = time.monotonic()
+        self.process: multiprocessing.Process | None = None
+        # канал событий от текущего процесса шарда, у каждого процесса свой, чтобы убитый процесс
+        # не мог повредить или заблокировать общую очередь остальных шардов
+        self.events: Connection | None = None
+
+
+def run_sharded(
+        accounts: list[Account],
+        worker: Callable[[Account], None],
+        shards: int | None = None,
+        on_done: Callable[[Account], None] | None = None
+) -> CycleStats:
+    """
+    Делит аккаунты на shards частей и запускает каждую в отдельном процессе со своим драйвером playwright.
+    Внутри процесса аккаунты обрабатываются через run_accounts в config.max_workers потоков.
+    Координатор собирает результаты и перезапускает упавшие процессы, а также процессы, от которых
+    не было heartbeat дольше config.shard_timeout секунд (например, процесс завис целиком).
+    Оставшиеся аккаунты продолжаются в новом процессе. Аккаунты, которые были в работе в момент падения,
+    запускаются повторно с начала не больше config.shard_account_retries раз (по умолчанию 0, т.к. аккаунт
+    мог успеть отправить транзакции или вывод), после этого пропускаются и не передаются в on_done,
+    то есть остаются незавершенными в журнале цикла.
+    :param accounts: аккаунты для работы
+    :param worker: функция воркера уровня модуля (должна сериализоваться pickle)
+    :param shards: количество процессов, если не указано, берется из config.shards
+    :param on_done: функция, которая вызывается в координаторе после обработки каждого аккаунта
+    :return: статистика цикла
+    """
+    shards = max(1, min(shards or config.shards, len(accounts)))
+    stats = CycleStats()
+    if not accounts:
+        return stats
+
+    context = multiprocessing.get_context('spawn')
+    by_shard = [_Shard(shard_id, accounts[shard_id::shards]) for shard_id in range(shards)]
+    active: dict[int, _Shard] = {}
+
+    def start(shard: _Shard) -> None:
+        shard.in_progress.clear()
+        shard.last_seen = time.monotonic()
+        shard.events, sender = context.Pipe(duplex=False)
+        shard.process = context.Process(
+            target=_shard_main,
+            args=(shard.shard_id, list(shard.remaining.values()), worker, sender, config.max_workers),
+            name=f'shard-{shard.shard_id}'
+        )
+        shard.process.start()
+        # копия в координаторе не нужна, после выхода процесса чтение канала вернет EOF
+        sender.close()
+        active[shard.shard_id] = shard
+        logger.info(f'Шард {shard.shard_id} запущен, аккаунтов: {len(shard.remaining)}')
+
+    def handle(event: tuple[str, int, str]) -> None:
+        kind, shard_id, profile_number = event
+        shard = by_shard[shard_id]
+        profile_number = str(profile_number)
+        shard.last_seen = time.monotonic()
+        if kind == 'heartbeat':
+            return
+        if kind == 'start':
+            shard.in_progress.add(profile_number)
+            return
+        shard.in_progress.discard(profile_number)
+        account = shard.remaining.pop(profile_number, None)
+        if account is None:
+            return
+        stats.add()
+        if on_done:
+            on_done(account)
+
+    def drain(timeout: float) -> None:
+        channels = {shard.events: shard for shard in active.values() if shard.events is not None}
+        for channel in wait(list(channels), timeout=timeout):
+            shard = channels[channel]
+            try:
+                while channel.poll():
+                    handle(channel.recv())
+            except (EOFError, OSError):
+                # процесс завершился и закрыл канал, либо был убит посреди записи
+                close_events(shard)
+
+    def close_events(shard: _Shard) -> None:
+        if shard.events is not None:
+            shard.events.close()
+            shard.events = None
+
+    def restart(shard: _Shard, reason: str) -> None:
+        del active[shard.shard_id]
+        close_events(shard)
+        for profile_number in shard.in_progress:
+            if profile_number not in shard.remaining:
+                continue
+            shard.interrupted[profile_number] = shard.interrupted.get(profile_number, 0) + 1
+            if shard.interrupted[profile_number] > config.shard_account_retries:
+                shard.remaining.pop(profile_number)
+                logger.critical(f'{profile_number} Аккаунт пропущен и остается незавершенным в журнале, '
+                                f'шард {shard.shard_id} {reason}')
+            else:
+                logger.warning(f'{profile_number} Аккаунт будет запущен повторно, шард {shard.shard_id} {reason}')
+        shard.restarts += 1
+        if not shard.remaining:
+            return
+        if shard.restarts > config.shard_restarts:
+            logger.critical(f'Шард {shard.shard_id} превысил лимит перезапусков, '
+                            f'пропущено аккаунтов: {len(shard.remaining)}')
+            return
+        logger.warning(f'Шард {shard.shard_id} {reason}, перезапуск {shard.restarts}/{config.shard_restarts}')
+        start(shard)
+
+    for shard in by_shard:
+        start(shard)
+
+    try:
+        while active:
+            drain(timeout=1)
+            for shard in list(active.values()):
+                if shard.process.is_alive():
+                    if time.monotonic() - shard.last_seen > config.shard_timeout:
+                        shard.process.kill()
+                        shard.process.join()
+                        restart(shard, f'завис, нет heartbeat {config.shard_timeout} секунд')
+                    continue
+                shard.process.join()
+                # события могли прийти после последней проверки
+                drain(timeout=0.1)
+                if shard.process.exitcode == 0 and not shard.remaining:
+                    del active[shard.shard_id]
+                    close_events(shard)
+                    continue
+                restart(shard, f'завершился с кодом {shard.process.exitcode}')
+    finally:
+        for shard in active.values():
+            if shard.process.is_alive():
+                shard.process.kill()
+            close_events(shard)
+    return stats
+
+
+def run_from_queue(
+        work_queue: AbsWorkQueue,
+        cycle: int,
+        accounts: list[Account],
+        worker: Callable[[Account], None],
+        all_accounts: list[Account] | None = None
+) -> CycleStats:
+    """
+    Обрабатывает аккаунты цикла из общей очереди вместе с другими хостами.
+    Добавляет свои аккаунты цикла в очередь, затем config.max_workers потоков берут аккаунты в аренду,
+    пока в цикле есть невыполненные аккаунты. Аренда аккаунтов в работе продлевается фоновым потоком,
+    аккаунты упавших хостов забираются после истечения аренды.
+    :param work_queue: очередь аккаунтов
+    :param cycle: номер цикла
+    :param accounts: аккаунты этого хоста для цикла в порядке обработки
+    :param worker: функция воркера
+    :param all_accounts: все аккаунты для поиска по номеру профиля, если не указаны, берутся accounts
+    :return: статистика цикла
+    """
+    work_queue.fill(cycle, [str(account.profile_number) for account in accounts])
+    by_profile = {str(account.profile_number): account for account in all_accounts or accounts}
+    stats = CycleStats()
+    in_progress: set[str] = set()
+    in_progress_lock = threading.Lock()
+    stop = threading.Event()
+    poll_interval = max(1.0, work_queue.lease_time / 3)
+
+    def heartbeat() -> None:
+        while not stop.wait(poll_interval):
+            with in_progress_lock:
+                profiles = list(in_progress)
+            try:
+                work_queue.heartbeat(cycle, profiles)
+            except Exception as e:
+                logger.error(f'Не удалось продлить аренду аккаунтов в очереди: {e}')
+
+    def slot() -> None:
+        while True:
+            profile_number = work_queue.lease(cycle, by_profile)
+            if profile_number is None:
+                # свободных нет, но аккаунты могут быть у других хостов, ждем выполнения или истечения аренды,
+                # аккаунты, которых нет в файлах этого хоста, он взять не может и их не ждет
+                if work_queue.remaining(cycle, by_profile) == 0:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            account = by_profile.get(profile_number)
+            if account is None:
+                logger.warning(f'{profile_number} Аккаунт из очереди не найден в файлах этого хоста, '
+                               f'возвращаем в очередь')
+                work_queue.release(cycle, profile_number)
+                continue
+
+            with in_progress_lock:
+                in_progress.add(profile_number)
+            try:
+                worker(account)
+            except Exception as e:
+                logger.critical(f'{profile_number} Необработанная ошибка воркера: {e}')
+            finally:
+                with in_progress_lock:
+                    in_progress.discard(profile_number)
+            if not work_queue.complete(cycle, profile_number):
+                logger.warning(f'{profile_number} Аренда аккаунта истекла и он передан другому хосту, '
+                               f'выполнение не отмечено')
+            stats.add()
+            random_sleep(*config.pause_between_profile)
+
+    heartbeat_thread = threading.Thread(target=heartbeat, name='queue-heartbeat', daemon=True)
+    heartbeat_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, config.max_workers), thread_name_prefix='worker') as executor:
+            futures = [executor.submit(slot) for _ in range(max(1, config.max_workers))]
+            for future in futures:
+                future.result()
+    finally:
+        stop.set()
+        heartbeat_thread.join()
+    return stats
+
+
+def run_cycle(
+        accounts: list[Account],
+        worker: Callable[[Account], None],
+        on_done: Callable[[Account], None] | None = None
+) -> CycleStats:
+    """
+    Запускает цикл по аккаунтам в режиме из конфига: процессы (config.shards > 1) или потоки (config.max_workers).
+    :param accounts: аккаунты для работы
+    :param worker: функция воркера
+    :param on_done: функция, которая вызывается после обработки каждого аккаунта
+    :return: статистика цикла
+    """
+    if config.shards > 1:
+        return run_sharded(accounts, worker, on_done=on_done)
+    return run_accounts(accounts, worker, on_done=on_done)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+import time
+from datetime import datetime
+from typing import Callable
+
+from loguru import logger
+
+from config import config
+from core.runner import run_cycle
+from models.account import Account
+from utils.metrics import metrics
+
+# функция, которая возвращает время, когда аккаунт можно запускать, или None, если аккаунт не проходит фильтры
+NextRunTimes = Callable[[list[Account]], list[tuple[Account, datetime | None]]]
+
+
+class EligibilityScheduler:
+    """
+    Планировщик запуска аккаунтов по времени, когда они становятся доступны для работы.
+
+    Хранит min-heap из (время запуска, аккаунт), спит до ближайшего времени, запускает все аккаунты,
+    время которых наступило, и возвращает их в кучу с новым временем после работы.
+    Вместо опроса всех аккаунтов раз в pause_between_cycle нагрузка распределяется по мере готовности аккаунтов.
+
+    Аккаунты, которые не проходят фильтры, или у которых после работы время запуска не сдвинулось,
+    перепроверяются через случайную паузу из config.pause_between_cycle. Перед запуском все аккаунты,
+    время которых наступило, проверяются фильтрами заново.
+    """
+
+    def __init__(self, next_run_times: NextRunTimes) -> None:
+        """
+        :param next_run_times: функция расчета времени запуска для списка аккаунтов
+        """
+        self._next_run_times = next_run_times
+        self._heap: list[tuple[float, int, Account]] = []
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _recheck_time(self) -> float:
+        return time.time() + random.uniform(*config.pause_between_cycle)
+
+    def push(self, account: Account, run_time: datetime | None, min_time: float | None = None) -> None:
+        """
+        Добавляет аккаунт в кучу.
+        :param account: аккаунт
+        :param run_time: время, когда аккаунт можно запускать, None - перепроверить позже
+        :param min_time: минимальное время запуска (timestamp), чтобы не запускать аккаунт повторно сразу после работы
+        :return: None
+        """
+        timestamp = run_time.timestamp() if run_time else self._recheck_time()
+        if min_time and timestamp < min_time:
+            timestamp = min_time
+        heapq.heappush(self._heap, (timestamp, next(self._counter), account))
+
+    def reschedule(self, accounts: list[Account], after_run: bool = False) -> None:
+        """
+        Пересчитывает время запуска аккаунтов и возвращает их в кучу.
+        :param accounts: аккаунты
+        :param after_run: аккаунты только что отработали, их нельзя запускать раньше паузы pause_between_cycle
+        :return: None
+        """
+        min_time = self._recheck_time() if after_run else None
+        for account, run_time in self._next_run_times(accounts):
+            self.push(account, run_time, min_time)
+
+    def pop_due(self) -> list[Account]:
+        """
+        Достает из кучи все аккаунты, время которых наступило, и заново проверяет их фильтрами одним вызовом
+        next_run_times, так как отчет мог измениться с момента добавления в кучу. Запускаются только аккаунты,
+        время запуска которых по-прежнему наступило, остальные возвращаются в кучу с новым временем.
+        :return: список аккаунтов для запуска
+        """
+        now = time.time()
+        popped = []
+        while self._heap and self._heap[0][0] <= now:
+            popped.append(heapq.heappop(self._heap)[2])
+        if not popped:
+            return []
+        due = []
+        for account, run_time in self._next_run_times(popped):
+            if run_time is not None and run_time.timestamp() <= now:
+                due.append(account)
+            else:
+                self.push(account, run_time)
+        return due
+
+    def wait(self) -> None:
+        """
+        Спит до времени ближайшего аккаунта.
+        :return: None
+        """
+        if not self._heap:
+            return
+        delay = self._heap[0][0] - time.time()
+        if delay <= 0:
+            return
+        next_run = datetime.fromtimestamp(self._heap[0][0]).strftime(config.date_format)
+        logger.info(f'Следующий аккаунт {self._heap[0][2].profile_number} будет запущен {next_run}')
+        time.sleep(delay)
+
+    def run(
+            self,
+            accounts: list[Account],
+            worker: Callable[[Account], None],
+            rounds: int | None = None
+    ) -> None:
+        """
+        Запускает аккаунты по мере наступления их времени.
+        :param accounts: все аккаунты
+        :param worker: функция воркера
+        :param rounds: сколько раз запускать готовые аккаунты, если не указано, берется config.cycle,
+            пробуждения, после которых запускать оказалось некого, не считаются
+        :return: None
+        """
+        rounds = rounds or config.cycle
+        self.reschedule(accounts)
+        logger.info(f'Планировщик запущен, аккаунтов в очереди: {len(self)}')
+
+        done_rounds = 0
+        while done_rounds < rounds and self._heap:
+            self.wait()
+            accounts_for_work = self.pop_due()
+            if not accounts_for_work:
+                continue
+            done_rounds += 1
+            stats = run_cycle(accounts_for_work, worker)
+            logger.success(f'Запуск {done_rounds}: обработано {stats.processed} аккаунтов '
+                           f'за {stats.elapsed / 60:.1f} мин, {stats.per_minute:.1f} аккаунтов/мин')
+            self.reschedule(accounts_for_work, after_run=True)
+            metrics.flush()
+
+
+if __name__ == '__main__':
+    pass
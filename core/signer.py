@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional, TYPE_CHECKING
+
+from eth_account import Account as EthAccount
+from loguru import logger
+
+from config.settings import config
+from core.nonce_manager import nonce_manager, is_nonce_error, is_send_uncertain
+
+if TYPE_CHECKING:
+    from core.onchain import Onchain
+
+# аккаунт процесса-подписчика, ключ передается один раз при запуске процесса и хранится только в его памяти
+_account = None
+
+
+def _init_signer(private_key: str) -> None:
+    global _account
+    _account = EthAccount.from_key(private_key)
+
+
+def _sign(tx: dict) -> tuple[str, bytes]:
+    """
+    Подпись транзакции в процессе-подписчике.
+    :param tx: параметры транзакции с nonce и газом
+    :return: хэш и подписанная транзакция
+    """
+    signed = _account.sign_transaction(tx)
+    return signed.hash.to_0x_hex(), bytes(signed.raw_transaction)
+
+
+class BulkSigner:
+    """
+    Подпись многих транзакций одного ключа в пуле процессов, по одной транзакции на ядро одновременно.
+    Подпись (keccak и secp256k1 на python) нагружает процессор и в потоках упирается в GIL, в процессах
+    скорость растет с количеством ядер. Ключ передается процессам при запуске через initializer,
+    в задачах передаются только параметры транзакций.
+
+        with BulkSigner(account.private_key) as signer:
+            for tx_hash, raw in signer.sign(txs): ...
+    """
+
+    def __init__(self, private_key: str, processes: Optional[int] = None) -> None:
+        """
+        :param private_key: приватный ключ
+        :param processes: количество процессов, если не указано, берется config.sign_processes или количество ядер
+        """
+        self.processes = processes or config.sign_processes or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_signer,
+            initargs=(private_key,)
+        )
+
+    def sign(self, txs: list[dict]) -> Iterator[tuple[str, bytes]]:
+        """
+        Подписывает транзакции, результаты возвращаются по порядку по мере готовности,
+        так что отправку первых можно начинать, пока остальные подписываются.
+        :param txs: параметры транзакций с nonce и газом
+        :return: итератор (хэш, подписанная транзакция)
+        """
+        chunksize = max(1, len(txs) // (self.processes * 4))
+        return self._executor.map(_sign, txs, chunksize=chunksize)
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Останавливает процессы пула.
+        :param wait: ждать завершения процессов, при False уже переданные задачи дорабатываются в фоне
+        :return: None
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=wait)
+
+    def __enter__(self) -> BulkSigner:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class SignerPools:
+    """
+    Запущенные пулы BulkSigner, по одному на ключ, переиспользуются между пакетами транзакций до конца работы.
+    Запуск пула (spawn процессов и импорт eth_account в каждом) занимает заметно больше, чем подпись
+    небольшого пакета, поэтому пул создается один раз на ключ, а не на каждый пакет.
+    Запущенными держится не больше config.sign_pools пулов, давно не использованный пул останавливается.
+    """
+
+    def __init__(self) -> None:
+        self._signers: OrderedDict[str, BulkSigner] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sign(self, private_key: str, txs: list[dict], processes: Optional[int] = None) -> Iterator[tuple[str, bytes]]:
+        """
+        Подписывает транзакции в пуле ключа, запускает пул при первом обращении.
+        :param private_key: приватный ключ
+        :param txs: параметры транзакций с nonce и газом
+        :param processes: количество процессов нового пула
+        :return: итератор (хэш, подписанная транзакция), как у BulkSigner.sign
+        """
+        address = EthAccount.from_key(private_key).address
+        # задачи передаются пулу под блокировкой, чтобы другой поток не остановил его между выбором и передачей
+        with self._lock:
+            signer = self._signers.get(address)
+            if signer is None:
+                signer = self._signers[address] = BulkSigner(private_key, processes)
+                while len(self._signers) > max(1, config.sign_pools):
+                    # задачи, уже переданные вытесненному пулу, дорабатываются
+                    _, evicted = self._signers.popitem(last=False)
+                    evicted.close(wait=False)
+            self._signers.move_to_end(address)
+            return signer.sign(txs)
+
+    def close(self) -> None:
+        with self._lock:
+            while self._signers:
+                self._signers.popitem()[1].close()
+
+
+# пулы подписи процесса
+signer_pools = SignerPools()
+
+
+class SigningPipeline:
+    """
+    Отправка пакета транзакций одного аккаунта: nonce выдаются подряд из nonce_manager, транзакции подписываются
+    в пуле процессов ключа из signer_pools (если их не меньше config.bulk_sign_min, иначе в текущем процессе),
+    подписанные отправляются по порядку, пока подписываются следующие.
+
+    Если отправка транзакции не прошла или вызывающий код закрыл итератор run (например break из цикла),
+    следующие не отправляются (с пропущенным nonce они бы зависли), их nonce возвращаются nonce_manager. Если отправка не прошла из-за ошибки nonce или сети, транзакция могла
+    дойти до мемпула, тогда nonce не возвращаются, а синхронизируются с pending при следующей выдаче.
+    """
+
+    def __init__(self, onchain: Onchain, processes: Optional[int] = None) -> None:
+        """
+        :param onchain: Onchain аккаунта и сети
+        :param processes: количество процессов подписи
+        """
+        self.onchain = onchain
+        self.processes = processes
+
+    def run(self, txs: list[dict]) -> Iterator[tuple[int, Optional[str], Optional[Exception]]]:
+        """
+        Подписывает и отправляет транзакции, без ожидания включения в блок.
+        :param txs: параметры транзакций с газом и комиссией (например из _prepare_tx и _estimate_gas), без nonce
+        :return: итератор (номер транзакции, хэш или None, ошибка или None) по мере отправки
+        """
+        onchain = self.onchain
+        chain_id, address = onchain.chain.chain_id, onchain.account.address
+        nonces = [nonce_manager.allocate(chain_id, address, onchain._pending_nonce) for _ in txs]
+        txs = [{**tx, 'nonce': nonce} for tx, nonce in zip(txs, nonces)]
+
+        if len(txs) >= config.bulk_sign_min:
+            signed = signer_pools.sign(onchain.account.private_key, txs, self.processes)
+        else:
+            account = EthAccount.from_key(onchain.account.private_key)
+            signed = ((item.hash.to_0x_hex(), bytes(item.raw_transaction))
+                      for item in map(account.sign_transaction, txs))
+
+        sent = 0
+        failed = False
+        resync = False
+        try:
+            for index, (tx_hash, raw) in enumerate(signed):
+                try:
+                    onchain._send_raw(raw, tx_hash)
+                except Exception as e:
+                    logger.error(f'{onchain.account.profile_number} Транзакция с nonce {nonces[index]} не отправлена, '
+                                 f'остальные {len(txs) - index - 1} отменены: {e}')
+                    # после ошибки nonce или сети транзакция могла остаться в мемпуле, ее nonce нельзя выдать снова
+                    resync = is_nonce_error(e) or is_send_uncertain(e)
+                    failed = True
+                    yield index, None, e
+                    break
+                # счетчик увеличивается до yield: если вызывающий код закроет итератор, nonce этой транзакции
+                # не будет возвращен
+                sent += 1
+                yield index, tx_hash, None
+        finally:
+            if resync:
+                # nonce синхронизируется с pending при следующей выдаче
+                nonce_manager.reset(chain_id, address)
+            else:
+                # возвращаем nonce неотправленных с конца, чтобы очередь аккаунта сократилась без пропусков
+                for nonce in reversed(nonces[sent:]):
+                    nonce_manager.release(chain_id, address, nonce)
+
+        # транзакции после ошибочной не отправлялись
+        for index in range(sent + failed, len(txs)):
+            yield index, None, None
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Optional
+
+from loguru import logger
+
+from config import config, Tokens
+from models.token import TokenTypes
+from utils.file_lock import FileLock
+from utils.metrics import metrics
+from utils.utils import to_checksum
+
+
+class TokenCache:
+    """
+    Общий для процесса кеш параметров токенов (chain_id, адрес) -> (symbol, decimals), сохраняемый в файл
+    config.PATH_TOKEN_CACHE.
+
+    При первом обращении загружается из файла и заполняется токенами из config/tokens.py, новые токены
+    дописываются в файл, поэтому повторные запросы параметров одного токена не обращаются к rpc ни в этом,
+    ни в следующих запусках. Параметры токенов неизменяемы, поэтому записи не устаревают.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """
+        :param path: путь к файлу кеша, если не указан, берется config.PATH_TOKEN_CACHE
+        """
+        self.path = path or config.PATH_TOKEN_CACHE
+        self._tokens: dict[tuple[int, str], tuple[str, int]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(self.path + '.lock')
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> None:
+        """
+        Загружает кеш из файла и токены из config/tokens.py. Вызывается под self._lock.
+        :return: None
+        """
+        if self._loaded:
+            return
+        self._loaded = True
+        for token in Tokens.get_tokens():
+            if token.type_token != TokenTypes.NATIVE:
+                self._tokens[(token.chain.chain_id, token.address)] = (token.symbol, token.decimals)
+        self._tokens.update(self._read_file())
+
+    def _read_file(self) -> dict[tuple[int, str], tuple[str, int]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Не удалось прочитать кеш токенов {self.path}, кеш будет создан заново: {e}')
+            return {}
+        return {
+            (int(chain_id), address): (symbol, int(decimals))
+            for chain_id, tokens in data.items()
+            for address, (symbol, decimals) in tokens.items()
+        }
+
+    def get(self, chain_id: int, address: str) -> Optional[tuple[str, int]]:
+        """
+        Параметры токена из кеша.
+        :param chain_id: id сети
+        :param address: адрес контракта токена
+        :return: (symbol, decimals) или None, если токена нет в кеше
+        """
+        key = (chain_id, to_checksum(address))
+        with self._lock:
+            self._load()
+            params = self._tokens.get(key)
+            if params is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.inc('token_cache_total', result='miss' if params is None else 'hit')
+        return params
+
+    def put_many(self, chain_id: int, tokens: dict[str, tuple[str, int]]) -> None:
+        """
+        Добавляет параметры токенов и сохраняет кеш в файл.
+        :param chain_id: id сети
+        :param tokens: словарь {адрес токена: (symbol, decimals)}
+        :return: None
+        """
+        if not tokens:
+            return
+        with self._lock:
+            self._load()
+            for address, (symbol, decimals) in tokens.items():
+                self._tokens[(chain_id, to_checksum(address))] = (symbol, int(decimals))
+            self._save()
+
+    def _save(self) -> None:
+        """
+        Атомарно сохраняет кеш в файл, объединяя с записями, которые добавили другие процессы.
+        Вызывается под self._lock.
+        :return: None
+        """
+        try:
+            with self._file_lock:
+                self._tokens.update({key: value for key, value in self._read_file().items() if key not in self._tokens})
+                data: dict[str, dict[str, list]] = {}
+                for (chain_id, address), (symbol, decimals) in sorted(self._tokens.items()):
+                    data.setdefault(str(chain_id), {})[address] = [symbol, decimals]
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as file:
+                    json.dump(data, file, ensure_ascii=False, indent=1)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f'Не удалось сохранить кеш токенов {self.path}: {e}')
+
+
+# общий кеш токенов процесса
+token_cache = TokenCache()
+
+
+if __name__ == '__main__':
+    pass
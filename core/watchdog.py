@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import ctypes
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from typing import Callable, Optional
+
+from loguru import logger
+
+from config.settings import config
+
+# максимальный шаг ожидания в watchdog.wait и watchdog.sleep: между шагами поток выполняет код python
+# и получает DeadlineExceeded, долгое ожидание в C (Event.wait, time.sleep) исключение не прерывает
+WAIT_STEP = 1.0
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Превышено время этапа работы аккаунта.
+    """
+
+
+def _async_raise(thread_id: int, exc_type: Optional[type[BaseException]]) -> None:
+    """
+    Выбрасывает исключение в другом потоке. Исключение возникнет, когда поток выполнит следующую инструкцию python,
+    поэтому поток, заблокированный на сети или браузере, сначала нужно разбудить (например, остановив браузер).
+    :param thread_id: идентификатор потока
+    :param exc_type: класс исключения, None - отменить еще не выброшенное исключение
+    :return: None
+    """
+    exc = ctypes.py_object(exc_type) if exc_type else None
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), exc)
+
+
+class Deadline:
+    """
+    Ограничение времени одного этапа, используется как контекстный менеджер через Watchdog.deadline.
+    """
+
+    def __init__(
+            self,
+            watchdog: Watchdog,
+            phase: str,
+            seconds: float,
+            label: str,
+            teardown: Optional[Callable[[], None]]
+    ) -> None:
+        self.phase = phase
+        self.seconds = seconds
+        self.label = label
+        self.teardown = teardown
+        self.thread_id = threading.get_ident()
+        self.expires = time.monotonic() + seconds
+        self.active = True
+        self.fired = False
+        self._watchdog = watchdog
+
+    def __enter__(self) -> Deadline:
+        self._watchdog._register(self)
+        self._watchdog._thread_deadlines().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self._watchdog._thread_deadlines().remove(self)
+        with self._watchdog._condition:
+            self.active = False
+            fired = self.fired
+        if not fired:
+            return False
+        # блок мог завершиться раньше, чем поток получил исключение, отменяем его,
+        # чтобы оно не вылетело в коде после блока
+        _async_raise(self.thread_id, None)
+        if exc_type is None:
+            raise DeadlineExceeded(f'{self.label} Превышено время этапа {self.phase} ({self.seconds} с)')
+        return False
+
+
+class Watchdog:
+    """
+    Один фоновый поток на процесс, который следит за ограничениями времени всех аккаунтов и этапов.
+
+    Ограничения хранятся в min-heap по времени истечения, поток спит до ближайшего. Когда время этапа вышло,
+    вызывается teardown (например, остановка браузера профиля через API ADS, чтобы разблокировать playwright),
+    а в поток аккаунта выбрасывается DeadlineExceeded. Количество сработавших ограничений по этапам в hits.
+
+    Ограничение: исключение доходит до потока, только когда тот выполняет код python. Поток, заблокированный
+    в ожидании внутри C (Event.wait, time.sleep, чтение сокета), получит его только после выхода из ожидания.
+    Поэтому ожидания в потоках аккаунтов делаются через watchdog.wait и watchdog.sleep короткими шагами
+    до ближайшего ограничения потока, у сетевых запросов свои таймауты (например config.rpc_timeout),
+    а браузер разблокируется через teardown.
+    """
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, int, Deadline]] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        # активные ограничения каждого потока, для шагов ожидания в wait и sleep
+        self._local = threading.local()
+        self.hits: Counter[str] = Counter()
+
+    def deadline(
+            self,
+            phase: str,
+            seconds: Optional[float] = None,
+            account=None,
+            teardown: Optional[Callable[[], None]] = None
+    ) -> Deadline | _NoDeadline:
+        """
+        Ограничивает время выполнения блока with в текущем потоке.
+        :param phase: название этапа, например browser_start, activity, withdraw_wait
+        :param seconds: ограничение в секундах, если не указано, берется config.timeouts[phase], None или 0 - без ограничения
+        :param account: аккаунт для логов
+        :param teardown: функция, которая вызывается из потока watchdog при превышении времени
+        :return: контекстный менеджер
+        """
+        if seconds is None:
+            seconds = config.timeouts.get(phase)
+        if not seconds:
+            return _NoDeadline()
+        label = str(account.profile_number) if account else phase
+        return Deadline(self, phase, seconds, label, teardown)
+
+    @property
+    def total_hits(self) -> int:
+        return sum(self.hits.values())
+
+    def _thread_deadlines(self) -> list[Deadline]:
+        deadlines = getattr(self._local, 'deadlines', None)
+        if deadlines is None:
+            deadlines = self._local.deadlines = []
+        return deadlines
+
+    def _step(self, left: Optional[float]) -> float:
+        """
+        Длительность следующего шага ожидания: не больше WAIT_STEP, оставшегося времени ожидания
+        и времени до ближайшего ограничения текущего потока.
+        :param left: сколько осталось ждать, None - без ограничения
+        :return: шаг в секундах
+        """
+        step = WAIT_STEP if left is None else min(WAIT_STEP, left)
+        for deadline in self._thread_deadlines():
+            # небольшой запас, чтобы поток watchdog успел выбросить исключение до следующего шага
+            step = min(step, max(0.01, deadline.expires - time.monotonic() + 0.01))
+        return max(0.0, step)
+
+    def wait(self, event: threading.Event, timeout: Optional[float] = None) -> bool:
+        """
+        Event.wait, которое прерывается ограничением времени этапа (DeadlineExceeded) не позже WAIT_STEP секунд.
+        :param event: событие
+        :param timeout: максимальное время ожидания в секундах, None - без ограничения
+        :return: True, если событие произошло, False по таймауту
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            left = None if end is None else end - time.monotonic()
+            if left is not None and left <= 0:
+                return event.is_set()
+            if event.wait(self._step(left)):
+                return True
+
+    def sleep(self, seconds: float) -> None:
+        """
+        time.sleep, которое прерывается ограничением времени этапа (DeadlineExceeded) не позже WAIT_STEP секунд.
+        :param seconds: время в секундах
+        :return: None
+        """
+        end = time.monotonic() + seconds
+        while (left := end - time.monotonic()) > 0:
+            time.sleep(self._step(left))
+
+    def _register(self, deadline: Deadline) -> None:
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='watchdog', daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (deadline.expires, next(self._counter), deadline))
+            self._condition.notify()
+
+    def _next_expired(self) -> Deadline:
+        """
+        Ждет ближайшее истекшее активное ограничение. Завершенные блоки удаляются из кучи по мере появления на вершине.
+        :return: истекшее ограничение, уже помеченное как сработавшее
+        """
+        with self._condition:
+            while True:
+                while self._heap and not self._heap[0][2].active:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                delay = self._heap[0][0] - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                deadline = heapq.heappop(self._heap)[2]
+                deadline.fired = True
+                self.hits[deadline.phase] += 1
+                # под блокировкой, чтобы __exit__ потока аккаунта гарантированно увидел и отменил исключение
+                _async_raise(deadline.thread_id, DeadlineExceeded)
+                return deadline
+
+    def _run(self) -> None:
+        while True:
+            deadline = self._next_expired()
+            logger.error(f'{deadline.label} Превышено время этапа {deadline.phase} ({deadline.seconds} с), '
+                         f'прерываем, всего срабатываний: {self.total_hits}')
+            if deadline.teardown is None:
+                continue
+            try:
+                deadline.teardown()
+            except Exception as e:
+                logger.error(f'{deadline.label} Ошибка при остановке этапа {deadline.phase}: {e}')
+
+
+class _NoDeadline:
+    def __enter__(self) -> _NoDeadline:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        return False
+
+
+# общий watchdog процесса
+watchdog = Watchdog()
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,2 @@
+from core.work_queue.abs_work_queue import AbsWorkQueue
+from core.work_queue.sqlite_queue import SqliteWorkQueue
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Collection, Optional
+
+
+class AbsWorkQueue(ABC):
+    """
+    Абстрактный класс очереди аккаунтов, общей для нескольких хостов.
+    Используется как основа для создания бэкендов очереди в формате: class NewWorkQueue(AbsWorkQueue).
+    Должны быть обязательно реализованы методы с аннотацией @abstractmethod.
+
+    Хост берет аккаунт в аренду (lease) на время lease_time, продлевает аренду пока работает (heartbeat)
+    и отмечает аккаунт выполненным (complete). Если хост упал и аренда истекла, аккаунт забирает другой хост.
+    В очереди хранятся только номера профилей, данные аккаунтов каждый хост берет из своих файлов.
+    """
+
+    def __init__(self, owner: str, lease_time: float) -> None:
+        """
+        :param owner: уникальное имя хоста/процесса, которому выдается аренда
+        :param lease_time: время аренды аккаунта в секундах
+        """
+        self.owner = owner
+        self.lease_time = lease_time
+
+    @abstractmethod
+    def open_cycle(self) -> int:
+        """
+        Номер цикла, к которому должен присоединиться хост: самый ранний цикл с невыполненными аккаунтами,
+        если таких нет - следующий за последним. Так хосты работают над одним циклом, а после перезапуска
+        всех хостов очередь не считает новые циклы уже выполненными.
+        :return: номер цикла
+        """
+        pass
+
+    @abstractmethod
+    def fill(self, cycle: int, profile_numbers: list[str]) -> None:
+        """
+        Добавляет аккаунты цикла в очередь. Уже добавленные другими хостами аккаунты цикла не дублируются.
+        :param cycle: номер цикла
+        :param profile_numbers: номера профилей в порядке обработки
+        """
+        pass
+
+    @abstractmethod
+    def lease(self, cycle: int, profile_numbers: Optional[Collection[str]] = None) -> str | None:
+        """
+        Берет в аренду следующий свободный аккаунт цикла или аккаунт с истекшей арендой.
+        :param cycle: номер цикла
+        :param profile_numbers: номера профилей, которые есть в файлах этого хоста, другие аккаунты не выдаются
+        :return: номер профиля или None, если свободных аккаунтов нет
+        """
+        pass
+
+    @abstractmethod
+    def release(self, cycle: int, profile_number: str) -> None:
+        """
+        Возвращает аккаунт в очередь без выполнения, чтобы его взял другой хост.
+        :param cycle: номер цикла
+        :param profile_number: номер профиля
+        """
+        pass
+
+    @abstractmethod
+    def heartbeat(self, cycle: int, profile_numbers: list[str]) -> None:
+        """
+        Продлевает аренду аккаунтов, которые сейчас в работе у этого хоста.
+        :param cycle: номер цикла
+        :param profile_numbers: номера профилей
+        """
+        pass
+
+    @abstractmethod
+    def complete(self, cycle: int, profile_number: str) -> bool:
+        """
+        Отмечает аккаунт выполненным в цикле, только если он все еще в аренде у этого хоста.
+        :param cycle: номер цикла
+        :param profile_number: номер профиля
+        :return: False, если аренда истекла и аккаунт уже забрал другой хост
+        """
+        pass
+
+    @abstractmethod
+    def remaining(self, cycle: int, profile_numbers: Optional[Collection[str]] = None) -> int:
+        """
+        Количество невыполненных аккаунтов цикла, включая арендованные другими хостами.
+        :param cycle: номер цикла
+        :param profile_numbers: считать только эти профили, например те, что есть в файлах хоста
+        :return: количество аккаунтов
+        """
+        pass
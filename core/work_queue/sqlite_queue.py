@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from typing import Collection, Optional
+
+from core.work_queue.abs_work_queue import AbsWorkQueue
+
+
+class SqliteWorkQueue(AbsWorkQueue):
+    """
+    Очередь аккаунтов в локальном файле SQLite, только для нескольких процессов на одной машине.
+    Файл нельзя размещать на сетевом диске (SMB, NFS): режим WAL там не работает и может повредить базу,
+    а блокировки файлов, на которых держится BEGIN IMMEDIATE, сетевые файловые системы надежно не поддерживают.
+    Для нескольких хостов реализуйте другой бэкенд от AbsWorkQueue на сервере базы данных.
+
+    Выдача аренды атомарна: выборка и обновление идут в одной транзакции BEGIN IMMEDIATE,
+    поэтому один аккаунт в цикле не может быть выдан двум процессам одновременно.
+    """
+
+    def __init__(self, path: str, owner: str, lease_time: float) -> None:
+        """
+        :param path: путь к файлу базы SQLite
+        :param owner: уникальное имя хоста/процесса
+        :param lease_time: время аренды аккаунта в секундах
+        """
+        super().__init__(owner, lease_time)
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS tasks ('
+                'cycle INTEGER NOT NULL, '
+                'profile TEXT NOT NULL, '
+                'position INTEGER NOT NULL, '
+                "state TEXT NOT NULL DEFAULT 'pending', "
+                'owner TEXT, '
+                'lease_until REAL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, '
+                'PRIMARY KEY (cycle, profile))'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS tasks_state ON tasks (cycle, state, position)')
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Соединение с базой, одно на поток. Транзакциями управляем сами (isolation_level=None).
+        :return: соединение
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def open_cycle(self) -> int:
+        connection = self._connection()
+        row = connection.execute("SELECT MIN(cycle) FROM tasks WHERE state != 'done'").fetchone()
+        if row[0] is not None:
+            return row[0]
+        row = connection.execute('SELECT MAX(cycle) FROM tasks').fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def fill(self, cycle: int, profile_numbers: list[str]) -> None:
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR IGNORE INTO tasks (cycle, profile, position) VALUES (?, ?, ?)',
+                [(cycle, str(profile), position) for position, profile in enumerate(profile_numbers)]
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def lease(self, cycle: int, profile_numbers: Optional[Collection[str]] = None) -> str | None:
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = connection.execute(
+                "SELECT profile FROM tasks WHERE cycle = ? AND "
+                "(state = 'pending' OR (state = 'leased' AND lease_until < ?)) "
+                "ORDER BY position",
+                (cycle, now)
+            )
+            # аккаунты, которых нет в файлах этого хоста, пропускаем, их возьмут другие хосты
+            row = next((row for row in cursor if profile_numbers is None or row[0] in profile_numbers), None)
+            cursor.close()
+            if row:
+                connection.execute(
+                    "UPDATE tasks SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1 "
+                    "WHERE cycle = ? AND profile = ?",
+                    (self.owner, now + self.lease_time, cycle, row[0])
+                )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return row[0] if row else None
+
+    def heartbeat(self, cycle: int, profile_numbers: list[str]) -> None:
+        if not profile_numbers:
+            return
+        self._connection().executemany(
+            "UPDATE tasks SET lease_until = ? WHERE cycle = ? AND profile = ? AND owner = ? AND state = 'leased'",
+            [(time.time() + self.lease_time, cycle, str(profile), self.owner) for profile in profile_numbers]
+        )
+
+    def release(self, cycle: int, profile_number: str) -> None:
+        self._connection().execute(
+            "UPDATE tasks SET state = 'pending', owner = NULL, lease_until = NULL "
+            "WHERE cycle = ? AND profile = ? AND owner = ? AND state = 'leased'",
+            (cycle, str(profile_number), self.owner)
+        )
+
+    def complete(self, cycle: int, profile_number: str) -> bool:
+        cursor = self._connection().execute(
+            "UPDATE tasks SET state = 'done', lease_until = NULL "
+            "WHERE cycle = ? AND profile = ? AND owner = ? AND state = 'leased'",
+            (cycle, str(profile_number), self.owner)
+        )
+        return cursor.rowcount == 1
+
+    def remaining(self, cycle: int, profile_numbers: Optional[Collection[str]] = None) -> int:
+        if profile_numbers is None:
+            row = self._connection().execute(
+                "SELECT COUNT(*) FROM tasks WHERE cycle = ? AND state != 'done'", (cycle,)
+            ).fetchone()
+            return row[0]
+        rows = self._connection().execute(
+            "SELECT profile FROM tasks WHERE cycle = ? AND state != 'done'", (cycle,)
+        )
+        return sum(profile in profile_numbers for profile, in rows)
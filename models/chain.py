@@ -8,7 +8,9 @@ class Chain:
     Класс для хранения информации о сети. Информацию о сети можно искать тут https://chainid.network/chains.json
 
     - name - название сети, в формате snake_case, при инициализации в класс Chains должно совпадать с именем переменной
-    - param rpc: адрес провайдера в формате https://1rpc.io/ethereum, можно взять на https://chainlist.org/
+    - param rpc: адрес провайдера в формате https://1rpc.io/ethereum или список адресов, можно взять на https://chainlist.org/
+      Если указан список, Onchain выбирает самый быстрый исправный rpc и переключается при ошибках, см. core/rpc_pool.py.
+      В self.rpc всегда первый адрес (он же добавляется в метамаск), все адреса в self.rpcs
     - chain_id: id сети, например 1 для Ethereum, можно искать тут https://chainid.network/chains.json, либо https://api.debank.com/chain/list
     - native_token: тикер нативного токена сети, по умолчанию 'ETH'
     - is_eip1559: если сеть поддерживает EIP-1559, то True, иначе False, можно взять тут https://api.debank.com/chain/list
@@ -21,7 +23,7 @@ class Chain:
     def __init__(
             self,
             name: str,
-            rpc: str,
+            rpc: str | list[str],
             *,
             chain_id: int,
             metamask_name: Optional[str] = None,
@@ -32,7 +34,8 @@ class Chain:
             multiplier: float = 1.0,
     ):
         self.name = name
-        self.rpc = rpc
+        self.rpcs = [rpc] if isinstance(rpc, str) else list(rpc)
+        self.rpc = self.rpcs[0]
         self.chain_id = chain_id
         self.metamask_name = metamask_name if metamask_name else name
         self.native_token = native_token
@@ -27,6 +27,9 @@ class ContractRaw:
     chain - сеть, на которой находится контракт
     """
 
+    # разобранные abi по имени файла, общие для всех объектов, файл читается один раз за процесс
+    _abi_cache: dict[str, list[dict]] = {}
+
     def __init__(self, address: str | ChecksumAddress, abi_name: str, chain: Chain):
         self.address = to_checksum(address)
         self.abi_name = abi_name
@@ -48,13 +51,16 @@ class ContractRaw:
     @property
     def abi(self) -> list[dict]:
         """
-        Ленивый геттер abi контракта, загружает его из файла при первом обращении.
+        Ленивый геттер abi контракта, загружает его из файла при первом обращении к abi с таким именем в процессе.
         :return: abi контракта
         """
         if not self._abi:
-            path = os.path.join(config.PATH_ABI, f'{self.abi_name}.json')
-            with open(path) as file:
-                self._abi = json.load(file)
+            abi = self._abi_cache.get(self.abi_name)
+            if abi is None:
+                path = os.path.join(config.PATH_ABI, f'{self.abi_name}.json')
+                with open(path) as file:
+                    abi = self._abi_cache[self.abi_name] = json.load(file)
+            self._abi = abi
         return self._abi
 
 
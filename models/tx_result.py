@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from models.amount import Amount
+
+
+class TxResult:
+    """
+    Модель для хранения результата транзакции после включения в блок.
+
+    Атрибуты:
+
+    - tx_hash - хэш транзакции
+    - chain - название сети
+    - status - True успешна, False отменена (revert), None результат не получен (истекло время ожидания)
+    - block_number - номер блока
+    - gas_used - израсходованный газ
+    - effective_gas_price - фактическая цена газа в wei
+    - fee - фактическая комиссия в нативном токене, для L2 с учетом комиссии L1
+    - error - текст ошибки, если результат не получен
+    """
+
+    def __init__(
+            self,
+            tx_hash: str,
+            chain: str,
+            status: Optional[bool] = None,
+            block_number: Optional[int] = None,
+            gas_used: int = 0,
+            effective_gas_price: int = 0,
+            l1_fee: int = 0,
+            error: Optional[str] = None
+    ) -> None:
+        self.tx_hash = tx_hash
+        self.chain = chain
+        self.status = status
+        self.block_number = block_number
+        self.gas_used = gas_used
+        self.effective_gas_price = effective_gas_price
+        self.fee = Amount(gas_used * effective_gas_price + l1_fee, wei=True)
+        self.error = error
+
+    @classmethod
+    def from_receipt(cls, receipt: dict, chain: str) -> TxResult:
+        """
+        Создает результат из квитанции транзакции, сырой JSON-RPC (hex строки) или отформатированной web3.
+        :param receipt: квитанция транзакции
+        :param chain: название сети
+        :return: объект TxResult
+        """
+
+        def to_int(value) -> int:
+            if value is None:
+                return 0
+            return int(value, 16) if isinstance(value, str) else int(value)
+
+        tx_hash = receipt['transactionHash']
+        if not isinstance(tx_hash, str):
+            tx_hash = tx_hash.to_0x_hex()
+        return cls(
+            tx_hash=tx_hash,
+            chain=chain,
+            status=to_int(receipt.get('status')) == 1,
+            block_number=to_int(receipt.get('blockNumber')),
+            gas_used=to_int(receipt.get('gasUsed')),
+            effective_gas_price=to_int(receipt.get('effectiveGasPrice')),
+            l1_fee=to_int(receipt.get('l1Fee')),
+        )
+
+    def __str__(self) -> str:
+        if self.status is None:
+            return f'{self.tx_hash} ({self.chain}): нет результата, {self.error}'
+        status = 'успешна' if self.status else 'отменена'
+        return f'{self.tx_hash} ({self.chain}): {status}, блок {self.block_number}, газ {self.gas_used}, комиссия {self.fee}'
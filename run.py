@@ -1,4 +1,6 @@
 import datetime
+import os
+import socket
 from csv import excel
 import random
 
@@ -9,10 +11,19 @@ from loguru import logger
 
 from config import config, Chains, Tokens
 from core.bot import Bot
+from core.browser import Ads
 from core.onchain import Onchain
 from core.excel import Excel
+from core.fee_oracle import fee_oracle
+from core.journal import CycleJournal
+from core.planner import make_plan
+from core.runner import run_cycle, run_from_queue
+from core.scheduler import EligibilityScheduler
+from core.watchdog import watchdog
+from core.work_queue import SqliteWorkQueue
 from models.account import Account
 from utils.logging import init_logger, send_telegram_message
+from utils.metrics import metrics
 from utils.utils import random_sleep, get_accounts, generate_password, get_price_token, shuffle_account, \
     get_multiplayer
 
@@ -21,6 +32,8 @@ def main():
     """ Основная функция """
     # Инициализация консоли и логгера
     init_logger()
+    # выгрузка метрик в файл или по http, если включена в конфиге
+    metrics.start()
     # Получаем список аккаунтов из файлов
     accounts = get_accounts()
 
@@ -30,22 +43,85 @@ def main():
     if not any([config.binance_api_key, config.binance_secret_key]):
         logger.warning("Не указаны ключи для работы с Binance, не будут работать методы Binance")
 
+    # теневой прогон: план вызовов без транзакций, выводов и браузера
+    if config.is_plan:
+        accounts_for_work = schedule_and_filter(accounts)
+        shuffle_account(accounts_for_work)
+        make_plan(accounts_for_work, activity)
+        return
+
+    # запуск аккаунтов по мере наступления их времени, вместо циклов
+    if config.is_schedule and config.is_heap_schedule:
+        EligibilityScheduler(get_next_run_times).run(accounts, worker)
+        return
+
+    # работа из общей очереди аккаунтов вместе с другими хостами
+    if config.work_queue_path:
+        run_queue(accounts)
+        return
+
+    # журнал цикла, если скрипт упал, продолжаем незавершенный цикл с того же места
+    journal = CycleJournal()
+    resumed = journal.resume(accounts) if config.is_resume else None
+    start_cycle = resumed[0] if resumed else 0
+
     # перебираем профили в цикле
-    for i in range(config.cycle):
+    for i in range(start_cycle, config.cycle):
+
+        if resumed and i == start_cycle:
+            # продолжаем цикл из журнала в сохраненном порядке, без обработанных аккаунтов
+            accounts_for_work = resumed[1]
+            journal.continue_cycle()
+        else:
+            # получаем список аккаунтов для работы
+            accounts_for_work = schedule_and_filter(accounts)
+            # перемешиваем аккаунты если включен режим случайного выбора
+            shuffle_account(accounts_for_work)
+            journal.begin_cycle(i, accounts_for_work)
+
+        # Перебираем аккаунты, передаем каждый в функцию worker в config.max_workers потоков
+        # или в config.shards процессов
+        stats = run_cycle(accounts_for_work, worker, on_done=journal.mark_done)
+        journal.end_cycle()
+
+        logger.success(f'Цикл {i + 1} завершен, обработано {stats.processed} аккаунтов '
+                       f'за {stats.elapsed / 60:.1f} мин, {stats.per_minute:.1f} аккаунтов/мин')
+        if watchdog.hits:
+            logger.warning(f'Прервано по таймауту с начала работы: {dict(watchdog.hits)}')
+        if fee_oracle.hits + fee_oracle.misses:
+            logger.info(f'Кеш комиссий: {fee_oracle.hit_ratio:.0%} запросов из кеша, {fee_oracle.stats()}')
+        metrics.flush()
+        logger.info(f'Ожидание перед следующим циклом ~{config.pause_between_cycle[1]} секунд')
+
+        # Пауза между циклами
+        random_sleep(*config.pause_between_cycle)
 
+
+def run_queue(accounts: list[Account]) -> None:
+    """
+    Циклы по аккаунтам из общей очереди config.work_queue_path. Каждый аккаунт обрабатывается
+    одним хостом за цикл, аккаунты упавших хостов забирают другие хосты после истечения аренды.
+    Выполненные аккаунты хранятся в очереди, поэтому после перезапуска хост продолжает цикл.
+    :param accounts: список аккаунтов
+    :return: None
+    """
+    owner = f'{socket.gethostname()}:{os.getpid()}'
+    work_queue = SqliteWorkQueue(config.work_queue_path, owner, config.work_queue_lease)
+    logger.info(f'Работаем из очереди {config.work_queue_path} как {owner}')
+
+    for _ in range(config.cycle):
+        # номер цикла общий для всех хостов, присоединяемся к незавершенному или начинаем следующий
+        cycle = work_queue.open_cycle()
         # получаем список аккаунтов для работы
         accounts_for_work = schedule_and_filter(accounts)
         # перемешиваем аккаунты если включен режим случайного выбора
         shuffle_account(accounts_for_work)
 
-        # Перебираем аккаунты
-        for account in accounts_for_work:
-            # передаем аккаунт в функцию worker
-            worker(account)
-            # Пауза между профилями
-            random_sleep(*config.pause_between_profile)
+        stats = run_from_queue(work_queue, cycle, accounts_for_work, worker, accounts)
 
-        logger.success(f'Цикл {i + 1} завершен, обработано {len(accounts_for_work)} аккаунтов')
+        logger.success(f'Цикл {cycle + 1} завершен, этим хостом обработано {stats.processed} аккаунтов '
+                       f'за {stats.elapsed / 60:.1f} мин, {stats.per_minute:.1f} аккаунтов/мин')
+        metrics.flush()
         logger.info(f'Ожидание перед следующим циклом ~{config.pause_between_cycle[1]} секунд')
 
         # Пауза между циклами
@@ -61,8 +137,10 @@ def worker(account: Account) -> None:
     # Создаем бота, если в конфиге включен is_browser_run, то будет запущен браузер
     try:
         with Bot(account) as bot:
-            # Вызываем функцию activity и передаем в нее бота
-            activity(bot)
+            # Вызываем функцию activity и передаем в нее бота, время работы ограничено config.timeouts['activity']
+            with watchdog.deadline('activity', account=account,
+                                   teardown=lambda: Ads.stop_profile(account.profile_number)):
+                activity(bot)
             # сюда по необходимости добавляем другие функции с активностями
     except Exception as e:
         logger.critical(f"{account.profile_number} Ошибка при инициализации Bot: {e}")
@@ -72,65 +150,76 @@ def schedule_and_filter(accounts: list[Account]) -> list[Account]:
     """
     Функция для фильтрации аккаунтов по времени и дополнительной логике,
     чтобы пропускать те аккаунты, которые не нужно запускать.
-    Перебирает аккаунты через фильтры и возвращает новый список аккаунтов для работы.
+    Возвращает аккаунты, время запуска которых из get_next_run_times уже наступило.
     :param accounts: список аккаунтов
     :return: список аккаунтов для работы
     """
 
-
     # если фильтрация аккаунтов не включена, возвращаем все аккаунты
     if not config.is_schedule:
         return accounts
 
-    # список аккаунтов для работы
-    accounts_for_work = []
+    now = datetime.datetime.now()
+    accounts_for_work = [
+        account for account, run_time in get_next_run_times(accounts)
+        if run_time is not None and run_time <= now
+    ]
 
+    logger.info(f"Выбрано {len(accounts_for_work)} аккаунтов для работы")
+
+    # возвращаем список аккаунтов для работы
+    return accounts_for_work
+
+
+def get_next_run_times(accounts: list[Account]) -> list[tuple[Account, datetime.datetime | None]]:
+    """
+    Функция расписания и фильтров: для каждого аккаунта определяет время, когда его можно запускать.
+    Если аккаунт не проходит фильтры, время будет None.
+    Используется в schedule_and_filter и в планировщике (config.is_heap_schedule).
+    :param accounts: список аккаунтов
+    :return: список пар (аккаунт, время запуска или None)
+    """
+    # список аккаунтов с временем запуска
+    run_times = []
 
     # подключение к таблице со статистикой, без аккаунта
     excel = Excel(file='report.xlsx')
+    # загружаем нужные столбцы за один проход по таблице
+    columns = excel.get_columns(['Profile Number', 'Status', 'Swap', 'Tx Date'])
+    statuses = columns['Status']
+    swap_counters = [Excel.to_number(value) for value in columns['Swap']]
+    tx_dates = Excel.parse_dates(columns['Tx Date'])
+    # номер профиля -> индекс строки в столбцах
+    rows = {str(profile_number): index for index, profile_number in enumerate(columns['Profile Number'])}
+
     # получаем общую статистику
-    swap_counters = excel.get_counters('Swap')
-    average_counter = sum(swap_counters) / len(swap_counters)
+    average_counter = sum(swap_counters) / len(swap_counters) if swap_counters else 0
 
-    # определяем крайнюю дату для последней транзакции
-    limit_date = datetime.datetime.now() - datetime.timedelta(days=5)
+    # пауза после последней транзакции
+    pause_after_tx = datetime.timedelta(days=5)
     limit_swap_counter = 10
 
     # перебираем аккаунты
     for account in accounts:
-        # подключаем аккаунт к таблице
-        excel.connect_account(account)
+        index = rows.get(str(account.profile_number))
 
-        # проверяем статус профиля в таблице
-        status = excel.get_counter('Status')
-        if status != 'Work':
+        # если аккаунта нет в таблице или статус не Work, пропускаем
+        if index is None or statuses[index] != 'Work':
+            run_times.append((account, None))
             continue
 
         # получаем статистику по аккаунту
-        swap_counter = excel.get_counter('Swap')
-
-        # если количество транзакций больше лимита, пропускаем.
-        if swap_counter >= limit_swap_counter:
-            continue
-
-        # если количество транзакций больше среднего, пропускаем.
-        if swap_counter > average_counter:
-            continue
+        swap_counter = swap_counters[index]
 
-        # если последняя транзакция была недавно, пропускаем.
-        last_trans = excel.get_date('Tx Date')
-        if last_trans > limit_date:
+        # если количество транзакций больше лимита или больше среднего, пропускаем.
+        if swap_counter >= limit_swap_counter or swap_counter > average_counter:
+            run_times.append((account, None))
             continue
 
-        # если аккаунт прошел все фильтры, добавляем его в список для работы
-        accounts_for_work.append(account)
-
-    logger.info(f"Выбрано {len(accounts_for_work)} аккаунтов для работы")
-
-
-    # возвращаем список аккаунтов для работы
-    return accounts_for_work
+        # аккаунт можно запускать через pause_after_tx после последней транзакции
+        run_times.append((account, tx_dates[index] + pause_after_tx))
 
+    return run_times
 
 
 def activity(bot: Bot):
@@ -6,12 +6,13 @@ from config import Chains, Tokens
 from core.bot import Bot
 from core.excel import Excel
 from core.onchain import Onchain
-from utils.utils import get_price_token
+from utils.utils import get_price_token, to_checksum
 
 
 def activity(bot: Bot):
     """
     Функция для работы с ботом, описываем логику активности бота.
+    Балансы всех токенов сети запрашиваются одним вызовом Multicall3 через get_balances.
     :param bot: инициализированный бот
     """
     prices = {}
@@ -23,18 +24,23 @@ def activity(bot: Bot):
     for chain in chains:
         chain_instance = Onchain(bot.account, chain)
         tokens = Tokens.get_tokens_by_chain(chain)
-        balance = chain_instance.get_balance()
-        logger.info(f'Баланс {chain.native_token} на сети {chain.name}: {balance}')
-        excel.set_cell(f'{chain.name} {chain.native_token}', balance.ether)
-        if not prices.get(chain.native_token, 0):
-            price = get_price_token(chain.native_token)
-            prices[chain.native_token] = price
-        usd_balance = balance.ether * prices[chain.native_token]
-        excel.set_cell(f'$ {chain.name} {chain.native_token}', usd_balance)
-
+        balances = chain_instance.get_balances([None] + tokens)
+        address = to_checksum(bot.account.address)
+
+        balance = balances.get((address, Tokens.NATIVE_TOKEN.address))
+        if balance is not None:
+            logger.info(f'Баланс {chain.native_token} на сети {chain.name}: {balance}')
+            excel.set_cell(f'{chain.name} {chain.native_token}', balance.ether)
+            if not prices.get(chain.native_token, 0):
+                price = get_price_token(chain.native_token)
+                prices[chain.native_token] = price
+            usd_balance = balance.ether * prices[chain.native_token]
+            excel.set_cell(f'$ {chain.name} {chain.native_token}', usd_balance)
 
         for token in tokens:
-            balance = chain_instance.get_balance(token=token)
+            balance = balances.get((address, token.address))
+            if balance is None:
+                continue
 
             logger.info(f'Баланс {token.symbol} на сети {chain.name}: {balance}')
             excel.set_cell(f'{chain.name} {token.symbol}', balance.ether)
@@ -44,4 +50,3 @@ def activity(bot: Bot):
                     prices[token.symbol] = price
                 usd_balance = balance.ether * prices[token.symbol]
                 excel.set_cell(f'$ {chain.name} {token.symbol}', usd_balance)
-
@@ -0,0 +1,142 @@
+"""
+Снимок балансов всех аккаунтов во всех сетях из config/chains.py и всех токенов из config/tokens.py.
+
+В отличие от balance_checker.py работает без Bot и браузера: адреса берутся из файлов аккаунтов, сети опрашиваются
+параллельно, балансы читаются через Multicall3 (сотни балансов одним eth_call), цены запрашиваются один раз
+на тикер, а отчет config/data/<file> записывается один раз в конце.
+
+Запуск из корня проекта: python -m snippets.balance.portfolio_snapshot --file portfolio.xlsx
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from eth_typing import ChecksumAddress
+from loguru import logger
+
+from config import Chains, Tokens
+from core.excel import Excel
+from core.onchain import Onchain
+from models.account import Account
+from models.amount import Amount
+from models.chain import Chain
+from models.token import Token, TokenTypes
+from utils.utils import get_accounts, get_price_token, to_checksum
+
+
+def scan_chain(
+        chain: Chain,
+        addresses: list[ChecksumAddress],
+        workers: int,
+        group_size: int
+) -> dict[tuple[ChecksumAddress, ChecksumAddress], Amount]:
+    """
+    Балансы нативного токена и всех токенов сети для всех адресов. Адреса делятся на группы,
+    группы читаются параллельно, каждая группа - несколько вызовов Multicall3 через Onchain.get_balances.
+    :param chain: сеть
+    :param addresses: адреса кошельков
+    :param workers: сколько групп читать параллельно
+    :param group_size: адресов в группе
+    :return: словарь {(адрес кошелька, адрес токена): Amount}
+    """
+    onchain = Onchain(Account(0, address=addresses[0]), chain)
+    tokens = [None] + Tokens.get_tokens_by_chain(chain)
+    groups = [addresses[i:i + group_size] for i in range(0, len(addresses), group_size)]
+
+    balances = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(lambda group: onchain.get_balances(tokens, group), groups):
+            balances.update(result)
+    return balances
+
+
+def get_prices(symbols: set[str]) -> dict[str, float]:
+    """
+    Цены токенов в USDT, каждая запрашивается один раз. Если цену получить не удалось, она считается 0.
+    :param symbols: тикеры токенов
+    :return: словарь {тикер: цена}
+    """
+
+    def get_price(symbol: str) -> float:
+        try:
+            return get_price_token(symbol)
+        except Exception as e:
+            logger.warning(f'Не удалось получить цену {symbol}: {e}')
+            return 0.0
+
+    symbols = sorted(symbols)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return dict(zip(symbols, executor.map(get_price, symbols)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Снимок балансов всех аккаунтов во всех сетях')
+    parser.add_argument('--file', default='portfolio.xlsx', help='файл отчета в config/data')
+    parser.add_argument('--chains', nargs='*', default=None, help='названия сетей, по умолчанию все')
+    parser.add_argument('--workers', type=int, default=4, help='параллельных запросов в одной сети')
+    parser.add_argument('--group', type=int, default=500, help='адресов в одной группе запросов')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    accounts = [account for account in get_accounts() if account.address]
+    addresses = list(dict.fromkeys(to_checksum(account.address) for account in accounts))
+    if not addresses:
+        logger.error('Нет адресов аккаунтов для проверки')
+        return
+    chains = [Chains.get_chain(name) for name in args.chains] if args.chains else Chains.get_chains_list()
+
+    def scan(chain: Chain) -> dict:
+        chain_started = time.perf_counter()
+        try:
+            balances = scan_chain(chain, addresses, args.workers, args.group)
+        except Exception as e:
+            logger.error(f'Не удалось получить балансы в сети {chain.name}: {e}')
+            return {}
+        logger.info(f'{chain.name}: {len(balances)} балансов за {time.perf_counter() - chain_started:.1f} с')
+        return balances
+
+    with ThreadPoolExecutor(max_workers=len(chains)) as executor:
+        by_chain = dict(zip([chain.name for chain in chains], executor.map(scan, chains)))
+
+    # столбцы отчета: (сеть, символ, адрес токена, токен или None для нативного)
+    columns: list[tuple[Chain, str, ChecksumAddress, Token | None]] = []
+    for chain in chains:
+        columns.append((chain, chain.native_token, Tokens.NATIVE_TOKEN.address, None))
+        columns += [(chain, token.symbol, token.address, token) for token in Tokens.get_tokens_by_chain(chain)]
+
+    prices = get_prices({symbol for _, symbol, _, token in columns
+                         if token is None or token.type_token != TokenTypes.STABLE})
+
+    header = ['Profile Number', 'Address']
+    for chain, symbol, _, _ in columns:
+        header += [f'{chain.name} {symbol}', f'$ {chain.name} {symbol}']
+    header.append('$ Total')
+
+    rows = []
+    total = 0.0
+    for account in accounts:
+        address = to_checksum(account.address)
+        row = [account.profile_number, address]
+        account_total = 0.0
+        for chain, symbol, token_address, token in columns:
+            balance = by_chain[chain.name].get((address, token_address))
+            if balance is None:
+                row += [None, None]
+                continue
+            price = 1.0 if token is not None and token.type_token == TokenTypes.STABLE else prices.get(symbol, 0.0)
+            usd = balance.ether * price
+            account_total += usd
+            row += [balance.ether, round(usd, 2)]
+        row.append(round(account_total, 2))
+        total += account_total
+        rows.append(row)
+
+    Excel(file=args.file).write_table(header, rows)
+    logger.success(f'Снимок {len(accounts)} аккаунтов в {len(chains)} сетях за {time.perf_counter() - started:.1f} с, '
+                   f'всего ${total:,.2f}, отчет config/data/{args.file}')
+
+
+if __name__ == '__main__':
+    main()
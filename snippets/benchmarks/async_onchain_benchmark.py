@@ -0,0 +1,65 @@
+"""
+Сравнение Onchain и AsyncOnchain на локальной заглушке RPC: проверка нативного и erc20 баланса для N аккаунтов.
+
+Запуск из корня проекта: python -m snippets.benchmarks.async_onchain_benchmark --accounts 200 --latency 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from eth_account import Account as EthAccount
+
+from core.async_onchain import AsyncOnchain
+from core.onchain import Onchain
+from models.account import Account
+from models.chain import Chain
+from models.token import Token
+from snippets.benchmarks.rpc_stub import RpcStub, CHAIN_ID
+
+
+def make_accounts(number: int) -> list[Account]:
+    return [Account(i, address=EthAccount.create().address) for i in range(number)]
+
+
+def bench_sync(accounts: list[Account], chain: Chain, token: Token) -> float:
+    start = time.perf_counter()
+    for account in accounts:
+        onchain = Onchain(account, chain)
+        onchain.get_balance()
+        onchain.get_balance(token=token)
+    return time.perf_counter() - start
+
+
+async def bench_async(accounts: list[Account], chain: Chain, token: Token) -> float:
+    start = time.perf_counter()
+    onchains = [AsyncOnchain(account, chain) for account in accounts]
+    await asyncio.gather(*(onchain.get_balance() for onchain in onchains))
+    await asyncio.gather(*(onchain.get_balance(token=token) for onchain in onchains))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк Onchain против AsyncOnchain')
+    parser.add_argument('--accounts', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    accounts = make_accounts(args.accounts)
+    with RpcStub(latency=args.latency) as stub:
+        chain = Chain('stub', stub.url, chain_id=CHAIN_ID, is_eip1559=True)
+        token = Token('STUB', '0x' + '11' * 20, chain, decimals=18)
+
+        sync_time = bench_sync(accounts, chain, token)
+        async_time = asyncio.run(bench_async(accounts, chain, token))
+
+    checks = args.accounts * 2
+    print(f'RTT заглушки: {args.latency * 1000:.0f} мс, проверок баланса: {checks}')
+    print(f'Onchain:      {sync_time:8.2f} с, {checks / sync_time:8.1f} проверок/с')
+    print(f'AsyncOnchain: {async_time:8.2f} с, {checks / async_time:8.1f} проверок/с')
+    print(f'Ускорение:    {sync_time / async_time:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Накладные расходы на получение объекта контракта и кодирование вызова balanceOf без сетевых запросов:
+w3.eth.contract(address, abi=...) на каждый вызов, как было в Onchain._get_contract, против contract_cache.
+
+Запуск из корня проекта: python -m snippets.benchmarks.contract_cache_benchmark --calls 20000 --tokens 50
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from eth_account import Account as EthAccount
+from web3 import Web3, HTTPProvider
+
+from core.contract_cache import ContractCache
+from models.chain import Chain
+from models.contract_raw import ContractRaw
+from models.token import Token
+
+
+def bench(name: str, calls: int, get_contract, tokens: list[Token], address: str) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        contract = get_contract(tokens[i % len(tokens)])
+        contract.functions.balanceOf(address)._encode_transaction_data()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<40} {elapsed / calls * 1e6:8.1f} мкс/вызов')
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк кеша контрактов')
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--tokens', type=int, default=50, help='разных адресов токенов')
+    args = parser.parse_args()
+
+    # запросы к rpc не делаются, адрес провайдера не важен
+    w3 = Web3(HTTPProvider('http://127.0.0.1:1'))
+    chain = Chain('bench', 'http://127.0.0.1:1', chain_id=1)
+    tokens = [Token(f'T{i}', '0x' + f'{i + 1:040x}', chain) for i in range(args.tokens)]
+    address = EthAccount.create().address
+
+    def uncached(token: Token):
+        # новый ContractRaw на каждый вызов, abi читается из файла, если его нет в кеше ContractRaw
+        ContractRaw._abi_cache.clear()
+        raw = ContractRaw(token.address, token.abi_name, chain)
+        return w3.eth.contract(raw.address, abi=raw.abi)
+
+    def abi_cached(token: Token):
+        return w3.eth.contract(token.address, abi=token.abi)
+
+    cache = ContractCache()
+
+    def contract_cached(token: Token):
+        return cache.get(w3, token)
+
+    print(f'вызовов: {args.calls}, токенов: {args.tokens}')
+    before = bench('abi из файла + w3.eth.contract', args.calls, uncached, tokens, address)
+    bench('abi из памяти + w3.eth.contract', args.calls, abi_cached, tokens, address)
+    after = bench('contract_cache', args.calls, contract_cached, tokens, address)
+    print(f'ускорение: {before / after:.1f}x, попаданий в кеш: {cache.hits}, промахов: {cache.misses}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Проверка Onchain.batch_transfer на локальной копии сети: anvil (foundry) запускается с форком сети, в которой
+развернут Disperse, рассылка идет с тестового аккаунта anvil, после чего балансы получателей проверяются
+через Multicall3 и сравнивается газ с переводами по одному.
+
+Нужен установленный anvil: https://book.getfoundry.sh/getting-started/installation
+Запуск из корня проекта: python -m snippets.benchmarks.disperse_devchain --recipients 300 --fork ethereum
+"""
+from __future__ import annotations
+
+import argparse
+import shutil
+import socket
+import subprocess
+import time
+
+import requests
+from eth_account import Account as EthAccount
+
+from config import Chains, Tokens
+from core.onchain import Onchain
+from models.account import Account
+from models.amount import Amount
+from models.chain import Chain
+
+# первый тестовый аккаунт anvil, баланс 10000 ETH в локальной сети
+ANVIL_PRIVATE_KEY = '0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcb6aae784d7bf4f2ff80'
+ANVIL_ADDRESS = '0xf39Fd6e51aad88F6F4ce6aB8827279cffFb92266'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_rpc(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.post(url, json={'jsonrpc': '2.0', 'id': 1, 'method': 'eth_chainId', 'params': []}, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise TimeoutError(f'anvil не запустился на {url}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Проверка batch_transfer на форке сети в anvil')
+    parser.add_argument('--recipients', type=int, default=300)
+    parser.add_argument('--amount', type=float, default=0.001, help='сумма каждому получателю')
+    parser.add_argument('--fork', default='ethereum', help='сеть из config/chains.py для форка')
+    args = parser.parse_args()
+
+    if not shutil.which('anvil'):
+        print('anvil не найден, установите foundry')
+        return
+
+    fork_chain = Chains.get_chain(args.fork)
+    port = free_port()
+    process = subprocess.Popen(
+        ['anvil', '--fork-url', fork_chain.rpc, '--port', str(port), '--silent'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        url = f'http://127.0.0.1:{port}'
+        wait_rpc(url)
+        # у форка тот же chain_id, что у исходной сети
+        chain = Chain('anvil', url, chain_id=fork_chain.chain_id, native_token=fork_chain.native_token)
+        onchain = Onchain(Account(0, address=ANVIL_ADDRESS, private_key=ANVIL_PRIVATE_KEY), chain)
+
+        recipients = [(EthAccount.create().address, args.amount) for _ in range(args.recipients)]
+        started = time.perf_counter()
+        hashes = onchain.batch_transfer(recipients)
+        elapsed = time.perf_counter() - started
+
+        gas_used = sum(onchain.w3.eth.get_transaction_receipt(tx_hash)['gasUsed'] for tx_hash in hashes)
+        balances = onchain.get_balances([None], [address for address, _ in recipients])
+        expected = Amount(args.amount).wei
+        received = sum(balances.get((address, Tokens.NATIVE_TOKEN.address), Amount(0)).wei == expected
+                       for address, _ in recipients)
+
+        print(f'получателей: {args.recipients}, транзакций: {len(hashes)}, время: {elapsed:.1f} с')
+        # для нативного токена новым адресам внутренний перевод контракта дороже обычного (создание аккаунта),
+        # выигрыш в количестве транзакций и запросов, для erc20 - и в газе за счет одной базовой стоимости транзакции
+        print(f'газ: {gas_used}, {gas_used / args.recipients:.0f} на получателя, '
+              f'переводы по одному: {21000 * args.recipients} в {args.recipients} транзакциях')
+        print(f'получили верную сумму: {received}/{args.recipients}')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
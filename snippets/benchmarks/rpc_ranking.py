@@ -0,0 +1,83 @@
+"""
+Сравнение всех rpc из config/chains.py: задержка eth_blockNumber, доля ошибок и проверка chain_id.
+Для каждой сети выводит rpc от лучшего к худшему, первым в списке rpc сети стоит ставить лучший.
+
+Запуск из корня проекта: python -m snippets.benchmarks.rpc_ranking --requests 10
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from config import Chains
+from models.chain import Chain
+
+
+def bench_rpc(chain: Chain, url: str, number: int, timeout: float) -> dict:
+    """
+    Делает number запросов eth_blockNumber через одну keep-alive сессию.
+    :return: словарь со статистикой rpc
+    """
+    session = requests.Session()
+    latencies = []
+    errors = 0
+    chain_id_ok = None
+    for i in range(number):
+        payload = {'jsonrpc': '2.0', 'id': i, 'method': 'eth_chainId' if i == 0 else 'eth_blockNumber', 'params': []}
+        started = time.perf_counter()
+        try:
+            response = session.post(url, json=payload, timeout=timeout)
+            response.raise_for_status()
+            result = response.json()['result']
+        except Exception:
+            errors += 1
+            continue
+        # первый запрос - установка соединения и TLS, в задержку не считаем
+        if i == 0:
+            chain_id_ok = int(result, 16) == chain.chain_id
+        else:
+            latencies.append(time.perf_counter() - started)
+    session.close()
+    return {
+        'url': url,
+        'median': statistics.median(latencies) if latencies else None,
+        'p90': statistics.quantiles(latencies, n=10)[-1] if len(latencies) >= 2 else None,
+        'errors': errors,
+        'chain_id_ok': chain_id_ok,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Рейтинг rpc из config/chains.py')
+    parser.add_argument('--requests', type=int, default=10, help='запросов на каждый rpc')
+    parser.add_argument('--timeout', type=float, default=10, help='таймаут запроса в секундах')
+    parser.add_argument('--chain', default=None, help='проверить только эту сеть')
+    args = parser.parse_args()
+
+    chains = [Chains.get_chain(args.chain)] if args.chain else Chains.get_chains_list()
+    jobs = [(chain, url) for chain in chains for url in chain.rpcs]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda job: bench_rpc(*job, args.requests, args.timeout), jobs))
+
+    by_chain: dict[str, list[dict]] = {}
+    for (chain, _), result in zip(jobs, results):
+        by_chain.setdefault(chain.name, []).append(result)
+
+    for chain_name, chain_results in by_chain.items():
+        # сначала без ошибок и с верным chain_id, затем по медиане
+        chain_results.sort(key=lambda r: (r['chain_id_ok'] is not True, r['errors'], r['median'] or float('inf')))
+        print(f'\n{chain_name}')
+        for place, r in enumerate(chain_results, 1):
+            median = f"{r['median'] * 1000:7.0f} мс" if r['median'] is not None else '      - мс'
+            p90 = f"{r['p90'] * 1000:7.0f} мс" if r['p90'] is not None else '      - мс'
+            chain_id = {True: 'ok', False: 'ДРУГАЯ СЕТЬ', None: '-'}[r['chain_id_ok']]
+            print(f"  {place}. {r['url']:<55} медиана {median}  p90 {p90}  "
+                  f"ошибок {r['errors']}/{args.requests}  chain_id {chain_id}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Локальная заглушка JSON-RPC ноды для бенчмарков. Отвечает фиксированными значениями на основные методы eth_*,
+поддерживает batch запросы и добавляет искусственную задержку, чтобы имитировать сетевой RTT до публичной RPC.
+
+Запуск отдельно: python -m snippets.benchmarks.rpc_stub --port 8546 --latency 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eth_utils import keccak
+
+CHAIN_ID = 1337
+BALANCE = 10 ** 18
+BLOCK_NUMBER = 1_000_000
+BASE_FEE = 10 ** 8
+PRIORITY_FEE = 10 ** 7
+
+
+def _word(value: int) -> str:
+    return hex(value)[2:].rjust(64, '0')
+
+
+def _encode_string(text: str) -> str:
+    data = text.encode().hex()
+    length = len(text.encode())
+    return '0x' + _word(32) + _word(length) + data.ljust(((len(data) + 63) // 64) * 64, '0')
+
+
+# ответы на eth_call по селектору функции
+CALL_RESULTS = {
+    '0x70a08231': '0x' + _word(BALANCE),  # balanceOf(address)
+    '0x313ce567': '0x' + _word(18),  # decimals()
+    '0x95d89b41': _encode_string('STUB'),  # symbol()
+    '0xdd62ed3e': '0x' + _word(0),  # allowance(address,address)
+    '0x4d2301cc': '0x' + _word(BALANCE),  # getEthBalance(address)
+}
+
+
+class RpcStub:
+    """
+    Заглушка RPC ноды в отдельном потоке.
+
+    with RpcStub(latency=0.05) as stub:
+        chain = Chain('stub', stub.url, chain_id=CHAIN_ID)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.05) -> None:
+        self.latency = latency
+        self.requests = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self) -> RpcStub:
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length))
+                time.sleep(stub.latency)
+                if isinstance(payload, list):
+                    result = [stub.handle(item) for item in payload]
+                else:
+                    result = stub.handle(payload)
+                with stub._lock:
+                    stub.requests += 1
+                body = json.dumps(result).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
+    def handle(self, request: dict) -> dict:
+        """
+        Обрабатывает один JSON-RPC запрос
+        :param request: словарь запроса
+        :return: словарь ответа
+        """
+        with self._lock:
+            self.calls += 1
+        method = request.get('method')
+        params = request.get('params') or []
+        response = {'jsonrpc': '2.0', 'id': request.get('id')}
+        try:
+            response['result'] = self.result(method, params)
+        except KeyError:
+            response['error'] = {'code': -32601, 'message': f'method {method} not found'}
+        return response
+
+    def result(self, method: str, params: list):
+        match method:
+            case 'eth_chainId' | 'net_version':
+                return hex(CHAIN_ID)
+            case 'eth_blockNumber':
+                return hex(BLOCK_NUMBER)
+            case 'eth_getBalance':
+                return hex(BALANCE)
+            case 'eth_gasPrice':
+                return hex(BASE_FEE + PRIORITY_FEE)
+            case 'eth_maxPriorityFeePerGas':
+                return hex(PRIORITY_FEE)
+            case 'eth_getTransactionCount':
+                return hex(0)
+            case 'eth_estimateGas':
+                return hex(21000)
+            case 'eth_feeHistory':
+                blocks = int(params[0], 16) if isinstance(params[0], str) else params[0]
+                return {
+                    'oldestBlock': hex(BLOCK_NUMBER - blocks),
+                    'baseFeePerGas': [hex(BASE_FEE)] * (blocks + 1),
+                    'gasUsedRatio': [0.5] * blocks,
+                    'reward': [[hex(PRIORITY_FEE)] for _ in range(blocks)],
+                }
+            case 'eth_getBlockByNumber':
+                return {
+                    'number': hex(BLOCK_NUMBER),
+                    'hash': '0x' + _word(BLOCK_NUMBER),
+                    'baseFeePerGas': hex(BASE_FEE),
+                    'gasLimit': hex(30_000_000),
+                    'timestamp': hex(int(time.time())),
+                    'transactions': [],
+                }
+            case 'eth_call':
+                data = params[0].get('data') or params[0].get('input') or '0x'
+                return CALL_RESULTS.get(data[:10], '0x' + _word(0))
+            case 'eth_sendRawTransaction':
+                return '0x' + keccak(hexstr=params[0]).hex()
+            case 'eth_getTransactionReceipt':
+                return {
+                    'transactionHash': params[0],
+                    'blockNumber': hex(BLOCK_NUMBER),
+                    'blockHash': '0x' + _word(BLOCK_NUMBER),
+                    'transactionIndex': '0x0',
+                    'from': '0x' + '00' * 20,
+                    'to': '0x' + '00' * 20,
+                    'status': '0x1',
+                    'gasUsed': hex(21000),
+                    'cumulativeGasUsed': hex(21000),
+                    'effectiveGasPrice': hex(BASE_FEE + PRIORITY_FEE),
+                    'logs': [],
+                    'logsBloom': '0x' + '00' * 256,
+                    'type': '0x2',
+                    'contractAddress': None,
+                }
+        raise KeyError(method)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Локальная заглушка JSON-RPC ноды')
+    parser.add_argument('--port', type=int, default=8546)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+    with RpcStub(port=args.port, latency=args.latency) as rpc_stub:
+        print(f'RPC заглушка запущена: {rpc_stub.url}')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,71 @@
+"""
+Скорость подписи транзакций: в текущем процессе против пула процессов BulkSigner с разным количеством процессов.
+Сетевых запросов нет, подписываются EIP-1559 переводы erc20 со случайным ключом.
+
+Запуск из корня проекта: python -m snippets.benchmarks.signing_benchmark --txs 2000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from eth_account import Account as EthAccount
+
+from core.signer import BulkSigner
+
+# transfer(address,uint256) на случайный адрес и 1 токен
+TRANSFER_DATA = '0xa9059cbb' + '11' * 12 + '22' * 20 + hex(10 ** 18)[2:].rjust(64, '0')
+
+
+def make_txs(number: int) -> list[dict]:
+    return [{
+        'chainId': 42161,
+        'nonce': nonce,
+        'to': '0x' + '33' * 20,
+        'value': 0,
+        'data': TRANSFER_DATA,
+        'gas': 60_000,
+        'type': 2,
+        'maxFeePerGas': 20 * 10 ** 9,
+        'maxPriorityFeePerGas': 10 ** 9,
+    } for nonce in range(number)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк подписи транзакций')
+    parser.add_argument('--txs', type=int, default=2000)
+    parser.add_argument('--processes', type=int, nargs='*', default=None, help='варианты количества процессов')
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    variants = args.processes or sorted({1, 2, cores // 2 or 1, cores})
+    private_key = EthAccount.create().key.hex()
+    txs = make_txs(args.txs)
+
+    account = EthAccount.from_key(private_key)
+    started = time.perf_counter()
+    for tx in txs:
+        account.sign_transaction(tx)
+    inline = args.txs / (time.perf_counter() - started)
+    print(f'ядер: {cores}, транзакций: {args.txs}')
+    print(f'в текущем процессе: {inline:8.0f} подписей/с')
+
+    for processes in variants:
+        started = time.perf_counter()
+        with BulkSigner(private_key, processes) as signer:
+            # первый вызов запускает процессы и импортирует eth_account, замеряется отдельно
+            list(signer.sign(txs[:processes]))
+            startup = time.perf_counter() - started
+            started = time.perf_counter()
+            signed = list(signer.sign(txs))
+            rate = len(signed) / (time.perf_counter() - started)
+        # пакет окупает запуск пула, если подпись в пуле быстрее на время запуска
+        break_even = f'окупается с {startup / (1 / inline - 1 / rate):.0f} транзакций' if rate > inline \
+            else 'не окупается'
+        print(f'процессов {processes:3}: {rate:8.0f} подписей/с, {rate / processes:6.0f} на ядро, '
+              f'ускорение {rate / inline:4.1f}x, запуск пула {startup:5.2f} с, {break_even}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """
+    Реентерабельная блокировка между потоками и процессами на основе lock-файла.
+    Внутри процесса работает как threading.RLock, между процессами блокирует lock-файл
+    (fcntl.flock на Linux/macOS, msvcrt.locking на Windows).
+
+    with FileLock('config/data/.accounts.xlsx.lock'):
+        ...
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: int | None = None
+
+    def acquire(self) -> None:
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+                self._lock_fd(self._fd)
+            except BaseException:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            self._unlock_fd(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self) -> FileLock:
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
+
+    @staticmethod
+    def _lock_fd(fd: int) -> None:
+        if os.name == 'nt':
+            os.lseek(fd, 0, os.SEEK_SET)
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    return
+                except OSError:
+                    time.sleep(0.05)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    @staticmethod
+    def _unlock_fd(fd: int) -> None:
+        if os.name == 'nt':
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            return
+        fcntl.flock(fd, fcntl.LOCK_UN)
@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import functools
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from loguru import logger
+
+from config.settings import config
+
+# логарифмические корзины как в HDR histogram: SUB_BUCKETS корзин на каждую степень двойки,
+# относительная погрешность значения ~1/(2 * SUB_BUCKETS), от ~1 мкс до ~2.5 часов
+SUB_BUCKETS = 16
+MIN_EXPONENT = -20
+MAX_EXPONENT = 14
+BUCKETS_COUNT = (MAX_EXPONENT - MIN_EXPONENT) * SUB_BUCKETS
+
+# границы le для выгрузки в prometheus, в секундах
+EXPORT_BOUNDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _bucket_index(value: float) -> int:
+    """
+    Номер корзины для значения: показатель степени двойки и доля мантиссы, без логарифмов.
+    """
+    if value <= 0:
+        return 0
+    mantissa, exponent = math.frexp(value)  # value = mantissa * 2 ** exponent, mantissa в [0.5, 1)
+    index = (exponent - MIN_EXPONENT) * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+    return min(max(index, 0), BUCKETS_COUNT - 1)
+
+
+def _bucket_upper(index: int) -> float:
+    """
+    Верхняя граница корзины.
+    """
+    exponent, sub_bucket = divmod(index, SUB_BUCKETS)
+    return (0.5 + (sub_bucket + 1) / (2 * SUB_BUCKETS)) * 2.0 ** (exponent + MIN_EXPONENT)
+
+
+class Histogram:
+    """
+    Гистограмма задержек с логарифмическими корзинами. Запись - O(1), без выделения памяти.
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * BUCKETS_COUNT
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, value: float) -> None:
+        """
+        Записывает значение.
+        :param value: значение в секундах
+        :return: None
+        """
+        index = _bucket_index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Значение квантиля с точностью до корзины.
+        :param q: квантиль от 0 до 1
+        :return: значение в секундах
+        """
+        with self._lock:
+            counts, total, maximum = list(self.counts), self.count, self.max
+        if not total:
+            return 0.0
+        rank = max(1, math.ceil(q * total))
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return min(_bucket_upper(index), maximum)
+        return maximum
+
+    def cumulative(self, bounds: tuple[float, ...]) -> list[int]:
+        """
+        Накопленное количество значений не больше каждой границы (по верхней границе корзины).
+        :param bounds: возрастающие границы
+        :return: список количеств
+        """
+        with self._lock:
+            counts = list(self.counts)
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            while index < BUCKETS_COUNT and _bucket_upper(index) <= bound:
+                seen += counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+
+class Counter:
+    def __init__(self) -> None:
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, number: int | float = 1) -> None:
+        with self._lock:
+            self.value += number
+
+
+class Timer:
+    """
+    Замер времени блока или функции, используется через Metrics.timed.
+    """
+
+    def __init__(self, metrics: Metrics, name: str, labels: dict[str, str]) -> None:
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+        self._started = 0.0
+
+    def __enter__(self) -> Timer:
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self._metrics.observe(self._name, time.perf_counter() - self._started, **self._labels)
+        if exc_type is not None:
+            self._metrics.inc(self._name.removesuffix('_seconds') + '_errors_total', **self._labels)
+        return False
+
+    def __call__(self, func: Callable) -> Callable:
+        # при использовании как декоратор метка method по умолчанию - имя функции
+        labels = {'method': func.__name__, **self._labels}
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Timer(self._metrics, self._name, labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+class Metrics:
+    """
+    Реестр метрик процесса: гистограммы задержек и счетчики с метками.
+    Выгружаются в текстовом формате prometheus в файл config.metrics_file и/или по http на порту config.metrics_port.
+    """
+
+    def __init__(self) -> None:
+        self._histograms: dict[tuple[str, tuple], Histogram] = {}
+        self._counters: dict[tuple[str, tuple], Counter] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._path: Optional[str] = None
+
+    def histogram(self, name: str, **labels: str) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def counter(self, name: str, **labels: str) -> Counter:
+        key = (name, tuple(sorted(labels.items())))
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, Counter())
+        return counter
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Записывает значение в гистограмму.
+        :param name: имя метрики, например onchain_seconds
+        :param value: значение в секундах
+        :param labels: метки
+        :return: None
+        """
+        self.histogram(name, **labels).record(value)
+
+    def inc(self, name: str, number: int | float = 1, **labels: str) -> None:
+        """
+        Увеличивает счетчик.
+        :param name: имя метрики, например onchain_errors_total
+        :param number: на сколько увеличить
+        :param labels: метки
+        :return: None
+        """
+        self.counter(name, **labels).inc(number)
+
+    def timed(self, name: str, **labels: str) -> Timer:
+        """
+        Замеряет время выполнения, как контекстный менеджер или декоратор. Исключения считаются
+        в счетчике <name без _seconds>_errors_total.
+
+            with metrics.timed('bot_init_seconds', component='ads'): ...
+
+            @metrics.timed('onchain_seconds')  # метка method = имя функции
+            def get_balance(...): ...
+
+        :param name: имя гистограммы
+        :param labels: метки
+        :return: Timer
+        """
+        return Timer(self, name, labels)
+
+    def render(self) -> str:
+        """
+        Текст метрик в формате prometheus. Квантили пишутся комментариями для чтения файла глазами.
+        :return: текст
+        """
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines = []
+        last_name = None
+        for (name, labels), histogram in histograms:
+            if name != last_name:
+                lines.append(f'# TYPE {name} histogram')
+                last_name = name
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+            prefix = label_text + ',' if label_text else ''
+            quantiles = ' '.join(f'p{int(q * 100)}={histogram.quantile(q):.4f}' for q in QUANTILES)
+            lines.append(f'# {name}{{{label_text}}} {quantiles} max={histogram.max:.4f}')
+            for bound, count in zip(EXPORT_BOUNDS, histogram.cumulative(EXPORT_BOUNDS)):
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{label_text}}} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+
+        last_name = None
+        for (name, labels), counter in counters:
+            if name != last_name:
+                lines.append(f'# TYPE {name} counter')
+                last_name = name
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+            lines.append(f'{name}{{{label_text}}} {counter.value}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        """
+        Атомарно записывает метрики в файл, чтобы node_exporter textfile collector не прочитал половину файла.
+        :param path: путь к файлу
+        :return: None
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        """
+        Запускает http сервер метрик на localhost в фоновом потоке.
+        :param port: порт
+        :return: сервер
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        return server
+
+    def start(self, instance: Optional[int] = None) -> None:
+        """
+        Включает выгрузку метрик по настройкам config.metrics_file и config.metrics_port.
+        :param instance: номер процесса-шарда, к файлу добавляется суффикс, к порту - instance + 1
+        :return: None
+        """
+        if self._started:
+            return
+        self._started = True
+
+        if config.metrics_port:
+            port = config.metrics_port + (instance + 1 if instance is not None else 0)
+            self.serve(port)
+            logger.info(f'Метрики доступны на http://127.0.0.1:{port}/metrics')
+
+        if config.metrics_file:
+            self._path = config.metrics_file
+            if instance is not None:
+                root, ext = os.path.splitext(self._path)
+                self._path = f'{root}_{instance}{ext}'
+
+            def writer() -> None:
+                while True:
+                    time.sleep(config.metrics_interval)
+                    self.flush()
+
+            threading.Thread(target=writer, name='metrics-file', daemon=True).start()
+            logger.info(f'Метрики записываются в {self._path} каждые {config.metrics_interval} секунд')
+
+    def flush(self) -> None:
+        """
+        Записывает метрики в файл, если выгрузка в файл включена.
+        :return: None
+        """
+        if not self._path:
+            return
+        try:
+            self.write(self._path)
+        except Exception as e:
+            logger.error(f'Не удалось записать метрики в {self._path}: {e}')
+
+
+# общий реестр метрик процесса
+metrics = Metrics()
+
+
+if __name__ == '__main__':
+    pass
@@ -6,7 +6,6 @@ import random
 import secrets
 import string
 import time
-from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Any
 
 import requests
@@ -18,6 +17,7 @@ from loguru import logger
 
 from config.settings import config
 from core.excel import Excel
+from core.watchdog import watchdog
 from models.account import Account
 
 
@@ -154,7 +154,7 @@ def random_sleep(min_delay: float = 0.5, max_delay: float = 1.5) -> None:
         max_delay = min_delay * 1.1
 
     delay = random.uniform(min_delay, max_delay)  # Генерируем случайное число
-    time.sleep(delay)  # Делаем перерыв
+    watchdog.sleep(delay)  # Делаем перерыв, шагами, чтобы ограничение времени этапа могло его прервать
 
 
 def generate_password(length_min: int = 25, length_max: int = 35) -> str:
@@ -314,16 +314,28 @@ def to_checksum(address: Optional[str | ChecksumAddress]) -> ChecksumAddress:
         address = Web3.to_checksum_address(address)
     return address
 
+# кеш цен токенов {тикер: (время запроса, цена)}, цены живут PRICE_TTL секунд
+_prices: dict[str, tuple[float, float]] = {}
+PRICE_TTL = 60
+
+
 def get_price_token(symbol: str, proxy: str | None = None) -> float:
     """
     Получает цену токена c binance по запросу к API https://api.binance.com/api/v3/ticker/price?symbol={symbol}USDT.
+    Цена кешируется на PRICE_TTL секунд, чтобы аккаунты одного цикла не запрашивали одну и ту же цену.
     :param symbol: тикер токена (например, ETH)
     :return: цена токена в USDT
     """
+    symbol = symbol.upper()
+    cached = _prices.get(symbol)
+    if cached and time.monotonic() - cached[0] < PRICE_TTL:
+        return cached[1]
     # todo: добавить поддержку прокси
-    url = f"https://api.binance.com/api/v3/ticker/price?symbol={symbol.upper()}USDT"
+    url = f"https://api.binance.com/api/v3/ticker/price?symbol={symbol}USDT"
     response = get_response(url, proxies=proxy)
-    return float(response["price"])
+    price = float(response["price"])
+    _prices[symbol] = (time.monotonic(), price)
+    return price
 
 
 def get_multiplayer(min_mult: float = 1.02, max_mult: float = 1.05) -> float:
@@ -335,12 +347,16 @@ def get_multiplayer(min_mult: float = 1.02, max_mult: float = 1.05) -> float:
 
 
 def timeout(timeout):
+    """
+    Декоратор, ограничивает время выполнения функции через общий watchdog, без отдельного потока на каждый вызов.
+    При превышении в потоке функции выбрасывается DeadlineExceeded (наследник TimeoutError).
+    :param timeout: ограничение в секундах
+    """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(func, *args, **kwargs)
-                return future.result(timeout=timeout)
+            with watchdog.deadline(func.__name__, timeout):
+                return func(*args, **kwargs)
 
         return wrapper
 
@@ -380,10 +396,18 @@ def prepare_proxy_requests(proxy: str | None) -> dict:
         'https': proxy
     }
 
+@functools.lru_cache(maxsize=1)
+def _get_user_agents() -> tuple[str, ...]:
+    """
+    Читает список user-agent из файла user_agents.txt один раз за процесс.
+    :return: кортеж user-agent
+    """
+    return tuple(get_list_from_file("user_agents.txt"))
+
+
 def get_user_agent() -> str:
     """
     Получает случайный user-agent из файла user_agents.txt
     :return: user-agent
     """
-    user_agents = get_list_from_file("user_agents.txt")
-    return random.choice(user_agents)
\ No newline at end of file
+    return random.choice(_get_user_agents())
\ No newline at end of file